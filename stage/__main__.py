@@ -1,19 +1,22 @@
 """
 Entry point for the stage application that allows a user to set the stage
 position index from the command line.
+
+Usage:
+    python -m stage [--backend NAME] [--metrics-port PORT] [--journal PATH]
+                                     interactively set the stage position
+    python -m stage bench [options]  benchmark the stage hot paths
+    python -m stage [--backend NAME] calibrate --output PATH [options]
+                                     calibrate the motor's fastest step rates
+
+Nothing is imported from a gpio backend until a command needs it.
 """
+import argparse
 import logging
 import sys
 
-from stage.stage import Stage
+from stage.factory import BACKENDS, DEFAULT_BACKEND
 from stage.factory.config import Configurator
-from stage.factory.rpi import RPiMonopolarStepperStageFactory
-
-
-logging.basicConfig(
-    format='%(asctime)s[%(name)s]:%(levelname)s:%(message)s',
-    stream=sys.stdout,
-    level=logging.INFO)
 
 LOGGER = logging.getLogger("linearstage")
 CONFIG = Configurator(
@@ -27,13 +30,142 @@ CONFIG = Configurator(
     end_stop_active_low=True,
     maximum_position=4400,
     minimum_position=0)
-STAGE = Stage(RPiMonopolarStepperStageFactory(CONFIG))
 
-while True:
+
+def run_interactive(args):
+    """Prompt for positions and move the stage to them until interrupted"""
+    # pylint: disable=import-outside-toplevel
+    from stage.factory import create_factory
+    from stage.journal import PositionJournal
+    from stage.stage import Stage
+    journal = None
+    if args.journal:
+        journal = PositionJournal(args.journal)
+    metrics = server = None
+    if args.metrics_port is not None:
+        from stage.metrics import MetricsServer, StageMetrics
+        metrics = StageMetrics()
+        server = MetricsServer(metrics.registry, port=args.metrics_port)
+        server.start()
+    stage = Stage(
+        create_factory(args.factory, CONFIG), journal=journal, metrics=metrics)
+    while True:
+        try:
+            stage.position = int(input("Set position to? "))
+        except ValueError:
+            LOGGER.exception(
+                "Could not parse input. Please supply an integer position")
+        except (KeyboardInterrupt, EOFError):
+            break
+    stage.close()
+    if server is not None:
+        server.close()
+    return 0
+
+
+def run_bench(args):
+    """Run the benchmark suite, optionally saving or comparing a baseline"""
+    # pylint: disable=import-outside-toplevel
+    from stage import bench
+    logging.getLogger().setLevel(logging.WARNING)
+    results = bench.run(args.coil_backend, CONFIG.motor_pins)
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            print("%-20s %-20s %14.6g" % (name, metric, value))
+    if args.save:
+        bench.save(results, args.save)
+        print("Saved baseline to %s" % args.save)
+    if args.baseline:
+        regressions = bench.compare(
+            results, bench.load(args.baseline), args.tolerance)
+        for name, metric, previous, value in regressions:
+            print("REGRESSION %s.%s: %.6g -> %.6g"
+                  % (name, metric, previous, value))
+        if regressions:
+            return 1
+    return 0
+
+
+def run_calibrate(args):
+    """Calibrate the motor step rates and save them as motion profiles"""
+    # pylint: disable=import-outside-toplevel
+    from stage import calibration
+    from stage.factory import create_factory
+    from stage.motor.profile import save_calibration
+    from stage.stage import Stage
+    stage = Stage(create_factory(args.factory, CONFIG))
     try:
-        STAGE.position = int(input("Set position to? "))
-    except ValueError:
-        LOGGER.exception(
-            "Could not parse input. Please supply an integer position")
-    except KeyboardInterrupt:
-        break
+        results = calibration.calibrate(
+            stage,
+            args.scheme,
+            distance=args.distance,
+            acceleration=args.acceleration,
+            margin=args.margin)
+    finally:
+        stage.close()
+    for result in results.values():
+        print("%-12s start %8.1f  cruise %8.1f phases/s" % (
+            result.drive_scheme, result.start_rate, result.cruise_rate))
+    save_calibration(args.output, calibration.to_profiles(results))
+    print("Saved calibration to %s" % args.output)
+    return 0
+
+
+def main(argv=None):
+    """Parse the command line and run the requested command"""
+    logging.basicConfig(
+        format='%(asctime)s[%(name)s]:%(levelname)s:%(message)s',
+        stream=sys.stdout,
+        level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m stage")
+    parser.set_defaults(command=run_interactive)
+    parser.add_argument(
+        "--backend", dest="factory", choices=sorted(BACKENDS),
+        default=CONFIG.backend or DEFAULT_BACKEND,
+        help="gpio backend of the stage")
+    parser.add_argument(
+        "--metrics-port", type=int, metavar="PORT",
+        help="serve Prometheus metrics on this local port while running")
+    parser.add_argument(
+        "--journal", metavar="PATH", default=CONFIG.journal_file,
+        help="journal the position to PATH so that homing can be skipped "
+        "after a clean shutdown")
+    commands = parser.add_subparsers()
+    bench_parser = commands.add_parser(
+        "bench", help="benchmark the stage hot paths")
+    bench_parser.set_defaults(command=run_bench)
+    bench_parser.add_argument(
+        "--coil-backend", choices=("mock", "rpi", "gpiomem"), default="mock",
+        help="gpio backend used to drive the coils in the coil benchmarks")
+    bench_parser.add_argument(
+        "--save", metavar="PATH", help="save the results as a JSON baseline")
+    bench_parser.add_argument(
+        "--baseline", metavar="PATH",
+        help="compare against a JSON baseline and fail on regressions")
+    bench_parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="fractional change allowed before flagging a regression")
+    calibrate_parser = commands.add_parser(
+        "calibrate", help="calibrate the motor's fastest step rates")
+    calibrate_parser.set_defaults(command=run_calibrate)
+    calibrate_parser.add_argument(
+        "--output", metavar="PATH", required=True,
+        help="save the calibrated profiles as JSON for calibration_file")
+    calibrate_parser.add_argument(
+        "--scheme", action="append",
+        help="drive scheme to calibrate. May be repeated. Defaults to all.")
+    calibrate_parser.add_argument(
+        "--distance", type=int, default=200,
+        help="positions to move out on each check")
+    calibrate_parser.add_argument(
+        "--acceleration", type=float, default=2000.0,
+        help="ramp acceleration in phases per second squared")
+    calibrate_parser.add_argument(
+        "--margin", type=float, default=0.8,
+        help="fraction of the measured limits to save")
+    args = parser.parse_args(argv)
+    return args.command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+asyncio facade over the stage. Moves still run on the stage's motion thread
+but are awaited without tying up an executor thread per move, and end stop and
+position notifications are delivered into the event loop.
+"""
+import asyncio
+import logging
+from functools import partial
+
+from stage.factory.base import StageFactoryBase
+from stage.stage import Stage
+
+_LOGGER = logging.getLogger("ASYNC STAGE")
+
+
+class AsyncStage:
+    """
+    Wraps a Stage for use from an asyncio event loop. Must be constructed from
+    within the event loop that will use it.
+
+    Args:
+        stage (Stage): the stage to control
+
+    Usage:
+        async with await AsyncStage.create(factory) as stage:
+            await stage.move_to(10)
+    """
+    def __init__(self, stage: Stage):
+        self._stage = stage
+        self._loop = asyncio.get_running_loop()
+        self._end_stop_callbacks = []
+        self._end_stop_triggered = asyncio.Event()
+        if stage.end_stop.triggered:
+            self._end_stop_triggered.set()
+        stage.end_stop.register_callback(self._handle_end_stop_triggered)
+        _LOGGER.info("Wrapped stage %r", stage)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc_info):
+        await self.close()
+
+    @classmethod
+    async def create(cls, factory: StageFactoryBase, **kwargs):
+        """
+        Construct and home a stage without blocking the event loop
+
+        Args:
+            factory (StageFactoryBase): a factory that creates stage components
+            kwargs: passed to Stage eg. defer_homing=True to return as soon as
+                homing has started. See wait_ready.
+
+        Returns:
+            (AsyncStage): the stage
+        """
+        stage = await asyncio.get_running_loop().run_in_executor(
+            None, partial(Stage, factory, **kwargs))
+        return cls(stage)
+
+    @property
+    def stage(self):
+        """
+        The wrapped stage
+        """
+        return self._stage
+
+    @property
+    def position(self):
+        """
+        The current stage position index
+        """
+        return self._stage.position
+
+    @property
+    def end_stop_triggered(self) -> asyncio.Event:
+        """
+        Set in the event loop when the end stop triggers and cleared as each
+        move or homing starts.
+        """
+        return self._end_stop_triggered
+
+    async def move_to(self, request: int, profile=None):
+        """
+        Move the stage to the requested position index. Cancelling the
+        awaiting task cancels the move.
+
+        Args:
+            request (int): requested position index
+            profile (MotionProfile): motion profile for this move
+
+        Returns:
+            (int): the position reached
+        """
+        self._end_stop_triggered.clear()
+        return await self._await_move(self._stage.move_to(request, profile))
+
+    async def wait_ready(self):
+        """
+        Wait until the stage homed at construction has its position.
+        Cancelling the awaiting task does not cancel homing.
+
+        Returns:
+            (int): the position
+        """
+        return await self._await_move(self._stage.ready, cancel=False)
+
+    async def home(self):
+        """
+        Send the stage to its home position
+
+        Returns:
+            (int): the home position index
+        """
+        self._end_stop_triggered.clear()
+        return await self._await_move(self._stage.move_home())
+
+    async def positions(self):
+        """
+        Asynchronously iterate over position updates as the stage moves. The
+        current position is yielded first.
+
+        Yields:
+            (int): the position index
+        """
+        queue = asyncio.Queue()
+
+        def enqueue(position):
+            self._loop.call_soon_threadsafe(queue.put_nowait, position)
+
+        self._stage.add_position_listener(enqueue)
+        try:
+            yield self._stage.position
+            while True:
+                yield await queue.get()
+        finally:
+            self._stage.remove_position_listener(enqueue)
+
+    async def close(self):
+        """
+        Stop delivering end stop notifications and close the wrapped stage
+        once any outstanding moves have finished, without blocking the event
+        loop
+        """
+        self._stage.end_stop.deregister_callback(
+            self._handle_end_stop_triggered)
+        await self._loop.run_in_executor(None, self._stage.close)
+
+    def add_end_stop_callback(self, callback):
+        """
+        Register a callback to be called in the event loop when the end stop
+        triggers
+
+        Args:
+            callback (callable): called with no arguments
+        """
+        self._end_stop_callbacks.append(callback)
+
+    def remove_end_stop_callback(self, callback):
+        """
+        Deregister a callback registered with add_end_stop_callback
+
+        Args:
+            callback (callable): the callback to be removed
+        """
+        self._end_stop_callbacks.remove(callback)
+
+    async def _await_move(self, move, cancel=True):
+        future = self._loop.create_future()
+
+        def settle(done):
+            if future.done():
+                return
+            error = done.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result())
+
+        move.add_done_callback(
+            lambda done: self._loop.call_soon_threadsafe(settle, done))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if cancel:
+                move.cancel()
+            raise
+
+    def _handle_end_stop_triggered(self, *_args, **_kwargs):
+        self._loop.call_soon_threadsafe(self._dispatch_end_stop)
+
+    def _dispatch_end_stop(self):
+        self._end_stop_triggered.set()
+        for callback in self._end_stop_callbacks:
+            callback()
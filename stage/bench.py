@@ -0,0 +1,292 @@
+"""
+Benchmarks of the stage hot paths: coil writes, the stepper phase loop,
+homing, end stop callback dispatch, trace recording and metrics updates.
+Results can be saved as a JSON baseline and later runs compared against it to
+flag regressions.
+
+Metrics whose names end in "_per_s" are rates where higher is better, all
+other metrics are durations where lower is better.
+"""
+import json
+import logging
+import time
+
+from stage.endstop import EndStop
+from stage.factory.config import Configurator
+from stage.factory.mock import MockStageFactory
+from stage.gpio import mock as mockgpio
+from stage.metrics import StageMetrics
+from stage.motor import drive
+from stage.motor.coil import Coils
+from stage.motor.stepper import UnipolarStepperMotor
+from stage.stage import Stage
+from stage.trace import COIL_WRITE, TraceBuffer
+
+_LOGGER = logging.getLogger("BENCH")
+
+DEFAULT_TOLERANCE = 0.2
+
+
+def _best_of(repeats, func):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        func()
+        elapsed = time.perf_counter_ns() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_coil_writes(group, writes: int=20000, repeats: int=5):
+    """
+    Time writing drive states to the coils
+
+    Args:
+        group (OutputGroup): the outputs driving the coils
+        writes (int): the number of writes per repeat
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): per write latency in ns and writes per second
+    """
+    coils = Coils(group)
+    masks = [mask for mask, _
+             in drive.compile_scheme(drive.HalfStepDriveScheme).forward]
+    count = len(masks)
+
+    def write_all():
+        write = coils.write
+        for idx in range(writes):
+            write(masks[idx % count])
+
+    elapsed = _best_of(repeats, write_all)
+    return {
+        'write_latency_ns': elapsed / writes,
+        'writes_per_s': writes * 1e9 / elapsed,
+    }
+
+
+def bench_phase_loop(group, cycles: int=2000, repeats: int=5):
+    """
+    Time the stepper phase loop with no delay between phases
+
+    Args:
+        group (OutputGroup): the outputs driving the coils
+        cycles (int): the number of cycles per repeat
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): phases per second
+    """
+    motor = UnipolarStepperMotor(
+        Coils(group), drive_scheme=drive.HalfStepDriveScheme.name, ms_delay=0)
+    elapsed = _best_of(repeats, lambda: motor.forward(cycles))
+    return {
+        'phases_per_s': cycles * motor.phases_per_cycle * 1e9 / elapsed,
+    }
+
+
+def _mock_config():
+    return Configurator(
+        maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+        minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+        motor_pins=None,
+        end_stop_pin=None,
+        end_stop_active_low=True)
+
+
+def bench_homing(repeats: int=5):
+    """
+    Time homing the mock stage from its far end
+
+    Args:
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): homing time in seconds
+    """
+    stage = Stage(MockStageFactory(_mock_config()))
+    best = None
+    try:
+        for _ in range(repeats):
+            stage.end()
+            elapsed = _best_of(1, stage.home)
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        stage.close()
+    return {'homing_s': best / 1e9}
+
+
+def bench_end_stop_dispatch(
+        callbacks: int=4, triggers: int=10000, repeats: int=5):
+    """
+    Time dispatching an end stop trigger to its registered callbacks
+
+    Args:
+        callbacks (int): the number of callbacks registered
+        triggers (int): the number of triggers per repeat
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): dispatch latency in ns per trigger
+    """
+    channel = mockgpio.InputChannel(0, True)
+    end_stop = EndStop(channel)
+    for _ in range(callbacks):
+        end_stop.register_callback(lambda *args, **kwargs: None)
+
+    def trigger_all():
+        activate = channel.activate
+        for _ in range(triggers):
+            activate()
+
+    elapsed = _best_of(repeats, trigger_all)
+    return {'dispatch_latency_ns': elapsed / triggers}
+
+
+def bench_trace_record(records: int=20000, repeats: int=5):
+    """
+    Time recording events in a trace
+
+    Args:
+        records (int): the number of records per repeat
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): per record latency in ns
+    """
+    trace = TraceBuffer()
+
+    def record_all():
+        record = trace.record
+        for idx in range(records):
+            record(COIL_WRITE, idx)
+
+    elapsed = _best_of(repeats, record_all)
+    return {'record_latency_ns': elapsed / records}
+
+
+def bench_metrics_update(updates: int=20000, repeats: int=5):
+    """
+    Time counting a move in the stage metrics, as the motor does at the end of
+    every move
+
+    Args:
+        updates (int): the number of updates per repeat
+        repeats (int): the best of this many repeats is reported
+
+    Returns:
+        (dict): per update latency in ns
+    """
+    metrics = StageMetrics()
+
+    def update_all():
+        moved = metrics.motor_moved
+        for idx in range(updates):
+            moved(True, 8, idx)
+
+    elapsed = _best_of(repeats, update_all)
+    return {'update_latency_ns': elapsed / updates}
+
+
+def _mock_group():
+    return mockgpio.OutputGroup(
+        *(mockgpio.OutputChannel(pin) for pin in range(4)))
+
+
+def run(backend: str="mock", pins=None):
+    """
+    Run the benchmark suite
+
+    Args:
+        backend (str): "mock", "rpi" or "gpiomem" - the gpio backend to drive
+            the coils with. Homing and end stop dispatch always use the mock
+            backend.
+        pins (tuple): the coil pins to use with the hardware backends
+
+    Returns:
+        (dict): metrics keyed by benchmark name
+    """
+    if backend == "rpi":
+        # pylint: disable=import-outside-toplevel
+        from stage.gpio import rpi
+
+        def make_group():
+            return rpi.OutputGroup(*(rpi.OutputChannel(pin) for pin in pins))
+    elif backend == "gpiomem":
+        # pylint: disable=import-outside-toplevel
+        from stage.gpio import gpiomem
+
+        def make_group():
+            return gpiomem.OutputGroup(
+                *(gpiomem.OutputChannel(pin) for pin in pins))
+    else:
+        make_group = _mock_group
+    results = {
+        'coil_writes': bench_coil_writes(make_group()),
+        'phase_loop': bench_phase_loop(make_group()),
+        'homing': bench_homing(),
+        'end_stop_dispatch': bench_end_stop_dispatch(),
+        'trace': bench_trace_record(),
+        'metrics': bench_metrics_update(),
+    }
+    _LOGGER.info("Benchmark results (%s): %r", backend, results)
+    return results
+
+
+def save(results, path):
+    """
+    Save benchmark results as a JSON baseline
+
+    Args:
+        results (dict): results from run
+        path (str): the file to write
+    """
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+
+
+def load(path):
+    """
+    Load a JSON baseline
+
+    Args:
+        path (str): the file to read
+
+    Returns:
+        (dict): the saved results
+    """
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def compare(results, baseline, tolerance: float=DEFAULT_TOLERANCE):
+    """
+    Find metrics that have regressed against a baseline
+
+    Args:
+        results (dict): results from run
+        baseline (dict): previously saved results
+        tolerance (float): the fractional change allowed before a metric is
+            considered to have regressed
+
+    Returns:
+        (list): (benchmark, metric, baseline value, new value) for each
+            regression
+    """
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            try:
+                previous = baseline[name][metric]
+            except KeyError:
+                continue
+            if metric.endswith('_per_s'):
+                regressed = value < previous * (1 - tolerance)
+            else:
+                regressed = value > previous * (1 + tolerance)
+            if regressed:
+                regressions.append((name, metric, previous, value))
+    return regressions
@@ -0,0 +1,176 @@
+"""
+Calibration of the fastest reliable step rates of a stage's motor. The end
+stop is the reference: the carriage is moved out at the rate under test and
+returned at the motor's safe default rate. If no steps were lost the end stop
+stays released one position from home and triggers exactly at home.
+"""
+import logging
+from collections import namedtuple
+
+from stage.motor.profile import ConstantProfile, TrapezoidalProfile
+
+_LOGGER = logging.getLogger("CALIBRATION")
+
+CalibrationResult = namedtuple(
+    'CalibrationResult',
+    ['drive_scheme', 'start_rate', 'cruise_rate', 'acceleration'])
+CalibrationResult.__doc__ = """
+The calibrated step rates of one drive scheme, derated by the safety margin
+
+Attributes:
+    drive_scheme (str): the name of the drive scheme
+    start_rate (float): the fastest rate in phases per second that the motor
+        can start and stop at without a ramp
+    cruise_rate (float): the fastest rate in phases per second that the motor
+        can reach by ramping up from the start rate
+    acceleration (float): the acceleration of the ramp in phases per second
+        squared
+"""
+
+DEFAULT_DISTANCE = 200
+DEFAULT_ACCELERATION = 2000.0
+DEFAULT_MARGIN = 0.8
+DEFAULT_TOLERANCE = 0.05
+MIN_RATE = 50.0
+MAX_RATE = 2000.0
+
+
+def check_rate(stage, profile, distance: int=DEFAULT_DISTANCE) -> bool:
+    """
+    Check whether the stage can move out and back without losing steps. The
+    stage moves out with the profile under test and returns with its default
+    profile, then the end stop must be released one position from home and
+    triggered at home. The stage is left homed.
+
+    Args:
+        stage (Stage): a homed stage
+        profile (MotionProfile): the profile under test
+        distance (int): the number of positions to move out
+
+    Returns:
+        (bool): True if no steps were lost
+    """
+    stage.home()
+    stage.move_to(distance, profile=profile).result()
+    stage.move_to(1).result()
+    early = stage.end_stop.triggered
+    stage.move_to(0).result()
+    reached = stage.end_stop.triggered
+    passed = reached and not early
+    _LOGGER.info("%r: %s", profile, "passed" if passed else "failed")
+    if not passed:
+        stage.home()
+    return passed
+
+
+def search_rate(
+        passes,
+        low: float,
+        high: float,
+        tolerance: float=DEFAULT_TOLERANCE) -> float:
+    """
+    Binary search, on a logarithmic scale, for the fastest rate that passes
+
+    Args:
+        passes (callable): takes a rate and returns True if it is reliable
+        low (float): a rate assumed to be reliable
+        high (float): the fastest rate worth trying
+        tolerance (float): the search stops once the fastest passing and
+            slowest failing rates are within this fraction of each other
+
+    Returns:
+        (float): the fastest rate found to pass
+    """
+    if passes(high):
+        return high
+    while high > low * (1 + tolerance):
+        rate = (low * high) ** 0.5
+        if passes(rate):
+            low = rate
+        else:
+            high = rate
+    return low
+
+
+# pylint: disable=too-many-arguments
+def calibrate_scheme(
+        stage,
+        drive_scheme: str,
+        distance: int=DEFAULT_DISTANCE,
+        acceleration: float=DEFAULT_ACCELERATION,
+        margin: float=DEFAULT_MARGIN,
+        tolerance: float=DEFAULT_TOLERANCE) -> CalibrationResult:
+    """
+    Find the fastest reliable start and cruise rates for a drive scheme. The
+    start rate is searched with constant rate moves then the cruise rate with
+    trapezoidal moves ramping up from the derated start rate.
+
+    Args:
+        stage (Stage): the stage to calibrate
+        drive_scheme (str): the name of the drive scheme to calibrate
+        distance (int): the number of positions to move out on each check
+        acceleration (float): the ramp acceleration in phases per second
+            squared
+        margin (float): the fraction of the measured limits to use
+        tolerance (float): the precision of the search as a fraction
+
+    Returns:
+        (CalibrationResult): the derated rates
+    """
+    _LOGGER.info("Calibrating %s...", drive_scheme)
+    stage.motor.drive_scheme = drive_scheme
+    start_rate = margin * search_rate(
+        lambda rate: check_rate(stage, ConstantProfile(rate), distance),
+        MIN_RATE, MAX_RATE, tolerance)
+    cruise_rate = margin * search_rate(
+        lambda rate: check_rate(
+            stage,
+            TrapezoidalProfile(start_rate, rate, acceleration),
+            distance),
+        start_rate, MAX_RATE, tolerance)
+    result = CalibrationResult(
+        drive_scheme, start_rate, max(start_rate, cruise_rate), acceleration)
+    _LOGGER.info("Done: %r", result)
+    return result
+
+
+def calibrate(stage, drive_schemes=None, **kwargs) -> dict:
+    """
+    Calibrate each drive scheme in turn. The motor is left using its original
+    drive scheme.
+
+    Args:
+        stage (Stage): the stage to calibrate
+        drive_schemes (iterable): names of the drive schemes to calibrate.
+            Defaults to all of the motor's drive schemes.
+        kwargs: passed to calibrate_scheme
+
+    Returns:
+        (dict): maps drive scheme name to CalibrationResult
+    """
+    original = stage.motor.drive_scheme
+    if drive_schemes is None:
+        drive_schemes = sorted(stage.motor.AVAILABLE_DRIVE_SCHEMES)
+    try:
+        return {
+            scheme: calibrate_scheme(stage, scheme, **kwargs)
+            for scheme in drive_schemes}
+    finally:
+        stage.motor.drive_scheme = original
+
+
+def to_profiles(results: dict) -> dict:
+    """
+    Convert calibration results to the profiles saved by
+    stage.motor.profile.save_calibration
+
+    Args:
+        results (dict): maps drive scheme name to CalibrationResult
+
+    Returns:
+        (dict): maps drive scheme name to TrapezoidalProfile
+    """
+    return {
+        scheme: TrapezoidalProfile(
+            result.start_rate, result.cruise_rate, result.acceleration)
+        for scheme, result in results.items()}
@@ -4,6 +4,8 @@ End stop for informing the stage when it has reached the end of its travel
 from logging import getLogger
 
 from stage.gpio.interface import InputInterface
+from stage.metrics import StageMetrics
+from stage.trace import END_STOP_READ
 
 _LOGGER = getLogger("END STOP")
 
@@ -18,6 +20,9 @@ class EndStop:
             activated eg. active_low=True implies the signal is normally high
             (logic 0) and will go low when triggered (logic 1).
         digital_input (InputInterface): the input interface object
+
+    Attributes:
+        trace (TraceBuffer): records every read of the end stop when set
     """
     # pylint: disable=too-few-public-methods
     def __init__(
@@ -25,6 +30,8 @@ class EndStop:
             digital_io: InputInterface):
         self._input = digital_io
         self._callbacks = []
+        self.trace = None
+        self._metrics = None
         _LOGGER.info("Initialised end stop %r, with %r", self, self._input)
 
     @property
@@ -37,6 +44,21 @@ class EndStop:
         """
         return self._input
 
+    @property
+    def metrics(self) -> StageMetrics:
+        """
+        The metrics that triggers are counted in or None
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: StageMetrics):
+        if self._metrics is None and metrics is not None:
+            self._input.register_callback(self._count_trigger)
+        elif self._metrics is not None and metrics is None:
+            self._input.deregister_callback(self._count_trigger)
+        self._metrics = metrics
+
     @property
     def triggered(self):
         """
@@ -45,8 +67,10 @@ class EndStop:
         Returns:
             bool: True if the end stop is triggered at this instant
         """
-        _LOGGER.debug("End stop %r triggered: %r", self, self._input.state)
-        return self._input.state
+        triggered = self._input.state
+        if self.trace is not None:
+            self.trace.record(END_STOP_READ, triggered)
+        return triggered
 
     def register_callback(self, callback):
         """
@@ -66,6 +90,9 @@ class EndStop:
         """
         self._input.deregister_callback(callback)
 
+    def _count_trigger(self, *_args, **_kwargs):
+        self._metrics.end_stop_triggers.inc()
+
     def _handle_triggered_event(self):
         for callback in self._callbacks:
             callback()
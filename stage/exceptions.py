@@ -12,3 +12,15 @@ class OutOfRangeError(Exception):
     Raised when the linear stage is requested to move outside of its allowed
     range.
     """
+
+class HomingTimeoutError(Exception):
+    """
+    Raised when the stage fails to find its end stop within the homing
+    timeout, eg. because the stage is stuck or the end stop is broken.
+    """
+
+class NotHomedError(Exception):
+    """
+    Raised when the stage does not know its position, eg. because homing was
+    cancelled or timed out, so it cannot carry out a move until it is homed.
+    """
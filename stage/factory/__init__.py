@@ -0,0 +1,57 @@
+"""
+Stage factories, one per gpio backend. A backend's factory module, and with
+it the backend's driver, is only imported when the backend is asked for by
+name so importing the stage package touches no hardware.
+"""
+import importlib
+
+from stage.exceptions import BadConfigurationData
+
+BACKENDS = {
+    'chardev': 'stage.factory.chardev:ChardevStageFactory',
+    'gpiomem': 'stage.factory.gpiomem:GpiomemStageFactory',
+    'mock': 'stage.factory.mock:MockStageFactory',
+    'rpi': 'stage.factory.rpi:RPiMonopolarStepperStageFactory',
+    'simulator': 'stage.factory.simulator:SimulatedStageFactory',
+    'wave': 'stage.factory.wave:WaveStageFactory',
+}
+DEFAULT_BACKEND = 'rpi'
+
+
+def get_factory(backend: str):
+    """
+    Import the factory class of a backend
+
+    Args:
+        backend (str): the backend name, one of BACKENDS
+
+    Returns:
+        (type): the StageFactoryBase subclass
+
+    Raises:
+        BadConfigurationData: if the backend is not recognised
+    """
+    try:
+        module, name = BACKENDS[backend].split(':')
+    except KeyError as error:
+        raise BadConfigurationData(
+            "backend <%s> unrecognised. Please choose from %s"
+            % (backend, sorted(BACKENDS))) from error
+    return getattr(importlib.import_module(module), name)
+
+
+def create_factory(backend: str, config, **kwargs):
+    """
+    Create the factory of a backend
+
+    Args:
+        backend (str): the backend name, one of BACKENDS. None for the
+            config's backend or DEFAULT_BACKEND.
+        config (Configurator): passed to the factory
+        kwargs: passed to the factory
+
+    Returns:
+        (StageFactoryBase): the factory
+    """
+    backend = backend or config.backend or DEFAULT_BACKEND
+    return get_factory(backend)(config, **kwargs)
@@ -2,12 +2,19 @@
 #pyling: enable=missing-docstring
 import abc
 
+from stage.motor import drive
+from stage.motor.coil import Coils
+from stage.motor.profile import load_calibration
+from stage.motor.timing import HybridTimer
+
 
 class StageFactoryBase(abc.ABC):
     """
     The factory base class that provides necessary objects required to
     instantiate a Stage object.
     """
+    _clock = None
+
     @abc.abstractproperty
     def minimum_position(self):
         """The stage minimum position"""
@@ -30,3 +37,38 @@ class StageFactoryBase(abc.ABC):
         its travel
         """
         return
+
+    @property
+    def clock(self):
+        """
+        The clock that times motion. Factories may override this to inject a
+        VirtualClock for simulation - by default motion runs in real time on a
+        HybridTimer created on first use.
+        """
+        if self._clock is None:
+            self._clock = HybridTimer()
+        return self._clock
+
+    def _create_stepper_motor(self, group, motor_class):
+        """
+        Create a stepper motor that drives the coils on the given output
+        group, with the drive scheme and calibration named in the factory's
+        config, which is expected at self._config
+
+        Args:
+            group: the output group of the motor pins, in coil order
+            motor_class (type): UnipolarStepperMotor or a subclass
+
+        Returns:
+            the motor, timed by the factory's clock
+        """
+        # pylint: disable=no-member
+        drive_scheme = self._config.drive_scheme \
+            or drive.HalfStepDriveScheme.name
+        profile = None
+        if self._config.calibration_file:
+            profile = load_calibration(
+                self._config.calibration_file, drive_scheme)
+        return motor_class(
+            Coils(group), drive_scheme=drive_scheme, profile=profile,
+            timer=self.clock)
@@ -0,0 +1,71 @@
+#pylint: disable=missing-docstring
+#pylint: enable=missing-docstring
+from stage.endstop import EndStop
+from stage.factory.base import StageFactoryBase
+from stage.factory.config import Configurator
+from stage.gpio import chardev
+from stage.motor.stepper import UnipolarStepperMotor
+from stage.motor.timing import HybridTimer
+
+
+class ChardevStageFactory(StageFactoryBase):
+    """
+    A factory that creates the motor and end stop on a gpio character device
+
+    Args:
+        config (Configurator): config object that holds all specific parameters
+            needed to configure the stage factory. Pins are line offsets on
+            the chip.
+        chip (chardev.Chip): the chip. Defaults to the config's gpio_chip or
+            chardev.DEFAULT_CHIP.
+        clock (HybridTimer, SleepTimer or VirtualClock): times the motor
+            phases. Defaults to a HybridTimer.
+    """
+    def __init__(self, config: Configurator, chip=None, clock=None):
+        self._config = config
+        self._chip = chip or chardev.Chip(
+            config.gpio_chip or chardev.DEFAULT_CHIP)
+        self._clock = clock or HybridTimer()
+        self._motor = self._create_motor()
+        self._end_stop = self._create_end_stop()
+
+    @property
+    def maximum_position(self):
+        return self._config.maximum_position
+
+    @property
+    def minimum_position(self):
+        return self._config.minimum_position
+
+    @property
+    def motor(self):
+        return self._motor
+
+    @property
+    def end_stop(self):
+        return self._end_stop
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def gpio(self):
+        """
+        The gpio chip
+        """
+        return self._chip
+
+    def _create_end_stop(self):
+        return EndStop(
+            chardev.InputChannel(
+                self._config.end_stop_pin,
+                self._config.end_stop_active_low,
+                chip=self._chip))
+
+    def _create_motor(self):
+        return self._create_stepper_motor(
+            chardev.OutputGroup(
+                *(chardev.OutputChannel(pin, chip=self._chip)
+                  for pin in self._config.motor_pins)),
+            UnipolarStepperMotor)
@@ -19,6 +19,15 @@ class Configurator:
         end_stop_pin (int): the input channel that the end_stop is connected to
         end_stop_active_low (int): True if the end stop is activated when its
             signal goes low
+        drive_scheme (str): optional name of the motor drive scheme
+        calibration_file (str): optional path of a calibration saved by
+            stage.calibration from which to load the motor's motion profile
+        journal_file (str): optional path of a position journal that lets the
+            stage skip homing after a clean shutdown
+        gpio_chip (str): optional path of the gpio character device used by
+            the chardev backend
+        backend (str): optional name of the gpio backend, one of
+            stage.factory.BACKENDS
     """
     def __init__(self, **kwargs):
         try:
@@ -30,6 +39,11 @@ class Configurator:
         except KeyError as error:
             raise BadConfigurationData(
                 "Failed to gather configuration data %r" % repr(error))
+        self._drive_scheme = kwargs.get('drive_scheme')
+        self._calibration_file = kwargs.get('calibration_file')
+        self._journal_file = kwargs.get('journal_file')
+        self._gpio_chip = kwargs.get('gpio_chip')
+        self._backend = kwargs.get('backend')
 
     @property
     def maximum_position(self):
@@ -58,3 +72,28 @@ class Configurator:
     def end_stop_active_low(self):
         """Whether or not the end stop is activated on a low signal"""
         return self._end_stop_active_low
+
+    @property
+    def drive_scheme(self):
+        """The name of the motor drive scheme or None for the default"""
+        return self._drive_scheme
+
+    @property
+    def calibration_file(self):
+        """The path of the motor calibration or None if uncalibrated"""
+        return self._calibration_file
+
+    @property
+    def journal_file(self):
+        """The path of the position journal or None if not journaled"""
+        return self._journal_file
+
+    @property
+    def gpio_chip(self):
+        """The path of the gpio character device or None for the default"""
+        return self._gpio_chip
+
+    @property
+    def backend(self):
+        """The name of the gpio backend or None for the default"""
+        return self._backend
@@ -0,0 +1,81 @@
+#pylint: disable=missing-docstring
+#pylint: enable=missing-docstring
+from stage.endstop import EndStop
+from stage.factory.base import StageFactoryBase
+from stage.factory.config import Configurator
+from stage.gpio import chardev
+from stage.gpio import gpiomem
+from stage.motor.stepper import UnipolarStepperMotor
+from stage.motor.timing import HybridTimer
+
+
+class GpiomemStageFactory(StageFactoryBase):
+    """
+    A factory that creates a motor driven through the gpio registers mapped
+    from /dev/gpiomem. The end stop is read through the gpio character
+    device, which provides edge events.
+
+    Args:
+        config (Configurator): config object that holds all specific parameters
+            needed to configure the stage factory
+        registers (gpiomem.GpioRegisters): the register block. Defaults to a
+            mapping of gpiomem.DEFAULT_PATH.
+        chip (chardev.Chip): the chip for the end stop. Defaults to the
+            config's gpio_chip or chardev.DEFAULT_CHIP.
+        clock (HybridTimer, SleepTimer or VirtualClock): times the motor
+            phases. Defaults to a HybridTimer.
+    """
+    def __init__(
+            self,
+            config: Configurator,
+            registers=None,
+            chip=None,
+            clock=None):
+        self._config = config
+        self._registers = registers or gpiomem.GpioRegisters()
+        self._chip = chip or chardev.Chip(
+            config.gpio_chip or chardev.DEFAULT_CHIP)
+        self._clock = clock or HybridTimer()
+        self._motor = self._create_motor()
+        self._end_stop = self._create_end_stop()
+
+    @property
+    def maximum_position(self):
+        return self._config.maximum_position
+
+    @property
+    def minimum_position(self):
+        return self._config.minimum_position
+
+    @property
+    def motor(self):
+        return self._motor
+
+    @property
+    def end_stop(self):
+        return self._end_stop
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def gpio(self):
+        """
+        The gpio register block
+        """
+        return self._registers
+
+    def _create_end_stop(self):
+        return EndStop(
+            chardev.InputChannel(
+                self._config.end_stop_pin,
+                self._config.end_stop_active_low,
+                chip=self._chip))
+
+    def _create_motor(self):
+        return self._create_stepper_motor(
+            gpiomem.OutputGroup(
+                *(gpiomem.OutputChannel(pin, registers=self._registers)
+                  for pin in self._config.motor_pins)),
+            UnipolarStepperMotor)
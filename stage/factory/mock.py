@@ -1,14 +1,11 @@
 #pylint: disable=missing-docstring
 #pylint: enable=missing-docstring
-import logging
-
 from stage.endstop import EndStop
 from stage.factory.base import StageFactoryBase
 from stage.factory.config import Configurator
 from stage.gpio import mock as mockgpio
 from stage.motor.mock import MockMotor
-
-_LOGGER = logging.getLogger("MOCK")
+from stage.motor.timing import HybridTimer
 
 
 class FakeTrackHardware:
@@ -47,26 +44,38 @@ class FakeTrackHardware:
         else:
             self._end_stop.input.deactivate()
             self._position = request
-        _LOGGER.info("position is %d", request)
 
 
 class MockStageFactory(StageFactoryBase):
     """
     A factory that injects a mock end stop and mock motor into the stage for
-    tests
+    tests and simulation. Moves take no time by default; give the motor a
+    profile to time them and a VirtualClock to simulate that time instantly.
 
     Args:
         config (Configurator): config object that contains necessary parameters
+        clock (HybridTimer, SleepTimer or VirtualClock): times the motor
+            phases. Defaults to a HybridTimer.
+        profile (MotionProfile): the motor's default motion profile. Defaults
+            to no delay between phases.
+        phases_per_cycle (int): the number of phases the mock motor times per
+            position
     """
     MIN_STAGE_LIMIT = 0
     MAX_STAGE_LIMIT = 100
 
-    def __init__(self, config: Configurator):
+    def __init__(
+            self,
+            config: Configurator,
+            clock=None,
+            profile=None,
+            phases_per_cycle: int=1):
         super().__init__()
         self._config = config
+        self._clock = clock or HybridTimer()
         self._end_stop = self._create_end_stop()
         self._fake_track = FakeTrackHardware(self._end_stop)
-        self._motor = self._create_motor()
+        self._motor = self._create_motor(profile, phases_per_cycle)
 
     @property
     def maximum_position(self):
@@ -84,8 +93,16 @@ class MockStageFactory(StageFactoryBase):
     def motor(self):
         return self._motor
 
-    def _create_motor(self):
-        return MockMotor(self._fake_track)
+    @property
+    def clock(self):
+        return self._clock
+
+    def _create_motor(self, profile, phases_per_cycle):
+        return MockMotor(
+            self._fake_track,
+            clock=self._clock,
+            profile=profile,
+            phases_per_cycle=phases_per_cycle)
 
     def _create_end_stop(self):
         return EndStop(
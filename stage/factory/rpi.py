@@ -4,8 +4,8 @@ from stage.endstop import EndStop
 from stage.factory.base import StageFactoryBase
 from stage.factory.config import Configurator
 from stage.gpio import rpi
-from stage.motor.coil import Coils
 from stage.motor.stepper import UnipolarStepperMotor
+from stage.motor.timing import HybridTimer
 
 
 class RPiMonopolarStepperStageFactory(StageFactoryBase):
@@ -15,12 +15,16 @@ class RPiMonopolarStepperStageFactory(StageFactoryBase):
     Args:
         config (Configurator): config object that holds all specific parameters
             needed to configure the stage factory
+        clock (HybridTimer, SleepTimer or VirtualClock): times the motor
+            phases. Defaults to a HybridTimer.
     """
     _DIGITAL_INPUT = rpi.InputChannel
     _DIGITAL_OUTPUT = rpi.OutputChannel
+    _DIGITAL_OUTPUT_GROUP = rpi.OutputGroup
 
-    def __init__(self, config: Configurator):
+    def __init__(self, config: Configurator, clock=None):
         self._config = config
+        self._clock = clock or HybridTimer()
         self._motor = self._create_motor()
         self._end_stop = self._create_end_stop()
 
@@ -40,6 +44,10 @@ class RPiMonopolarStepperStageFactory(StageFactoryBase):
     def end_stop(self):
         return self._end_stop
 
+    @property
+    def clock(self):
+        return self._clock
+
     def _create_end_stop(self):
         return EndStop(
             type(self)._DIGITAL_INPUT(
@@ -47,7 +55,8 @@ class RPiMonopolarStepperStageFactory(StageFactoryBase):
                 self._config.end_stop_active_low))
 
     def _create_motor(self):
-        coils = Coils(
-            *(type(self)._DIGITAL_OUTPUT(pin)
-              for pin in self._config.motor_pins))
-        return UnipolarStepperMotor(coils)
+        return self._create_stepper_motor(
+            type(self)._DIGITAL_OUTPUT_GROUP(
+                *(type(self)._DIGITAL_OUTPUT(pin)
+                  for pin in self._config.motor_pins)),
+            UnipolarStepperMotor)
@@ -0,0 +1,199 @@
+#pylint: disable=missing-docstring
+#pylint: enable=missing-docstring
+import logging
+
+from stage.endstop import EndStop
+from stage.factory.base import StageFactoryBase
+from stage.factory.config import Configurator
+from stage.gpio import mock as mockgpio
+from stage.motor import drive
+from stage.motor.coil import Coils
+from stage.motor.physics import BYJ48, MotorParameters, RotorModel
+from stage.motor.stepper import UnipolarStepperMotor
+from stage.motor.timing import VirtualClock
+
+_LOGGER = logging.getLogger("SIMULATOR")
+
+_NS_PER_S = 1e9
+
+
+class SimulatedCoilGroup(mockgpio.OutputGroup):
+    """
+    Mock coil outputs that feed every change of excitation into a rotor model
+    at the time given by the clock, and trigger the end stop when the
+    simulated carriage reaches it.
+
+    Args:
+        outputs (OutputInterface): the coil outputs in the order a1, b1, a2, b2
+        model (RotorModel): the simulated motor
+        clock (VirtualClock or HybridTimer): provides the time of each write
+        end_stop_input (mockgpio.InputChannel): the simulated end stop switch
+        end_stop_position (float): the position at which the end stop triggers
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            *outputs,
+            model: RotorModel,
+            clock,
+            end_stop_input: mockgpio.InputChannel,
+            end_stop_position: float):
+        super().__init__(*outputs)
+        self._model = model
+        self._clock = clock
+        self._end_stop_input = end_stop_input
+        self._end_stop_position = end_stop_position
+        self.update_end_stop()
+
+    def write(self, mask: int):
+        super().write(mask)
+        self._model.write(mask, self._clock.now_ns() / _NS_PER_S)
+        self.update_end_stop()
+
+    def sync(self):
+        """
+        Bring the rotor model and end stop up to the time given by the clock
+        """
+        self._model.advance(self._clock.now_ns() / _NS_PER_S)
+        self.update_end_stop()
+
+    def update_end_stop(self):
+        """
+        Set the end stop input from the simulated carriage position
+        """
+        at_end_stop = self._model.position <= self._end_stop_position
+        if at_end_stop and not self._end_stop_input.state:
+            self._end_stop_input.activate()
+        elif not at_end_stop and self._end_stop_input.state:
+            self._end_stop_input.deactivate()
+
+
+class SimulatedTimer:
+    """
+    Waits on the simulation clock and then brings the simulation up to date so
+    that the end stop reflects where the carriage has got to by the time the
+    motor wakes, as a real switch would.
+
+    Args:
+        clock (VirtualClock or HybridTimer): the simulation clock
+        coils (SimulatedCoilGroup): the simulated coils to update
+    """
+    def __init__(self, clock, coils: SimulatedCoilGroup):
+        self._clock = clock
+        self._coils = coils
+
+    def now_ns(self) -> int:
+        return self._clock.now_ns()
+
+    def sleep_until(self, deadline_ns: int):
+        self._clock.sleep_until(deadline_ns)
+        self._coils.sync()
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._clock)
+
+
+class SimulatedStageFactory(StageFactoryBase):
+    """
+    A factory that drives a physical simulation of a 28BYJ-48 stepper motor
+    and its load with a real UnipolarStepperMotor. The simulation is driven by
+    the coil bitmasks the motor writes, so step rates, drive schemes and
+    motion profiles can be checked for lost steps offline. The end stop sits
+    at the minimum position and the carriage is stopped by the ends of the
+    track just beyond the minimum and maximum positions.
+
+    Args:
+        config (Configurator): the stage limits are taken from here
+        clock (VirtualClock or HybridTimer): defaults to a VirtualClock so
+            moves are simulated as fast as possible
+        params (MotorParameters): the physical parameters of the motor and
+            load
+        start_position (float): where the carriage starts. Defaults to the
+            middle of the track.
+        drive_scheme (str): the name of the motor drive scheme
+        ms_delay (float): the motor's delay between phases
+        profile (MotionProfile): the motor's default motion profile
+    """
+    TRACK_OVERRUN = 0.25
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            config: Configurator,
+            clock=None,
+            params: MotorParameters=BYJ48,
+            start_position: float=None,
+            drive_scheme: str=drive.HalfStepDriveScheme.name,
+            ms_delay: float=None,
+            profile=None):
+        self._config = config
+        self._clock = clock or VirtualClock()
+        if start_position is None:
+            start_position = (
+                config.minimum_position + config.maximum_position) / 2
+        self._model = RotorModel(
+            params,
+            position=start_position,
+            limits=(
+                config.minimum_position - self.TRACK_OVERRUN,
+                config.maximum_position + self.TRACK_OVERRUN))
+        end_stop_input = mockgpio.InputChannel(
+            config.end_stop_pin, config.end_stop_active_low)
+        self._end_stop = EndStop(end_stop_input)
+        self._coils = SimulatedCoilGroup(
+            *(mockgpio.OutputChannel(pin) for pin in range(4)),
+            model=self._model,
+            clock=self._clock,
+            end_stop_input=end_stop_input,
+            end_stop_position=config.minimum_position)
+        self._motor = UnipolarStepperMotor(
+            Coils(self._coils),
+            drive_scheme=drive_scheme,
+            ms_delay=ms_delay,
+            profile=profile,
+            timer=SimulatedTimer(self._clock, self._coils))
+        _LOGGER.info(
+            "Simulating %r starting at position %r", params, start_position)
+
+    @property
+    def maximum_position(self):
+        return self._config.maximum_position
+
+    @property
+    def minimum_position(self):
+        return self._config.minimum_position
+
+    @property
+    def motor(self):
+        return self._motor
+
+    @property
+    def end_stop(self):
+        return self._end_stop
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def model(self):
+        """
+        The simulated motor
+        """
+        return self._model
+
+    @property
+    def true_position(self) -> float:
+        """
+        The simulated carriage position now, in stage positions
+        """
+        self._coils.sync()
+        return self._model.position
+
+    @property
+    def commanded_position(self) -> float:
+        """
+        Where the coil sequence has commanded the carriage to be, in stage
+        positions. Differs from the true position once steps have been lost.
+        """
+        return self._model.commanded_position
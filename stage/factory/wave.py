@@ -0,0 +1,77 @@
+#pylint: disable=missing-docstring
+#pylint: enable=missing-docstring
+from stage.endstop import EndStop
+from stage.factory.base import StageFactoryBase
+from stage.factory.config import Configurator
+from stage.gpio import wave
+from stage.motor.timing import SleepTimer
+from stage.motor.wave import WaveStepperMotor
+
+
+class WaveStageFactory(StageFactoryBase):
+    """
+    A factory that creates a motor whose moves are transmitted as pigpio
+    waveform chains, and an end stop notified by the same daemon
+
+    Args:
+        config (Configurator): config object that holds all specific parameters
+            needed to configure the stage factory
+        host (str): the pigpio daemon host. Defaults to $PIGPIO_ADDR or
+            localhost.
+        port (int): the pigpio daemon port. Defaults to $PIGPIO_PORT or 8888.
+        clock (HybridTimer, SleepTimer or VirtualClock): follows the progress
+            of each move. Defaults to a SleepTimer since the daemon, not
+            Python, times the phases.
+    """
+    def __init__(
+            self,
+            config: Configurator,
+            host: str=None,
+            port: int=None,
+            clock=None):
+        self._config = config
+        self._clock = clock or SleepTimer()
+        self._pi = wave.PigpioConnection(host, port)
+        self._motor = self._create_motor()
+        self._end_stop = self._create_end_stop()
+
+    @property
+    def maximum_position(self):
+        return self._config.maximum_position
+
+    @property
+    def minimum_position(self):
+        return self._config.minimum_position
+
+    @property
+    def motor(self):
+        return self._motor
+
+    @property
+    def end_stop(self):
+        return self._end_stop
+
+    @property
+    def clock(self):
+        return self._clock
+
+    @property
+    def gpio(self):
+        """
+        The connection to the pigpio daemon
+        """
+        return self._pi
+
+    def _create_end_stop(self):
+        return EndStop(
+            wave.InputChannel(
+                self._config.end_stop_pin,
+                self._config.end_stop_active_low,
+                pi=self._pi))
+
+    def _create_motor(self):
+        return self._create_stepper_motor(
+            wave.OutputGroup(
+                *(wave.OutputChannel(pin, pi=self._pi)
+                  for pin in self._config.motor_pins)),
+            WaveStepperMotor)
@@ -0,0 +1,415 @@
+"""
+io interface concretions of the stage iointerface that use the Linux gpio
+character device, /dev/gpiochipN, through its v2 ioctl interface. The coil
+outputs of a group are requested together as one set of lines so that a
+write of all of them is a single ioctl, and edges on inputs are read from the
+line request's event fd with the kernel's timestamps.
+"""
+import fcntl
+import logging
+import os
+import select
+import struct
+import threading
+from collections import namedtuple
+
+from stage.gpio import interface as iointerface
+from stage.gpio import error
+
+_LOGGER = logging.getLogger("CHARDEV GPIO")
+
+DEFAULT_CHIP = '/dev/gpiochip0'
+CONSUMER = 'stage'
+
+# line flags of the v2 interface
+FLAG_ACTIVE_LOW = 1 << 1
+FLAG_INPUT = 1 << 2
+FLAG_OUTPUT = 1 << 3
+FLAG_EDGE_RISING = 1 << 4
+FLAG_EDGE_FALLING = 1 << 5
+FLAG_BIAS_PULL_UP = 1 << 8
+FLAG_BIAS_PULL_DOWN = 1 << 9
+
+EVENT_RISING_EDGE = 1
+EVENT_FALLING_EDGE = 2
+
+_LINES_MAX = 64
+_ATTRS_MAX = 10
+_ATTR_OUTPUT_VALUES = 2
+
+# struct gpio_v2_line_request
+_LINE_REQUEST = struct.Struct(
+    '<%dI32sQI20x%s' % (_LINES_MAX, 'I4xQQ' * _ATTRS_MAX) + 'II20xi')
+# struct gpio_v2_line_values
+_LINE_VALUES = struct.Struct('<QQ')
+# struct gpio_v2_line_event
+_LINE_EVENT = struct.Struct('<QIIII24x')
+_EVENT_BUFFER = 16
+
+
+def _iowr(number, size):
+    return 3 << 30 | size << 16 | 0xB4 << 8 | number
+
+
+_GET_LINE_IOCTL = _iowr(0x07, _LINE_REQUEST.size)
+_GET_VALUES_IOCTL = _iowr(0x0E, _LINE_VALUES.size)
+_SET_VALUES_IOCTL = _iowr(0x0F, _LINE_VALUES.size)
+
+LineEvent = namedtuple(
+    'LineEvent', ['timestamp_ns', 'kind', 'offset', 'seqno', 'line_seqno'])
+LineEvent.__doc__ = """
+An edge on a requested line
+
+Attributes:
+    timestamp_ns (int): the kernel's monotonic time of the edge
+    kind (int): EVENT_RISING_EDGE or EVENT_FALLING_EDGE, as seen through the
+        line's active low setting
+    offset (int): the line offset on the chip
+    seqno (int): the sequence number of the event within the request
+    line_seqno (int): the sequence number of the event on the line
+"""
+
+
+def pack_line_request(
+        offsets, flags: int, consumer: str=CONSUMER, values: int=None):
+    """
+    Pack a gpio_v2_line_request
+
+    Args:
+        offsets (tuple): the line offsets. Bit i of values and of later
+            get and set masks refers to offsets[i].
+        flags (int): the FLAG_* flags applied to every line
+        consumer (str): the label the kernel shows as the lines' user
+        values (int): the initial output values or None to leave them
+
+    Returns:
+        (bytearray): the request, which the ioctl fills in with the fd
+    """
+    if not 0 < len(offsets) <= _LINES_MAX:
+        raise error.GpioError("Cannot request %d lines" % len(offsets))
+    attrs = [0, 0, 0] * _ATTRS_MAX
+    num_attrs = 0
+    if values is not None:
+        attrs[:3] = (_ATTR_OUTPUT_VALUES, values, (1 << len(offsets)) - 1)
+        num_attrs = 1
+    return bytearray(_LINE_REQUEST.pack(
+        *offsets, *(0,) * (_LINES_MAX - len(offsets)),
+        consumer.encode()[:31], flags, num_attrs, *attrs,
+        len(offsets), _EVENT_BUFFER, -1))
+
+
+def unpack_events(data: bytes):
+    """
+    Unpack the gpio_v2_line_events read from a request's fd
+
+    Returns:
+        (list): the LineEvents in the order they occurred
+    """
+    return [
+        LineEvent(*fields)
+        for fields in _LINE_EVENT.iter_unpack(
+            data[:len(data) - len(data) % _LINE_EVENT.size])]
+
+
+class LineRequest:
+    """
+    A set of lines requested from a chip. Values are bitmasks in which bit i
+    refers to the i-th requested line.
+
+    Args:
+        fd (int): the request's file descriptor, owned by the request
+        offsets (tuple): the line offsets in bit order
+    """
+    def __init__(self, fd: int, offsets):
+        self._fd = fd
+        self._offsets = tuple(offsets)
+
+    @property
+    def offsets(self):
+        """
+        The requested line offsets in bit order
+        """
+        return self._offsets
+
+    def fileno(self) -> int:
+        """
+        The fd from which the request's edge events are read
+        """
+        return self._fd
+
+    def set_values(self, bits: int, mask: int):
+        """
+        Set the values of the lines in the mask, in a single ioctl
+
+        Args:
+            bits (int): the values
+            mask (int): the lines to set
+        """
+        fcntl.ioctl(
+            self._fd, _SET_VALUES_IOCTL, _LINE_VALUES.pack(bits, mask))
+
+    def get_values(self, mask: int) -> int:
+        """
+        Read the values of the lines in the mask
+
+        Returns:
+            (int): the values
+        """
+        values = bytearray(_LINE_VALUES.pack(0, mask))
+        fcntl.ioctl(self._fd, _GET_VALUES_IOCTL, values, True)
+        return _LINE_VALUES.unpack(values)[0]
+
+    def read_events(self):
+        """
+        Read the pending edge events, blocking until there is at least one
+
+        Returns:
+            (list): the LineEvents read
+        """
+        return unpack_events(
+            os.read(self._fd, _LINE_EVENT.size * _EVENT_BUFFER))
+
+    def close(self):
+        """
+        Release the lines
+        """
+        os.close(self._fd)
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (type(self).__name__, self._fd, self._offsets)
+
+
+class Chip:
+    """
+    A gpio chip character device
+
+    Args:
+        path (str): the device path
+    """
+    def __init__(self, path: str=DEFAULT_CHIP):
+        self._path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CLOEXEC)
+
+    @property
+    def path(self):
+        """
+        The device path
+        """
+        return self._path
+
+    def request_lines(
+            self,
+            offsets,
+            flags: int,
+            values: int=None,
+            consumer: str=CONSUMER) -> LineRequest:
+        """
+        Request a set of lines with the same configuration
+
+        Args:
+            offsets (tuple): the line offsets
+            flags (int): the FLAG_* flags applied to every line
+            values (int): the initial output values or None to leave them
+            consumer (str): the label the kernel shows as the lines' user
+
+        Returns:
+            (LineRequest): the requested lines
+
+        Raises:
+            GpioError: if the lines could not be requested eg. they are
+                already in use
+        """
+        request = pack_line_request(offsets, flags, consumer, values)
+        try:
+            fcntl.ioctl(self._fd, _GET_LINE_IOCTL, request, True)
+        except OSError as os_error:
+            raise error.GpioError(
+                "Failed to request lines %r of %s: %s"
+                % (tuple(offsets), self._path, os_error))
+        return LineRequest(_LINE_REQUEST.unpack(request)[-1], offsets)
+
+    def close(self):
+        """
+        Close the chip. Lines already requested remain requested.
+        """
+        os.close(self._fd)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._path)
+
+
+_DEFAULT_CHIP = None
+_DEFAULT_CHIP_LOCK = threading.Lock()
+
+
+def default_chip() -> Chip:
+    """
+    The chip used by channels that are not given one, opened on first use
+    """
+    global _DEFAULT_CHIP  # pylint: disable=global-statement
+    with _DEFAULT_CHIP_LOCK:
+        if _DEFAULT_CHIP is None:
+            _DEFAULT_CHIP = Chip()
+        return _DEFAULT_CHIP
+
+
+class OutputChannel(iointerface.OutputInterface):
+    """
+    Concrete implementation of the OutputInterface abstraction. The line is
+    requested on its own until the channel joins an OutputGroup.
+
+    Args:
+        pin (int): the line offset on the chip
+        chip (Chip): the chip. Defaults to default_chip().
+    """
+    def __init__(self, pin: int, chip: Chip=None):
+        super().__init__(pin)
+        self._chip = chip or default_chip()
+        self._request = self._chip.request_lines((pin,), FLAG_OUTPUT, 0)
+        self._bit = 1
+        self._state = False
+
+    def activate(self):
+        """
+        Set the output high
+        """
+        self._request.set_values(self._bit, self._bit)
+        self._state = True
+
+    def deactivate(self):
+        """
+        Set the output low
+        """
+        self._request.set_values(0, self._bit)
+        self._state = False
+
+    @property
+    def gpio(self):
+        return self._chip
+
+
+class OutputGroup(iointerface.OutputGroup):
+    """
+    Concrete implementation of the OutputGroup abstraction. The outputs'
+    lines are re-requested as one set so that every write is a single ioctl
+    setting all of them.
+
+    Args:
+        outputs (OutputChannel): the outputs in bit order, on one chip
+    """
+    def __init__(self, *outputs: OutputChannel):
+        super().__init__(*outputs)
+        self._chip = outputs[0].gpio
+        self._all_bits = (1 << len(outputs)) - 1
+        for output in outputs:
+            # pylint: disable=protected-access
+            output._request.close()
+        self._request = self._chip.request_lines(
+            self.pins, FLAG_OUTPUT, self._state or 0)
+        for bit, output in enumerate(outputs):
+            # pylint: disable=protected-access
+            output._request = self._request
+            output._bit = 1 << bit
+
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        if mask == self._state:
+            return
+        self._request.set_values(mask, self._all_bits)
+        for bit, output in enumerate(self._outputs):
+            # pylint: disable=protected-access
+            output._state = bool(mask >> bit & 1)
+        self._state = mask
+
+    @property
+    def gpio(self):
+        return self._chip
+
+
+class InputChannel(iointerface.InputInterface):
+    """
+    Concrete implementation of the InputInterface abstraction. The line is
+    requested active low if need be, so the kernel reports activation as a
+    rising edge, and edges are read from the request's fd on a background
+    thread. Callbacks are called with the pin and the kernel's monotonic
+    timestamp of the edge in nanoseconds.
+
+    Args:
+        pin (int): the line offset on the chip
+        active_low (bool): True if the input is active_low ie. a low input
+            is interpreted as logical True value
+        chip (Chip): the chip. Defaults to default_chip().
+    """
+    def __init__(self, pin: int, active_low: bool, chip: Chip=None):
+        super().__init__(pin, active_low)
+        self._chip = chip or default_chip()
+        self._callbacks = []
+        flags = FLAG_INPUT | FLAG_EDGE_RISING
+        if active_low:
+            flags |= FLAG_ACTIVE_LOW | FLAG_BIAS_PULL_UP
+        else:
+            flags |= FLAG_BIAS_PULL_DOWN
+        self._request = self._chip.request_lines((pin,), flags)
+        self._wake, self._woken = os.pipe()
+        self._listener = threading.Thread(
+            target=self._listen, name="gpio-events-%d" % pin, daemon=True)
+        self._listener.start()
+
+    @property
+    def state(self):
+        """
+        The current logical state of the input
+
+        Returns:
+            bool: True if the input is active at the present moment
+        """
+        return bool(self._request.get_values(1))
+
+    def register_callback(self, callback):
+        """
+        Register a callback to be called when the input is activated
+        """
+        self._callbacks.append(callback)
+
+    def deregister_callback(self, callback):
+        """
+        Deregister a callback that has already been registered
+        """
+        try:
+            self._callbacks.remove(callback)
+        except ValueError as exc:
+            raise error.GpioError(
+                "Cannot deregister %r. Not registered" % callback) from exc
+
+    def close(self):
+        """
+        Stop listening for edges and release the line
+        """
+        os.write(self._woken, b'\0')
+        self._listener.join()
+        os.close(self._wake)
+        os.close(self._woken)
+        self._request.close()
+
+    @property
+    def gpio(self):
+        return self._chip
+
+    def _listen(self):
+        poller = select.poll()
+        poller.register(self._request.fileno(), select.POLLIN)
+        poller.register(self._wake, select.POLLIN)
+        while True:
+            ready = [fd for fd, _ in poller.poll()]
+            if self._wake in ready:
+                _LOGGER.debug("Stopped listening to pin %d", self._pin)
+                return
+            for event in self._request.read_events():
+                if event.kind == EVENT_RISING_EDGE:
+                    for callback in self._callbacks:
+                        callback(self._pin, event.timestamp_ns)
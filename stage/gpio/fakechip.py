@@ -0,0 +1,216 @@
+"""
+A stand-in for a gpio character device chip that follows the kernel's line
+request rules, so that stage.gpio.chardev can be exercised without hardware.
+Edge events are packed exactly as the kernel packs them and written to a
+pipe that stands in for the line request's fd.
+
+Usage:
+    chip = FakeChip()
+    group = chardev.OutputGroup(
+        *(chardev.OutputChannel(pin, chip) for pin in pins))
+"""
+import errno
+import os
+import threading
+import time
+
+from stage.gpio import chardev
+from stage.gpio import error
+
+DEFAULT_LINES = 54
+
+
+class FakeLineRequest(chardev.LineRequest):
+    """
+    A set of lines requested from a FakeChip. Edge events are read from a
+    pipe.
+
+    Args:
+        chip (FakeChip): the chip the lines belong to
+        offsets (tuple): the line offsets in bit order
+    """
+    # pylint: disable=protected-access
+    def __init__(self, chip, offsets):
+        self._chip = chip
+        self._events, self._sink = os.pipe()
+        super().__init__(self._events, offsets)
+
+    def set_values(self, bits: int, mask: int):
+        self._chip._set_values(self, bits, mask)
+
+    def get_values(self, mask: int) -> int:
+        return self._chip._get_values(self, mask)
+
+    def close(self):
+        self._chip._release(self)
+        os.close(self._sink)
+        os.close(self._events)
+
+    def emit(self, event: chardev.LineEvent):
+        """
+        Queue an edge event to be read from the request's fd
+        """
+        os.write(self._sink, chardev._LINE_EVENT.pack(*event))
+
+
+class FakeChip:
+    """
+    A gpio chip with the given number of lines. Each line can be held by only
+    one request at a time, as with the real device.
+
+    Args:
+        lines (int): the number of lines on the chip
+        path (str): the path reported for the chip
+    """
+    def __init__(self, lines: int=DEFAULT_LINES, path: str='fakechip'):
+        self._path = path
+        self._lock = threading.Lock()
+        self._levels = [False] * lines
+        self._flags = [0] * lines
+        self._requests = {}
+        self._seqnos = {}
+        self._line_seqnos = [0] * lines
+        self._set_values_calls = 0
+
+    @property
+    def path(self):
+        """
+        The path reported for the chip
+        """
+        return self._path
+
+    @property
+    def set_values_calls(self) -> int:
+        """
+        The number of set values ioctls made on the chip's line requests
+        """
+        return self._set_values_calls
+
+    def request_lines(
+            self,
+            offsets,
+            flags: int,
+            values: int=None,
+            consumer: str=chardev.CONSUMER) -> FakeLineRequest:
+        # pylint: disable=unused-argument
+        """
+        Request a set of lines with the same configuration. See
+        chardev.Chip.request_lines.
+
+        Raises:
+            GpioError: if a line does not exist or is already requested
+        """
+        chardev.pack_line_request(offsets, flags, consumer, values)
+        with self._lock:
+            for offset in offsets:
+                if not 0 <= offset < len(self._levels):
+                    raise error.GpioError("No line %d on %s" % (
+                        offset, self._path))
+                if offset in self._requests:
+                    raise error.GpioError(
+                        "Failed to request lines %r of %s: %s" % (
+                            tuple(offsets), self._path,
+                            os.strerror(errno.EBUSY)))
+            request = FakeLineRequest(self, offsets)
+            self._seqnos[request] = 0
+            for bit, offset in enumerate(offsets):
+                self._requests[offset] = request
+                self._flags[offset] = flags
+                if flags & chardev.FLAG_BIAS_PULL_UP:
+                    self._levels[offset] = True
+                elif flags & chardev.FLAG_BIAS_PULL_DOWN:
+                    self._levels[offset] = False
+                if flags & chardev.FLAG_OUTPUT and values is not None:
+                    self._levels[offset] = self._physical(
+                        offset, bool(values >> bit & 1))
+        return request
+
+    def level(self, offset: int) -> bool:
+        """
+        The physical level of a line
+        """
+        with self._lock:
+            return self._levels[offset]
+
+    def requested(self, offset: int) -> bool:
+        """
+        Whether a line is currently requested
+        """
+        with self._lock:
+            return offset in self._requests
+
+    def set_input(
+            self, offset: int, level: bool, timestamp_ns: int=None):
+        """
+        Drive an input line from outside, eg. to simulate an end stop switch,
+        queuing an edge event if the line's request asked for it
+
+        Args:
+            offset (int): the line offset
+            level (bool): the physical level to drive it to
+            timestamp_ns (int): the time of the edge. Defaults to now.
+
+        Raises:
+            ValueError: if the line is requested as an output
+        """
+        with self._lock:
+            flags = self._flags[offset]
+            request = self._requests.get(offset)
+            if request is not None and flags & chardev.FLAG_OUTPUT:
+                raise ValueError("line %d is an output" % offset)
+            before = self._levels[offset]
+            self._levels[offset] = level
+            if request is None or before == level:
+                return
+            rising = self._physical(offset, level)
+            if not flags & (chardev.FLAG_EDGE_RISING if rising
+                            else chardev.FLAG_EDGE_FALLING):
+                return
+            self._seqnos[request] += 1
+            self._line_seqnos[offset] += 1
+            request.emit(chardev.LineEvent(
+                time.monotonic_ns() if timestamp_ns is None else timestamp_ns,
+                chardev.EVENT_RISING_EDGE if rising
+                else chardev.EVENT_FALLING_EDGE,
+                offset,
+                self._seqnos[request],
+                self._line_seqnos[offset]))
+
+    def close(self):
+        """
+        Close the chip. Lines already requested remain requested.
+        """
+
+    def _physical(self, offset, value):
+        # the physical level of a logical value and vice versa
+        return value != bool(self._flags[offset] & chardev.FLAG_ACTIVE_LOW)
+
+    def _set_values(self, request, bits, mask):
+        with self._lock:
+            self._set_values_calls += 1
+            for bit, offset in enumerate(request.offsets):
+                if not mask >> bit & 1:
+                    continue
+                if not self._flags[offset] & chardev.FLAG_OUTPUT:
+                    raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+                self._levels[offset] = self._physical(
+                    offset, bool(bits >> bit & 1))
+
+    def _get_values(self, request, mask):
+        with self._lock:
+            return sum(
+                1 << bit for bit, offset in enumerate(request.offsets)
+                if mask >> bit & 1
+                and self._physical(offset, self._levels[offset]))
+
+    def _release(self, request):
+        with self._lock:
+            for offset in request.offsets:
+                if self._requests.get(offset) is request:
+                    del self._requests[offset]
+                    self._flags[offset] = 0
+            self._seqnos.pop(request, None)
+
+    def __repr__(self):
+        return "%s(%d, %r)" % (
+            type(self).__name__, len(self._levels), self._path)
@@ -0,0 +1,462 @@
+"""
+A local stand-in for the pigpio daemon that speaks the subset of its socket
+interface used by stage.gpio.wave. Waveforms are checked more strictly than
+the real daemon does - pulses may only drive gpios configured as outputs and
+may not set and clear the same gpio - and waves are refused once those held
+need more DMA control blocks than the daemon has. Every transmitted chain is
+kept so tests can inspect exactly what the coils would have been driven with.
+
+Usage:
+    with FakePigpioDaemon() as daemon:
+        pi = PigpioConnection(*daemon.address)
+"""
+import bisect
+import logging
+import socketserver
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from stage.gpio import wave
+
+_LOGGER = logging.getLogger("FAKE PIGPIOD")
+
+# error codes reported to clients, named after their pigpio counterparts
+PI_BAD_GPIO = -3
+PI_BAD_MODE = -4
+PI_BAD_LEVEL = -5
+PI_BAD_PUD = -6
+PI_BAD_HANDLE = -25
+PI_TOO_MANY_PULSES = -36
+PI_BAD_WAVE_ID = -66
+PI_TOO_MANY_CBS = -67
+PI_EMPTY_WAVEFORM = -69
+PI_NO_WAVEFORM_ID = -70
+PI_UNKNOWN_COMMAND = -88
+PI_BAD_CHAIN_LOOP = -114
+PI_BAD_CHAIN_CMD = -115
+PI_CHAIN_TOO_BIG = -119
+# not a pigpio error: a pulse that sets and clears the same gpio or drives a
+# gpio that is not an output
+BAD_PULSE = -1000
+
+MAX_PULSES = 12000
+_GPIOS = 32
+
+Pulse = namedtuple('Pulse', ['on', 'off', 'delay'])
+Pulse.__doc__ = """
+One step of a waveform
+
+Attributes:
+    on (int): bits of the gpios set high
+    off (int): bits of the gpios set low
+    delay (int): microseconds until the next pulse
+"""
+
+
+class _Transmission:
+    # the levels of the gpios driven by a chain over the course of it
+    def __init__(self, start_ns, levels, pulses):
+        self.start_ns = start_ns
+        self.pulses = pulses
+        self.bits = 0
+        self.offsets = []
+        self.levels = []
+        offset = 0
+        for pulse in pulses:
+            self.bits |= pulse.on | pulse.off
+            levels = (levels | pulse.on) & ~pulse.off
+            self.offsets.append(offset)
+            self.levels.append(levels)
+            offset += pulse.delay
+        self.duration_ns = offset * 1000
+        self.halted_ns = None
+
+    def end_ns(self):
+        end = self.start_ns + self.duration_ns
+        return end if self.halted_ns is None else min(end, self.halted_ns)
+
+    def levels_at(self, now_ns, initial):
+        elapsed_us = (min(now_ns, self.end_ns()) - self.start_ns) // 1000
+        index = bisect.bisect_right(self.offsets, elapsed_us) - 1
+        return initial if index < 0 else self.levels[index]
+
+
+class FakePigpioDaemon:
+    """
+    Serves the pigpio socket interface on a local port from a background
+    thread
+
+    Args:
+        host (str): the interface to listen on
+        port (int): the port to listen on. Defaults to any free port.
+        realtime (bool): transmit waveforms in real time. Otherwise chains
+            complete as soon as they are started.
+    """
+    _POLL_INTERVAL_S = 0.01
+
+    def __init__(
+            self, host: str='127.0.0.1', port: int=0, realtime: bool=True):
+        self._realtime = realtime
+        self._lock = threading.Lock()
+        self._epoch = time.perf_counter_ns()
+        self._modes = {}
+        self._levels = 0
+        self._pending = []
+        self._waves = {}
+        self._transmission = None
+        self._transmissions = []
+        self._notifications = {}
+        self._next_handle = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.daemon = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(self._POLL_INTERVAL_S,),
+            name="fake-pigpiod", daemon=True)
+
+    @property
+    def address(self):
+        """
+        The (host, port) the daemon is listening on
+        """
+        return self._server.server_address[:2]
+
+    @property
+    def transmissions(self):
+        """
+        The pulses of every chain transmitted, with loops expanded
+
+        Returns:
+            (list): a list of Pulse lists, one per chain
+        """
+        with self._lock:
+            return [
+                transmission.pulses for transmission in self._transmissions]
+
+    def start(self):
+        """
+        Start serving
+        """
+        self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop serving and close all connections
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def mode(self, gpio: int) -> int:
+        """
+        The mode a gpio has been set to or None if it has not been set
+        """
+        with self._lock:
+            return self._modes.get(gpio)
+
+    def level(self, gpio: int) -> bool:
+        """
+        The level of a gpio now
+        """
+        with self._lock:
+            return bool(self._read() >> gpio & 1)
+
+    def set_input(self, gpio: int, level: bool):
+        """
+        Drive an input gpio from outside eg. to simulate an end stop switch
+
+        Args:
+            gpio (int): the gpio
+            level (bool): the level to drive it to
+
+        Raises:
+            ValueError: if the gpio is an output
+        """
+        with self._lock:
+            if self._modes.get(gpio) == wave.OUTPUT:
+                raise ValueError("gpio %d is an output" % gpio)
+            bit = 1 << gpio
+            self._set_levels(bit if level else 0, 0 if level else bit)
+
+    def tick(self) -> int:
+        """
+        Microseconds since the daemon started, wrapping at 32 bits
+        """
+        return (time.perf_counter_ns() - self._epoch) // 1000 & 0xFFFFFFFF
+
+    # the following run on the server's connection threads with _lock held
+
+    def execute(self, connection, cmd, p1, p2, ext):
+        # pylint: disable=too-many-return-statements,too-many-branches
+        if cmd in (wave.MODES, wave.PUD, wave.READ, wave.WRITE) \
+                and not 0 <= p1 < _GPIOS:
+            return PI_BAD_GPIO
+        if cmd == wave.MODES:
+            if p2 not in (wave.INPUT, wave.OUTPUT):
+                return PI_BAD_MODE
+            self._modes[p1] = p2
+            return 0
+        if cmd == wave.PUD:
+            if p2 not in (wave.PUD_OFF, wave.PUD_DOWN, wave.PUD_UP):
+                return PI_BAD_PUD
+            if p2 != wave.PUD_OFF and self._modes.get(p1) != wave.OUTPUT:
+                bit = 1 << p1
+                self._set_levels(
+                    bit if p2 == wave.PUD_UP else 0,
+                    0 if p2 == wave.PUD_UP else bit)
+            return 0
+        if cmd == wave.READ:
+            return self._read() >> p1 & 1
+        if cmd == wave.WRITE:
+            if p2 not in (0, 1):
+                return PI_BAD_LEVEL
+            return self._write_bits(1 << p1 if p2 else 0, 0 if p2 else 1 << p1)
+        if cmd == wave.BR1:
+            return self._read()
+        if cmd == wave.BS1:
+            return self._write_bits(p1, 0)
+        if cmd == wave.BC1:
+            return self._write_bits(0, p1)
+        if cmd == wave.WVCLR:
+            self._pending = []
+            self._waves = {}
+            return 0
+        if cmd == wave.WVAG:
+            return self._add_pulses(ext)
+        if cmd == wave.WVCRE:
+            if not self._pending:
+                return PI_EMPTY_WAVEFORM
+            free = [
+                wave_id for wave_id in range(wave.MAX_WAVES)
+                if wave_id not in self._waves]
+            if not free:
+                return PI_NO_WAVEFORM_ID
+            if wave.control_blocks(self._pending) + sum(
+                    wave.control_blocks(pulses)
+                    for pulses in self._waves.values()) \
+                    > wave.MAX_CONTROL_BLOCKS:
+                return PI_TOO_MANY_CBS
+            wave_id = free[0]
+            self._waves[wave_id] = self._pending
+            self._pending = []
+            return wave_id
+        if cmd == wave.WVDEL:
+            if self._waves.pop(p1, None) is None:
+                return PI_BAD_WAVE_ID
+            return 0
+        if cmd == wave.WVCHA:
+            return self._chain(ext)
+        if cmd == wave.WVBSY:
+            return int(self._busy())
+        if cmd == wave.WVHLT:
+            if self._busy():
+                self._transmission.halted_ns = time.perf_counter_ns()
+            self._settle()
+            return 0
+        if cmd == wave.NOIB:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._notifications[handle] = [connection, 0, 0]
+            return handle
+        if cmd == wave.NB:
+            if p1 not in self._notifications:
+                return PI_BAD_HANDLE
+            self._notifications[p1][1] = p2
+            return 0
+        if cmd == wave.NC:
+            if self._notifications.pop(p1, None) is None:
+                return PI_BAD_HANDLE
+            return 0
+        return PI_UNKNOWN_COMMAND
+
+    def disconnect(self, connection):
+        for handle, (notified, _, _) in list(self._notifications.items()):
+            if notified is connection:
+                del self._notifications[handle]
+
+    def _busy(self):
+        transmission = self._transmission
+        return transmission is not None \
+            and time.perf_counter_ns() < transmission.end_ns()
+
+    def _read(self):
+        transmission = self._transmission
+        if transmission is None:
+            return self._levels
+        driven = transmission.levels_at(time.perf_counter_ns(), self._levels)
+        return self._levels & ~transmission.bits | driven & transmission.bits
+
+    def _settle(self):
+        # fold a finished chain into the levels
+        if self._transmission is not None and not self._busy():
+            self._levels = self._read()
+            self._transmission = None
+
+    def _write_bits(self, high, low):
+        if (high | low) & ~self._outputs():
+            return PI_BAD_GPIO
+        self._set_levels(high, low)
+        return 0
+
+    def _set_levels(self, high, low):
+        # levels changed other than by a chain. Gpios driven by a chain still
+        # in progress follow the chain.
+        self._settle()
+        before = self._read()
+        self._levels = (self._levels | high) & ~low
+        levels = self._read()
+        for report in self._notifications.values():
+            connection, bits, sequence = report
+            if (before ^ levels) & bits:
+                report[2] = sequence + 1 & 0xFFFF
+                connection.notify(struct.pack(
+                    '<HHII', sequence, 0, self.tick(), levels))
+
+    def _outputs(self):
+        return sum(
+            1 << gpio for gpio, mode in self._modes.items()
+            if mode == wave.OUTPUT)
+
+    def _add_pulses(self, ext):
+        if len(ext) % 12:
+            return BAD_PULSE
+        pulses = [
+            Pulse(*fields) for fields in struct.iter_unpack('<III', ext)]
+        if len(self._pending) + len(pulses) > MAX_PULSES:
+            return PI_TOO_MANY_PULSES
+        outputs = self._outputs()
+        for pulse in pulses:
+            if pulse.on & pulse.off or (pulse.on | pulse.off) & ~outputs:
+                return BAD_PULSE
+        # pulses added by a later call are merged in time with the wave so
+        # far. Only the first call may start the wave.
+        if self._pending:
+            return BAD_PULSE
+        self._pending = pulses
+        return len(pulses)
+
+    def _chain(self, ext):
+        if len(ext) > wave.MAX_CHAIN_BYTES:
+            return PI_CHAIN_TOO_BIG
+        try:
+            pulses, end = self._expand(bytes(ext), 0)
+        except _ChainError as chain_error:
+            return chain_error.code
+        if end != len(ext):
+            return PI_BAD_CHAIN_LOOP
+        self._settle()
+        if self._busy():
+            self._transmission.halted_ns = time.perf_counter_ns()
+            self._settle()
+        start = time.perf_counter_ns()
+        if not self._realtime:
+            start -= sum(pulse.delay for pulse in pulses) * 1000
+        self._transmission = _Transmission(start, self._levels, pulses)
+        self._transmissions.append(self._transmission)
+        self._settle()
+        return 0
+
+    def _expand(self, chain, index, depth=0):
+        # expand the chain from index until the end or an unmatched loop end
+        pulses = []
+        while index < len(chain):
+            if chain[index] != 255:
+                if chain[index] not in self._waves:
+                    raise _ChainError(PI_BAD_WAVE_ID)
+                pulses.extend(self._waves[chain[index]])
+                index += 1
+                continue
+            if index + 1 >= len(chain):
+                raise _ChainError(PI_BAD_CHAIN_CMD)
+            command = chain[index + 1]
+            if command == 0:
+                if depth == 4:
+                    raise _ChainError(PI_BAD_CHAIN_LOOP)
+                body, index = self._expand(chain, index + 2, depth + 1)
+                if index + 4 > len(chain) or chain[index:index + 2] \
+                        != b'\xff\x01':
+                    raise _ChainError(PI_BAD_CHAIN_LOOP)
+                pulses.extend(body * (chain[index + 2] + 256 * chain[index + 3]))
+                index += 4
+            elif command == 1:
+                if not depth:
+                    raise _ChainError(PI_BAD_CHAIN_LOOP)
+                return pulses, index
+            elif command == 2:
+                if index + 4 > len(chain):
+                    raise _ChainError(PI_BAD_CHAIN_CMD)
+                pulses.append(Pulse(
+                    0, 0, chain[index + 2] + 256 * chain[index + 3]))
+                index += 4
+            else:
+                raise _ChainError(PI_BAD_CHAIN_CMD)
+        if depth:
+            raise _ChainError(PI_BAD_CHAIN_LOOP)
+        return pulses, index
+
+
+class _ChainError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    daemon = None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    _COMMAND = struct.Struct('<IIII')
+
+    def setup(self):
+        self._send_lock = threading.Lock()
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            while True:
+                header = self._receive(self._COMMAND.size)
+                if header is None:
+                    return
+                cmd, p1, p2, length = self._COMMAND.unpack(header)
+                ext = self._receive(length) if length else b''
+                with daemon._lock:  # pylint: disable=protected-access
+                    result = daemon.execute(self, cmd, p1, p2, ext)
+                if result < 0:
+                    _LOGGER.warning(
+                        "Command %d(%d, %d) failed: %d", cmd, p1, p2, result)
+                self._send(struct.pack('<IIIi', cmd, p1, p2, result))
+        except OSError:
+            return
+        finally:
+            with daemon._lock:  # pylint: disable=protected-access
+                daemon.disconnect(self)
+
+    def notify(self, report):
+        try:
+            self._send(report)
+        except OSError:
+            pass
+
+    def _send(self, data):
+        with self._send_lock:
+            self.request.sendall(data)
+
+    def _receive(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
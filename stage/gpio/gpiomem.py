@@ -0,0 +1,203 @@
+"""
+io interface concretions of the stage iointerface that write the BCM2835 -
+BCM2711 gpio registers directly through a memory mapping of /dev/gpiomem.
+A coil group update is one store to GPSET0 and one to GPCLR0, taken from a
+set/clear pair precomputed for every state of the group, so stepping needs
+no per-pin register writes. Only outputs are provided - inputs with edge events
+come from another backend eg. stage.gpio.chardev.
+"""
+import mmap
+import os
+import threading
+
+from stage.gpio import interface as iointerface
+from stage.gpio import error
+
+DEFAULT_PATH = '/dev/gpiomem'
+BLOCK_SIZE = 0x1000
+
+# register byte offsets in the gpio block
+GPFSEL0 = 0x00
+GPSET0 = 0x1C
+GPCLR0 = 0x28
+GPLEV0 = 0x34
+
+FUNCTION_INPUT = 0b000
+FUNCTION_OUTPUT = 0b001
+
+_BANK_PINS = 32
+_FSEL_PINS = 10
+
+
+class GpioRegisters:
+    """
+    A memory mapping of the gpio register block. Registers are read and
+    written as whole 32 bit words, as the hardware requires.
+
+    Args:
+        path (str): the device to map. A regular file of at least BLOCK_SIZE
+            bytes may stand in for the device eg. in tests.
+    """
+    def __init__(self, path: str=DEFAULT_PATH):
+        self._path = path
+        fd = os.open(path, os.O_RDWR | os.O_SYNC | os.O_CLOEXEC)
+        try:
+            self._map = mmap.mmap(fd, BLOCK_SIZE)
+        finally:
+            os.close(fd)
+        self._words = memoryview(self._map).cast('I')
+
+    @property
+    def path(self):
+        """
+        The mapped device path
+        """
+        return self._path
+
+    @property
+    def words(self) -> memoryview:
+        """
+        The register block as 32 bit words, indexed by byte offset // 4
+        """
+        return self._words
+
+    def read(self, offset: int) -> int:
+        """
+        Read the register at a byte offset
+        """
+        return self._words[offset // 4]
+
+    def write(self, offset: int, value: int):
+        """
+        Write the register at a byte offset
+        """
+        self._words[offset // 4] = value
+
+    def function(self, pin: int) -> int:
+        """
+        The function a pin is selected for eg. FUNCTION_OUTPUT
+        """
+        offset, shift = self._fsel(pin)
+        return self.read(offset) >> shift & 0b111
+
+    def select_function(self, pin: int, function: int):
+        """
+        Select the function of a pin, leaving the other pins sharing its
+        function select register unchanged
+        """
+        offset, shift = self._fsel(pin)
+        self.write(
+            offset,
+            self.read(offset) & ~(0b111 << shift) | function << shift)
+
+    def close(self):
+        """
+        Unmap the register block
+        """
+        self._words.release()
+        self._map.close()
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._path)
+
+    @staticmethod
+    def _fsel(pin):
+        return GPFSEL0 + 4 * (pin // _FSEL_PINS), 3 * (pin % _FSEL_PINS)
+
+
+_DEFAULT_REGISTERS = None
+_DEFAULT_REGISTERS_LOCK = threading.Lock()
+
+
+def default_registers() -> GpioRegisters:
+    """
+    The registers used by channels that are not given any, mapped on first
+    use
+    """
+    global _DEFAULT_REGISTERS  # pylint: disable=global-statement
+    with _DEFAULT_REGISTERS_LOCK:
+        if _DEFAULT_REGISTERS is None:
+            _DEFAULT_REGISTERS = GpioRegisters()
+        return _DEFAULT_REGISTERS
+
+
+class OutputChannel(iointerface.OutputInterface):
+    """
+    Concrete implementation of the OutputInterface abstraction
+
+    Args:
+        pin (int): the BCM gpio to select as an output. Must be in bank 0.
+        registers (GpioRegisters): the register block. Defaults to
+            default_registers().
+    """
+    def __init__(self, pin: int, registers: GpioRegisters=None):
+        if not 0 <= pin < _BANK_PINS:
+            raise error.GpioError("gpio %d is not in bank 0" % pin)
+        super().__init__(pin)
+        self._registers = registers or default_registers()
+        self._bit = 1 << pin
+        self.deactivate()
+        self._registers.select_function(pin, FUNCTION_OUTPUT)
+
+    def activate(self):
+        """
+        Set the output high
+        """
+        self._registers.write(GPSET0, self._bit)
+        self._state = True
+
+    def deactivate(self):
+        """
+        Set the output low
+        """
+        self._registers.write(GPCLR0, self._bit)
+        self._state = False
+
+    @property
+    def gpio(self):
+        return self._registers
+
+
+class OutputGroup(iointerface.OutputGroup):
+    """
+    Concrete implementation of the OutputGroup abstraction. The GPSET0 and
+    GPCLR0 words for every state of the group are computed up front, so a
+    write is a lookup and two register stores.
+
+    Args:
+        outputs (OutputChannel): the outputs in bit order, on one register
+            block
+    """
+    def __init__(self, *outputs: OutputChannel):
+        super().__init__(*outputs)
+        self._registers = outputs[0].gpio
+        self._words = self._registers.words
+        self._set_word = GPSET0 // 4
+        self._clear_word = GPCLR0 // 4
+        bits = [1 << output.pin for output in outputs]
+        self._writes = []
+        for mask in range(1 << len(outputs)):
+            high = sum(bit for index, bit in enumerate(bits) if mask >> index & 1)
+            self._writes.append((high, sum(bits) & ~high))
+
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        if mask == self._state:
+            return
+        high, low = self._writes[mask]
+        words = self._words
+        words[self._set_word] = high
+        words[self._clear_word] = low
+        for bit, output in enumerate(self._outputs):
+            # pylint: disable=protected-access
+            output._state = bool(mask >> bit & 1)
+        self._state = mask
+
+    @property
+    def gpio(self):
+        return self._registers
@@ -58,6 +58,114 @@ class OutputInterface(abc.ABC):
         return
 
 
+class OutputGroup(abc.ABC):
+    """
+    A group of outputs that are written together as a single bitmask. Bit i of
+    the mask is the level of the i-th output. Concrete groups write only the
+    outputs whose level changes and do so in as few driver calls as possible.
+
+    Args:
+        outputs (OutputInterface): the outputs in bit order
+    """
+    def __init__(self, *outputs: OutputInterface):
+        self._outputs = outputs
+        self._state = None
+        if all(output.state is not None for output in outputs):
+            self._state = sum(
+                1 << bit for bit, output in enumerate(outputs) if output.state)
+
+    @property
+    def outputs(self):
+        """
+        The outputs in the group
+
+        Returns:
+            tuple: the outputs in bit order
+        """
+        return self._outputs
+
+    @property
+    def pins(self):
+        """
+        The physical pins in the group
+
+        Returns:
+            tuple: the pin indices in bit order
+        """
+        return tuple(output.pin for output in self._outputs)
+
+    @property
+    def state(self):
+        """
+        The levels last written to the group
+
+        Returns:
+            int: bitmask of the output levels or None if not yet known
+        """
+        return self._state
+
+    @abc.abstractmethod
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        return
+
+    def _changed(self, mask):
+        """
+        The outputs whose level differs from the last write. Every output needs
+        writing if the levels are not yet known.
+
+        Returns:
+            list: (output, level) pairs for each output that needs writing
+        """
+        diff = ~0 if self._state is None else mask ^ self._state
+        return [
+            (output, bool(mask >> bit & 1))
+            for bit, output in enumerate(self._outputs)
+            if diff >> bit & 1]
+
+    @abc.abstractproperty
+    def gpio(self):
+        """
+        Returns the gpio driver
+        """
+        return
+
+
+class ChannelGroup(OutputGroup):
+    """
+    Groups outputs that have no group of their own in their backend. Only the
+    outputs whose level changes are written, one at a time.
+
+    Args:
+        outputs (OutputInterface): the outputs in bit order
+    """
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        for output, level in self._changed(mask):
+            if level:
+                output.activate()
+            else:
+                output.deactivate()
+        self._state = mask
+
+    @property
+    def gpio(self):
+        """
+        Returns the gpio driver of the first output
+        """
+        return self._outputs[0].gpio
+
+
 class InputInterface(abc.ABC):
     """
     Initialise the given pin as an input
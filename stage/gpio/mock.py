@@ -32,6 +32,31 @@ class OutputChannel(iointerface.OutputInterface):
         return type(self)._GPIO_DRIVER
 
 
+class OutputGroup(iointerface.OutputGroup):
+    """
+    Mock concrete implementation of the OutputGroup abstraction. Only the
+    channels whose level changes are written.
+    """
+    _GPIO_DRIVER = None
+
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        for output, level in self._changed(mask):
+            output.activate() if level else output.deactivate()
+        self._state = mask
+
+    def gpio(self):
+        """
+        Returns the gpio driver
+        """
+        return type(self)._GPIO_DRIVER
+
+
 class InputChannel(iointerface.InputInterface):
     #pylint:disable=too-few-public-methods
     """
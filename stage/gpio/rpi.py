@@ -1,20 +1,44 @@
 """
 io interface concretions of the stage iointerface that apply to the RPi.GPIO
-library.
+library. The library is imported, and put in BCM mode, when the first channel
+is created rather than when this module is imported.
 """
-import RPi.GPIO as RPI_GPIO
+import importlib
+import threading
 
 from stage.gpio import interface as iointerface
 from stage.gpio import error
 
-RPI_GPIO.setmode(RPI_GPIO.BCM)
+_DRIVER = None
+_DRIVER_LOCK = threading.Lock()
+
+
+def driver():
+    """
+    The RPi.GPIO module, imported and set to BCM numbering on first use
+
+    Raises:
+        GpioError: if RPi.GPIO is not installed
+    """
+    global _DRIVER  # pylint: disable=global-statement
+    if _DRIVER is not None:
+        return _DRIVER
+    with _DRIVER_LOCK:
+        if _DRIVER is None:
+            try:
+                gpio = importlib.import_module('RPi.GPIO')
+            except ImportError as import_error:
+                raise error.GpioError(
+                    "The rpi backend needs RPi.GPIO: %s" % import_error)
+            gpio.setmode(gpio.BCM)
+            _DRIVER = gpio
+        return _DRIVER
 
 
 class OutputChannel(iointerface.OutputInterface):
     """
     Concrete implementation of the OutputInterface abstraction
     """
-    _GPIO_DRIVER = RPI_GPIO
 
     def __init__(self, pin: int):
         """
@@ -44,7 +68,35 @@ class OutputChannel(iointerface.OutputInterface):
 
     @property
     def gpio(self):
-        return type(self)._GPIO_DRIVER
+        return driver()
+
+
+class OutputGroup(iointerface.OutputGroup):
+    """
+    Concrete implementation of the OutputGroup abstraction. The outputs whose
+    levels change are written together in a single call to the driver.
+    """
+
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        changed = self._changed(mask)
+        if changed:
+            self.gpio.output(
+                [output.pin for output, _ in changed],
+                [int(level) for _, level in changed])
+            for output, level in changed:
+                # pylint: disable=protected-access
+                output._state = level
+        self._state = mask
+
+    @property
+    def gpio(self):
+        return driver()
 
 
 class InputChannel(iointerface.InputInterface):
@@ -52,7 +104,6 @@ class InputChannel(iointerface.InputInterface):
     Concrete implementation of the InputInterface abstraction
     """
     _DEBOUNCE_MS = 200
-    _GPIO_DRIVER = RPI_GPIO
 
     class CallbackManager:
         #pylint:disable=too-few-public-methods
@@ -118,4 +169,4 @@ class InputChannel(iointerface.InputInterface):
 
     @property
     def gpio(self):
-        return type(self)._GPIO_DRIVER
+        return driver()
@@ -0,0 +1,492 @@
+"""
+io interface concretions of the stage iointerface that talk to a pigpio
+daemon over its socket interface. As well as writing outputs directly, the
+coil output group can transmit a move as hardware-timed waveform chains so
+that no Python runs in the timing loop, and inputs are notified of edges by
+the daemon with its own timestamps.
+"""
+import logging
+import os
+import socket
+import struct
+import threading
+from collections import namedtuple
+
+from stage.gpio import interface as iointerface
+from stage.gpio import error
+
+_LOGGER = logging.getLogger("WAVE GPIO")
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 8888
+
+# pigpio socket command numbers
+MODES = 0
+PUD = 2
+READ = 3
+WRITE = 4
+BR1 = 10
+BC1 = 12
+BS1 = 14
+NB = 19
+NC = 21
+WVCLR = 27
+WVAG = 28
+WVBSY = 32
+WVHLT = 33
+WVCRE = 49
+WVDEL = 50
+WVCHA = 93
+NOIB = 99
+
+INPUT = 0
+OUTPUT = 1
+PUD_OFF = 0
+PUD_DOWN = 1
+PUD_UP = 2
+
+# the largest waveform sent in one command and the limits of a wave chain
+MAX_WAVE_PULSES = 4000
+MAX_WAVES = 250
+MAX_CHAIN_BYTES = 600
+MAX_LOOP_COUNT = 0xFFFF
+# the DMA control blocks shared by all the waves the daemon holds at once
+MAX_CONTROL_BLOCKS = 25016
+
+_COMMAND = struct.Struct('<IIII')
+_RESPONSE = struct.Struct('<12si')
+_PULSE = struct.Struct('<III')
+_REPORT = struct.Struct('<HHII')
+
+PreparedChain = namedtuple('PreparedChain', ['chain', 'waves'])
+PreparedChain.__doc__ = """
+A wave chain whose waves have been created but which has not been started
+
+Attributes:
+    chain (bytes): the chain for WVCHA
+    waves (tuple): the ids of the waves it transmits
+"""
+
+
+class PigpioConnection:
+    """
+    A command connection to a pigpio daemon. Commands from several threads are
+    serialised.
+
+    Args:
+        host (str): the daemon host. Defaults to $PIGPIO_ADDR or localhost.
+        port (int): the daemon port. Defaults to $PIGPIO_PORT or 8888.
+    """
+    def __init__(self, host: str=None, port: int=None):
+        self._host = host or os.environ.get('PIGPIO_ADDR', DEFAULT_HOST)
+        self._port = int(port or os.environ.get('PIGPIO_PORT', DEFAULT_PORT))
+        self._socket = self.open_socket()
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        """
+        The (host, port) of the daemon
+        """
+        return self._host, self._port
+
+    def open_socket(self) -> socket.socket:
+        """
+        Open a further socket to the daemon eg. for notifications
+
+        Returns:
+            (socket.socket): the connected socket
+        """
+        sock = socket.create_connection((self._host, self._port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def command(self, cmd: int, p1: int=0, p2: int=0, ext: bytes=b'') -> int:
+        """
+        Send a command and wait for its result
+
+        Args:
+            cmd (int): the pigpio command number
+            p1 (int): the first parameter
+            p2 (int): the second parameter
+            ext (bytes): the command extension
+
+        Returns:
+            (int): the non-negative result
+
+        Raises:
+            GpioError: if the daemon reports an error
+        """
+        with self._lock:
+            return send_command(self._socket, cmd, p1, p2, ext)
+
+    def close(self):
+        """
+        Close the connection
+        """
+        self._socket.close()
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (type(self).__name__, self._host, self._port)
+
+
+def send_command(sock, cmd, p1=0, p2=0, ext=b''):
+    """
+    Send a pigpio command on a socket and wait for its result
+
+    Raises:
+        GpioError: if the daemon reports an error
+    """
+    sock.sendall(_COMMAND.pack(cmd, p1, p2, len(ext)) + ext)
+    _, result = _RESPONSE.unpack(_receive(sock, _RESPONSE.size))
+    if result < 0:
+        raise error.GpioError(
+            "pigpio command %d failed with error %d" % (cmd, result))
+    return result
+
+
+def _receive(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise error.GpioError("pigpio daemon closed the connection")
+        data += chunk
+    return data
+
+
+_DEFAULT_CONNECTION = None
+_DEFAULT_CONNECTION_LOCK = threading.Lock()
+
+
+def default_connection() -> PigpioConnection:
+    """
+    The connection shared by channels that are not given one, opened on first
+    use
+    """
+    global _DEFAULT_CONNECTION  # pylint: disable=global-statement
+    with _DEFAULT_CONNECTION_LOCK:
+        if _DEFAULT_CONNECTION is None:
+            _DEFAULT_CONNECTION = PigpioConnection()
+        return _DEFAULT_CONNECTION
+
+
+def control_blocks(pulses) -> int:
+    """
+    The DMA control blocks the daemon needs for a wave: one for each of the
+    set, the clear and the delay of a pulse that it has, and one to end the
+    wave
+
+    Args:
+        pulses (iterable): the (on, off, delay_us) pulses of the wave
+    """
+    return 1 + sum(
+        bool(on) + bool(off) + bool(delay) for on, off, delay in pulses)
+
+
+def build_chain(waves):
+    """
+    Encode a wave chain that transmits each wave the given number of times
+
+    Args:
+        waves (iterable): (wave_id, count) pairs in transmission order
+
+    Returns:
+        (bytes): the chain for WVCHA
+    """
+    chain = bytearray()
+    for wave_id, count in waves:
+        while count > 1:
+            repeats = min(count, MAX_LOOP_COUNT)
+            chain += bytes((
+                255, 0, wave_id, 255, 1, repeats & 0xFF, repeats >> 8))
+            count -= repeats
+        if count:
+            chain.append(wave_id)
+    return bytes(chain)
+
+
+class OutputChannel(iointerface.OutputInterface):
+    """
+    Concrete implementation of the OutputInterface abstraction
+
+    Args:
+        pin (int): the BCM gpio to initialise as an output
+        pi (PigpioConnection): the daemon. Defaults to default_connection().
+    """
+    def __init__(self, pin: int, pi: PigpioConnection=None):
+        super().__init__(pin)
+        self._pi = pi or default_connection()
+        self._pi.command(MODES, pin, OUTPUT)
+        self.deactivate()
+
+    def activate(self):
+        """
+        Set the output high
+        """
+        self._pi.command(WRITE, self._pin, 1)
+        self._state = True
+
+    def deactivate(self):
+        """
+        Set the output low
+        """
+        self._pi.command(WRITE, self._pin, 0)
+        self._state = False
+
+    @property
+    def gpio(self):
+        return self._pi
+
+
+class OutputGroup(iointerface.OutputGroup):
+    """
+    Concrete implementation of the OutputGroup abstraction. The outputs that
+    go high and those that go low are each written in a single command.
+
+    The group can also transmit a sequence of bitmasks as a hardware-timed
+    waveform chain. Runs of identical cycles are sent once and looped by the
+    daemon. A long move may instead be sent as several chains, preparing each
+    while the one before it is transmitted, as long as the waves of both fit
+    in the daemon's control blocks at once.
+
+    Args:
+        outputs (OutputChannel): the outputs in bit order, on one daemon
+    """
+    def __init__(self, *outputs: OutputChannel):
+        super().__init__(*outputs)
+        self._pi = outputs[0].gpio
+        self._bits = tuple(1 << output.pin for output in outputs)
+        self._all_bits = sum(self._bits)
+        # control blocks by wave id of the waves created and not deleted
+        self._waves = {}
+
+    def write(self, mask: int):
+        """
+        Set the levels of all outputs in the group
+
+        Args:
+            mask (int): bitmask of the required output levels
+        """
+        changed = self._changed(mask)
+        if changed:
+            high = sum(1 << output.pin for output, level in changed if level)
+            low = sum(1 << output.pin for output, level in changed if not level)
+            if high:
+                self._pi.command(BS1, high)
+            if low:
+                self._pi.command(BC1, low)
+            for output, level in changed:
+                # pylint: disable=protected-access
+                output._state = level
+        self._state = mask
+
+    def transmit(self, cycles):
+        """
+        Start transmitting a move as a waveform chain, stopping any chain in
+        progress. Returns as soon as the daemon has started the chain.
+
+        Args:
+            cycles (iterable): one tuple per cycle of (mask, delay_us) phases
+                where the mask is held for delay_us microseconds
+
+        Raises:
+            GpioError: if the move is too complex for one chain or the daemon
+                rejects it
+        """
+        self.halt()
+        self._delete_waves(self._waves)
+        self.start(self.prepare(cycles))
+
+    def prepare(self, cycles) -> PreparedChain:
+        """
+        Create the waves of a move, or of the next part of one, without
+        transmitting them. The waves of the chain being transmitted are kept.
+
+        Args:
+            cycles (iterable): one tuple per cycle of (mask, delay_us) phases
+                where the mask is held for delay_us microseconds
+
+        Returns:
+            (PreparedChain): the chain to pass to start
+
+        Raises:
+            GpioError: if the move is too complex for one chain, its waves do
+                not fit in the control blocks left or the daemon rejects it
+        """
+        runs = []
+        for cycle in cycles:
+            if runs and runs[-1][0] == cycle:
+                runs[-1][1] += 1
+            else:
+                runs.append([cycle, 1])
+        created = len(self._waves)
+        try:
+            waves = []
+            pulses = []
+            for cycle, count in runs:
+                if pulses and (
+                        count > 1
+                        or len(pulses) + len(cycle) > MAX_WAVE_PULSES):
+                    waves.append((self._create_wave(pulses), 1))
+                    pulses = []
+                if count > 1:
+                    waves.append(
+                        (self._create_wave(list(self._pulses(cycle))), count))
+                else:
+                    pulses.extend(self._pulses(cycle))
+            if pulses:
+                waves.append((self._create_wave(pulses), 1))
+            chain = build_chain(waves)
+            if len(chain) > MAX_CHAIN_BYTES:
+                raise error.GpioError(
+                    "Move needs a %d byte wave chain" % len(chain))
+        except error.GpioError:
+            self._delete_waves(list(self._waves)[created:])
+            raise
+        return PreparedChain(chain, tuple(wave_id for wave_id, _ in waves))
+
+    def start(self, prepared: PreparedChain):
+        """
+        Start transmitting a prepared chain and delete the waves of any other
+        chain. The chain before it should have finished, since the daemon
+        stops it.
+
+        Args:
+            prepared (PreparedChain): the chain from prepare
+        """
+        for output in self._outputs:
+            # pylint: disable=protected-access
+            output._state = None
+        self._state = None
+        self._pi.command(WVCHA, ext=prepared.chain)
+        self._delete_waves(
+            [wave_id for wave_id in self._waves
+             if wave_id not in prepared.waves])
+
+    def busy(self) -> bool:
+        """
+        Whether a waveform chain is still being transmitted
+        """
+        return bool(self._pi.command(WVBSY))
+
+    def halt(self):
+        """
+        Stop transmitting immediately, leaving the outputs at their current
+        levels
+        """
+        self._pi.command(WVHLT)
+
+    @property
+    def gpio(self):
+        return self._pi
+
+    def _pulses(self, cycle):
+        bits = self._bits
+        all_bits = self._all_bits
+        for mask, delay_us in cycle:
+            high = sum(bit for index, bit in enumerate(bits) if mask >> index & 1)
+            yield high, all_bits & ~high, delay_us
+
+    def _create_wave(self, pulses):
+        if len(self._waves) == MAX_WAVES:
+            raise error.GpioError("Move needs more than %d waves" % MAX_WAVES)
+        blocks = control_blocks(pulses)
+        held = sum(self._waves.values())
+        if held + blocks > MAX_CONTROL_BLOCKS:
+            raise error.GpioError(
+                "Move needs %d control blocks with %d of %d in use"
+                % (blocks, held, MAX_CONTROL_BLOCKS))
+        ext = b''.join(_PULSE.pack(*pulse) for pulse in pulses)
+        self._pi.command(WVAG, ext=ext)
+        wave_id = self._pi.command(WVCRE)
+        self._waves[wave_id] = blocks
+        return wave_id
+
+    def _delete_waves(self, wave_ids):
+        for wave_id in list(wave_ids):
+            self._pi.command(WVDEL, wave_id)
+            del self._waves[wave_id]
+
+
+class InputChannel(iointerface.InputInterface):
+    """
+    Concrete implementation of the InputInterface abstraction. Edges are
+    reported by the daemon's notification stream, read on a background thread.
+    Callbacks are called with the pin and the daemon's microsecond tick at
+    which the input became active.
+
+    Args:
+        pin (int): the BCM gpio to use
+        active_low (bool): True if the input is active_low ie. a low input
+            is interpreted as logical True value
+        pi (PigpioConnection): the daemon. Defaults to default_connection().
+    """
+    def __init__(self, pin: int, active_low: bool, pi: PigpioConnection=None):
+        super().__init__(pin, active_low)
+        self._pi = pi or default_connection()
+        self._callbacks = []
+        self._pi.command(MODES, pin, INPUT)
+        self._pi.command(PUD, pin, PUD_UP if active_low else PUD_DOWN)
+        self._notifications = self._pi.open_socket()
+        self._handle = send_command(self._notifications, NOIB)
+        self._active = self._level_active(self._pi.command(BR1))
+        self._pi.command(NB, self._handle, 1 << pin)
+        self._listener = threading.Thread(
+            target=self._listen, name="pigpio-notify-%d" % pin, daemon=True)
+        self._listener.start()
+
+    @property
+    def state(self):
+        """
+        The current logical state of the input
+
+        Returns:
+            bool: True if the input is active at the present moment
+        """
+        return self._level_active(self._pi.command(BR1))
+
+    def register_callback(self, callback):
+        """
+        Register a callback to be called when the input is activated
+        """
+        self._callbacks.append(callback)
+
+    def deregister_callback(self, callback):
+        """
+        Deregister a callback that has already been registered
+        """
+        try:
+            self._callbacks.remove(callback)
+        except ValueError as exc:
+            raise error.GpioError(
+                "Cannot deregister %r. Not registered" % callback) from exc
+
+    def close(self):
+        """
+        Stop listening for edges
+        """
+        try:
+            self._pi.command(NC, self._handle)
+        finally:
+            self._notifications.close()
+
+    @property
+    def gpio(self):
+        return self._pi
+
+    def _level_active(self, levels):
+        return bool(levels >> self._pin & 1) != self._active_low
+
+    def _listen(self):
+        try:
+            while True:
+                _, _, tick, levels = _REPORT.unpack(
+                    _receive(self._notifications, _REPORT.size))
+                active = self._level_active(levels)
+                if active and not self._active:
+                    for callback in self._callbacks:
+                        callback(self._pin, tick)
+                self._active = active
+        except (OSError, error.GpioError):
+            _LOGGER.debug("Stopped listening to pin %d", self._pin)
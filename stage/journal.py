@@ -0,0 +1,119 @@
+"""
+A small memory-mapped journal of the stage position that survives process
+restarts so that the stage need not be homed every time it is constructed.
+"""
+import logging
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+_LOGGER = logging.getLogger("JOURNAL")
+
+JournalEntry = namedtuple('JournalEntry', ['position', 'phase', 'clean'])
+JournalEntry.__doc__ = """
+The last state recorded in a journal
+
+Attributes:
+    position (int): the last committed position index
+    phase (int): the index in the drive sequence of the coil state the rotor
+        was left in or None if unknown
+    clean (bool): True if the motor was deactivated at the position, False if
+        the process stopped part way through a move
+"""
+
+
+class PositionJournal:
+    """
+    Records the stage position in a memory-mapped file. Positions recorded
+    during motion are plain stores into the mapping so they cost next to
+    nothing. The journal is flushed to disk when it is first marked dirty at
+    the start of a move, and marked clean and flushed again once the motor
+    has stopped and been deactivated.
+
+    Args:
+        path (str): the journal file. Created if it does not exist.
+    """
+    _MAGIC = b'STGJ'
+    _VERSION = 1
+    # magic, version, clean, phase, position
+    _LAYOUT = struct.Struct('<4sBBhq')
+    _CLEAN_OFFSET = 5
+    _POSITION = struct.Struct('<q')
+    _POSITION_OFFSET = 8
+    _UNKNOWN_PHASE = -1
+
+    def __init__(self, path: str):
+        self._path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < self._LAYOUT.size:
+                os.ftruncate(fd, self._LAYOUT.size)
+            self._map = mmap.mmap(fd, self._LAYOUT.size)
+        finally:
+            os.close(fd)
+        if self.read() is None:
+            self._LAYOUT.pack_into(
+                self._map, 0, self._MAGIC, self._VERSION, False,
+                self._UNKNOWN_PHASE, 0)
+
+    def read(self) -> JournalEntry:
+        """
+        Read the last recorded state
+
+        Returns:
+            (JournalEntry): the recorded state or None if the journal file
+                was not recognised
+        """
+        magic, version, clean, phase, position = \
+            self._LAYOUT.unpack_from(self._map)
+        if magic != self._MAGIC or version != self._VERSION:
+            return None
+        return JournalEntry(
+            position,
+            None if phase == self._UNKNOWN_PHASE else phase,
+            bool(clean))
+
+    def record(self, position: int=None):
+        """
+        Mark the journal dirty and record a position reached during motion
+
+        Args:
+            position (int): the position reached or None if the position is
+                unknown eg. while homing
+        """
+        if self._map[self._CLEAN_OFFSET]:
+            # flushed once per move so that the file cannot still read clean
+            # at the old position if power is lost during the move
+            self._map[self._CLEAN_OFFSET] = 0
+            self._map.flush()
+        if position is not None:
+            self._POSITION.pack_into(
+                self._map, self._POSITION_OFFSET, position)
+
+    def commit(self, position: int, phase: int=None):
+        """
+        Record the position at which the motor was deactivated, mark the
+        journal clean and flush it to disk
+
+        Args:
+            position (int): the position index
+            phase (int): the index in the drive sequence of the coil state the
+                rotor was left in or None if unknown, which leaves the journal
+                dirty
+        """
+        self._LAYOUT.pack_into(
+            self._map, 0, self._MAGIC, self._VERSION, False,
+            self._UNKNOWN_PHASE if phase is None else phase, position)
+        # the clean flag is set last so a torn write reads as dirty
+        self._map[self._CLEAN_OFFSET] = int(phase is not None)
+        self._map.flush()
+
+    def close(self):
+        """
+        Unmap the journal file
+        """
+        self._map.close()
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._path)
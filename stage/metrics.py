@@ -0,0 +1,448 @@
+"""
+Counters and histograms of stage operations, exposed in the Prometheus text
+format. The stage, its motor and its end stop update them as they work, in
+the same places they record into a trace.
+
+Updates take no locks. Each metric keeps a separate cell for every thread
+that updates it, created on the thread's first update, and only that thread
+writes to its cell. Reading a metric sums the cells, so a scrape never
+blocks the step loop and a step never waits for a scrape. A scrape taken
+during an update may see a histogram's count and sum a single observation
+apart.
+
+Usage:
+    metrics = StageMetrics()
+    stage = Stage(factory, metrics=metrics)
+    server = MetricsServer(metrics.registry, port=9100)
+    server.start()
+"""
+import logging
+import threading
+from bisect import bisect_left
+
+_LOGGER = logging.getLogger("METRICS")
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9100
+
+# seconds, from a single short move to a full length homing
+DEFAULT_BUCKETS = (
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NS_PER_S = 1e9
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values))
+
+
+class _Metric:
+    """
+    The label handling and per-thread cells shared by the metric types
+    """
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._cells = {}
+
+    def labels(self, *values):
+        """
+        The series with the given label values, created on first use. Keep
+        the child rather than looking it up on every update.
+
+        Args:
+            values (str): a value for each of the label names, in order
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError("%s needs labels %r" % (
+                self.name, self.labelnames))
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        """
+        Returns:
+            (list): (suffix, label names, label values, value) for each
+                sample of the metric
+        """
+        if not self.labelnames:
+            return self._samples((), ())
+        return [
+            sample for values, child in sorted(self._children.items())
+            for sample in child._samples(  # pylint: disable=protected-access
+                self.labelnames, values)]
+
+    def _cell(self, size):
+        # the calling thread's cell. setdefault is atomic, so a cell is
+        # created once however threads interleave.
+        return self._cells.setdefault(threading.get_ident(), [0] * size)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _samples(self, labelnames, values):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up eg. the number of steps taken
+
+    Args:
+        name (str): the metric name
+        documentation (str): the help text
+        labelnames (tuple): the names of the labels that tell the counter's
+            series apart. A counter with labels is updated through the
+            children returned by labels.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        """
+        Add to the counter
+
+        Args:
+            amount (int or float): a non-negative amount
+        """
+        cell = self._cells.get(threading.get_ident()) or self._cell(1)
+        cell[0] += amount
+
+    @property
+    def value(self):
+        """
+        The sum of all updates
+        """
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+    def _child(self):
+        return Counter(self.name, self.documentation)
+
+    def _samples(self, labelnames, values):
+        return [('', labelnames, values, self.value)]
+
+
+class Histogram(_Metric):
+    """
+    Counts observations eg. move latencies in cumulative buckets, with their
+    sum and count
+
+    Args:
+        name (str): the metric name
+        documentation (str): the help text
+        labelnames (tuple): the names of the labels that tell the histogram's
+            series apart
+        buckets (tuple): the increasing upper bounds of the buckets. A
+            +Inf bucket is always added.
+    """
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames=(),
+            buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float):
+        """
+        Count an observation
+
+        Args:
+            value (float): the observed value
+        """
+        # a count per bucket and one for +Inf, then the sum
+        cell = self._cells.get(threading.get_ident()) \
+            or self._cell(len(self.buckets) + 2)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @property
+    def count(self) -> int:
+        """
+        The number of observations
+        """
+        return sum(sum(cell[:-1]) for cell in list(self._cells.values()))
+
+    @property
+    def sum(self) -> float:
+        """
+        The sum of the observations
+        """
+        return sum(cell[-1] for cell in list(self._cells.values()))
+
+    def _child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _samples(self, labelnames, values):
+        totals = [0] * (len(self.buckets) + 2)
+        for cell in list(self._cells.values()):
+            for idx, value in enumerate(cell):
+                totals[idx] += value
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), totals):
+            cumulative += count
+            samples.append((
+                '_bucket', labelnames + ('le',),
+                values + (_format_value(float(bound)),), cumulative))
+        samples.append(('_sum', labelnames, values, totals[-1]))
+        samples.append(('_count', labelnames, values, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    The metrics to be exposed together
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        """
+        Register a Counter. See Counter.
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames=(),
+            buckets=DEFAULT_BUCKETS):
+        """
+        Register a Histogram. See Histogram.
+        """
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets))
+
+    def register(self, metric):
+        """
+        Add a metric to the registry
+
+        Raises:
+            ValueError: if a metric with the same name is already registered
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(
+                    "Metric %s is already registered" % metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        """
+        The registered metric with the given name or None
+        """
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """
+        The current values of the metrics in the Prometheus text format
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (
+                metric.name,
+                metric.documentation.replace('\\', r'\\').replace(
+                    '\n', r'\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for suffix, labelnames, values, value in metric.samples():
+                lines.append('%s%s%s %s' % (
+                    metric.name, suffix,
+                    _format_labels(labelnames, values),
+                    _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class StageMetrics:
+    """
+    The metrics of a stage, its motor and its end stop, registered on a
+    registry. Pass to the stage to have them updated.
+
+    Args:
+        registry (MetricsRegistry): registers the metrics. Defaults to a new
+            registry.
+        buckets (tuple): the bucket bounds in seconds of the move latency
+            and homing duration histograms
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+            self,
+            registry: MetricsRegistry=None,
+            buckets=DEFAULT_BUCKETS):
+        self.registry = registry or MetricsRegistry()
+        steps = self.registry.counter(
+            'stage_motor_steps_total',
+            "Phases stepped by the motor in complete cycles",
+            ('direction',))
+        motor_moves = self.registry.counter(
+            'stage_motor_moves_total',
+            "Moves run by the motor",
+            ('direction',))
+        self.forward_steps = steps.labels('forward')
+        self.backward_steps = steps.labels('backward')
+        self.forward_moves = motor_moves.labels('forward')
+        self.backward_moves = motor_moves.labels('backward')
+        self.motion_seconds = self.registry.counter(
+            'stage_motor_motion_seconds_total',
+            "Time the motor spent running moves")
+        self.energised_seconds = self.registry.counter(
+            'stage_motor_coils_energised_seconds_total',
+            "Time the coils were held energised, from the start of a move "
+            "until the motor was deactivated")
+        self.end_stop_triggers = self.registry.counter(
+            'stage_end_stop_triggers_total',
+            "Times the end stop was triggered")
+        self.moves = self.registry.counter(
+            'stage_moves_total',
+            "Requested moves completed by the stage")
+        self.move_latency = self.registry.histogram(
+            'stage_move_latency_seconds',
+            "Time from requesting a move to the stage reaching its position",
+            buckets=buckets)
+        self.homings = self.registry.counter(
+            'stage_homings_total',
+            "Times the stage found its home position")
+        self.homing_duration = self.registry.histogram(
+            'stage_homing_duration_seconds',
+            "Time taken to home the stage",
+            buckets=buckets)
+
+    def motor_moved(self, forward: bool, steps: int, elapsed_ns: int):
+        """
+        Count a move run by the motor
+
+        Args:
+            forward (bool): the direction of the move
+            steps (int): the phases stepped
+            elapsed_ns (int): the duration of the move
+        """
+        if forward:
+            self.forward_steps.inc(steps)
+            self.forward_moves.inc()
+        else:
+            self.backward_steps.inc(steps)
+            self.backward_moves.inc()
+        self.motion_seconds.inc(elapsed_ns / _NS_PER_S)
+
+    def coils_released(self, energised_ns: int):
+        """
+        Count the time the coils were held energised before being deactivated
+        """
+        self.energised_seconds.inc(energised_ns / _NS_PER_S)
+
+    def move_completed(self, latency_ns: int):
+        """
+        Count a requested move that reached its position
+        """
+        self.moves.inc()
+        self.move_latency.observe(latency_ns / _NS_PER_S)
+
+    def homed(self, duration: float):
+        """
+        Count a successful homing that took duration seconds
+        """
+        self.homings.inc()
+        self.homing_duration.observe(duration)
+
+
+def _handler_class():
+    # http.server takes longer to import than the rest of the stage, so it is
+    # imported only once metrics are served
+    # pylint: disable=import-outside-toplevel
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = self.server.registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            _LOGGER.debug(format, *args)
+
+    return MetricsHandler
+
+
+class MetricsServer:
+    """
+    Serves the metrics of a registry over HTTP at /metrics on a background
+    thread
+
+    Args:
+        registry (MetricsRegistry): the metrics to serve
+        host (str): the address to listen on. Defaults to the loopback
+            interface only.
+        port (int): the port to listen on. 0 picks a free port.
+    """
+    def __init__(
+            self,
+            registry: MetricsRegistry,
+            host: str=DEFAULT_HOST,
+            port: int=DEFAULT_PORT):
+        # pylint: disable=import-outside-toplevel
+        from http.server import ThreadingHTTPServer
+        self._server = ThreadingHTTPServer((host, port), _handler_class())
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        The (host, port) the server is listening on
+        """
+        return self._server.server_address[:2]
+
+    def start(self):
+        """
+        Start serving on a daemon thread
+        """
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        _LOGGER.info("Serving metrics on http://%s:%d/metrics", *self.address)
+
+    def close(self):
+        """
+        Stop serving and close the socket
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
@@ -1,29 +1,72 @@
 from collections import namedtuple
 
 from stage.gpio import interface as iointerface
+from stage.trace import COIL_WRITE
 
 _LABELS = ['a1', 'b1', 'a2', 'b2']
 State = namedtuple('State', _LABELS)
 Pins = namedtuple("Pins", _LABELS)
 
 
+def to_mask(state):
+    """
+    Convert a coil state into a bitmask with bit i set if coil i is active
+
+    Args:
+        state (State): the activation of each coil
+
+    Returns:
+        (int): the bitmask for the state
+    """
+    return sum(1 << bit for bit, active in enumerate(state) if active)
+
+
 class Coils:
     """
     Manages the coils needed to run a stepper motor
+
+    Args:
+        outputs: the iointerface.OutputGroup driving the coils in the order
+            a1, b1, a2, b2, or the four iointerface.OutputInterface outputs
+            themselves in that order, which are then written one at a time
+
+    Attributes:
+        trace (TraceBuffer): records every write when set
     """
     def __init__(self, *outputs):
         self._state = None
-        self._outputs = outputs
+        if len(outputs) == 1 \
+                and isinstance(outputs[0], iointerface.OutputGroup):
+            self._group = outputs[0]
+        else:
+            self._group = iointerface.ChannelGroup(*outputs)
+        self.trace = None
 
     @property
     def coils(self):
-        return self._outputs
+        return self._group.outputs
+
+    @property
+    def group(self):
+        """
+        The output group driving the coils
+        """
+        return self._group
 
     def deactivate(self):
-        for output in self._outputs:
-            output.deactivate()
+        self._group.write(0)
 
     def set_state(self, state):
         self._state = state
-        for output, active in zip(self.coils, state):
-            output.activate() if active else output.deactivate()
+        self._group.write(to_mask(state))
+
+    def write(self, mask):
+        """
+        Set the coils from a bitmask with bit i set if coil i is to be active
+
+        Args:
+            mask (int): the required coil activation
+        """
+        if self.trace is not None:
+            self.trace.record(COIL_WRITE, mask)
+        self._group.write(mask)
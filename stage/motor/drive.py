@@ -1,5 +1,50 @@
+from collections import namedtuple
+from functools import lru_cache
+
 from stage.motor import coil
 
+Phase = namedtuple('Phase', ['mask', 'dwell'])
+DriveTable = namedtuple('DriveTable', ['forward', 'backward', 'phases'])
+DriveTable.__doc__ = """
+A drive scheme compiled for the stepper hot loop
+
+Attributes:
+    forward (tuple): Phase(mask, dwell) entries for one forward cycle. Runs of
+        identical consecutive states are merged into a single write that
+        dwells for the given number of phases.
+    backward (tuple): as forward but for one backward cycle
+    phases (int): the number of phases in one cycle of the drive scheme
+"""
+
+
+def _run_length_encode(sequence):
+    table = []
+    for state in sequence:
+        mask = coil.to_mask(state)
+        if table and table[-1].mask == mask:
+            table[-1] = Phase(mask, table[-1].dwell + 1)
+        else:
+            table.append(Phase(mask, 1))
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def compile_scheme(scheme) -> DriveTable:
+    """
+    Compile a drive scheme into bitmask tables for both directions. The result
+    is cached so each scheme is only compiled once.
+
+    Args:
+        scheme (DriveScheme): the drive scheme class to compile
+
+    Returns:
+        (DriveTable): the compiled tables
+    """
+    return DriveTable(
+        forward=_run_length_encode(scheme.sequence),
+        backward=_run_length_encode(reversed(scheme.sequence)),
+        phases=len(scheme.sequence))
+
 
 class DriveScheme:
     """
@@ -0,0 +1,179 @@
+"""
+Low overhead instrumentation of the stepper phase timing. The intervals
+between successive coil writes are recorded into a fixed size log-linear
+histogram in the style of HdrHistogram, so recording is a handful of integer
+operations and never allocates.
+"""
+from collections import namedtuple
+
+JitterReport = namedtuple(
+    'JitterReport', ['count', 'p50', 'p99', 'max', 'overruns'])
+JitterReport.__doc__ = """
+Distribution of the intervals between coil writes over a move
+
+Attributes:
+    count (int): the number of intervals recorded
+    p50 (float): the median interval in seconds
+    p99 (float): the 99th percentile interval in seconds
+    max (float): the longest interval in seconds
+    overruns (int): the number of intervals that exceeded the planned phase
+        delay by more than the tolerance
+"""
+
+_NS_PER_S = 1000000000
+
+
+class LatencyHistogram:
+    """
+    A fixed size histogram of nanosecond values. Values below 2**sub_bits are
+    counted exactly; above that each power of two range is split into
+    2**(sub_bits - 1) linear buckets, giving a relative precision of
+    2**(1 - sub_bits).
+
+    Args:
+        sub_bits (int): controls the precision and size of the histogram
+        max_bits (int): values of 2**max_bits ns or more are counted in the
+            last bucket
+    """
+    def __init__(self, sub_bits: int=6, max_bits: int=40):
+        self._sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self._half = self._sub >> 1
+        self._counts = [0] * self._index(1 << max_bits)
+        self._last = len(self._counts) - 1
+        self._total = 0
+        self._max = 0
+
+    @property
+    def count(self) -> int:
+        """
+        The number of values recorded
+        """
+        return self._total
+
+    @property
+    def max(self) -> int:
+        """
+        The largest value recorded
+        """
+        return self._max
+
+    def reset(self):
+        """
+        Forget all recorded values
+        """
+        counts = self._counts
+        for idx in range(len(counts)):
+            counts[idx] = 0
+        self._total = 0
+        self._max = 0
+
+    def record(self, value: int):
+        """
+        Count a value
+
+        Args:
+            value (int): a non-negative value in nanoseconds
+        """
+        idx = self._index(value)
+        self._counts[idx if idx < self._last else self._last] += 1
+        self._total += 1
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, percent: float) -> int:
+        """
+        The value below which the given percentage of recorded values fall
+
+        Args:
+            percent (float): between 0 and 100
+
+        Returns:
+            (int): the midpoint of the bucket holding the percentile, the
+                maximum if that is the overflow bucket or 0 if nothing has
+                been recorded
+        """
+        if not self._total:
+            return 0
+        rank = max(1, round(self._total * percent / 100))
+        seen = 0
+        for idx, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                if idx == self._last:
+                    return self._max
+                return min(self._midpoint(idx), self._max)
+        return self._max
+
+    def _index(self, value):
+        if value < self._sub:
+            return value
+        shift = value.bit_length() - self._sub_bits
+        return shift * self._half + (value >> shift)
+
+    def _midpoint(self, idx):
+        if idx < self._sub:
+            return idx
+        shift = (idx - self._sub) // self._half + 1
+        return ((idx - shift * self._half) << shift) + (1 << (shift - 1))
+
+
+class PhaseJitter:
+    """
+    Records the interval between successive coil writes during a move and
+    counts overruns - intervals that exceed the planned delay of the phase by
+    more than the tolerance.
+
+    Args:
+        clock (callable): returns the current time in nanoseconds
+        tolerance_us (float): allowed lateness of a phase in microseconds
+            before it counts as an overrun
+    """
+    DEFAULT_TOLERANCE_US = 500
+
+    def __init__(self, clock, tolerance_us: float=DEFAULT_TOLERANCE_US):
+        self._clock = clock
+        self._tolerance = int(tolerance_us * 1000)
+        self._histogram = LatencyHistogram()
+        self._previous = None
+        self._allowed = 0
+        self._overruns = 0
+
+    def start(self):
+        """
+        Begin recording a new move
+        """
+        self._histogram.reset()
+        self._previous = None
+        self._overruns = 0
+
+    def mark(self, delay: float):
+        """
+        Record a coil write
+
+        Args:
+            delay (float): the planned delay in seconds until the next write
+        """
+        now = self._clock()
+        if self._previous is not None:
+            interval = now - self._previous
+            self._histogram.record(interval)
+            if interval > self._allowed:
+                self._overruns += 1
+        self._previous = now
+        self._allowed = int(delay * _NS_PER_S) + self._tolerance
+
+    def report(self) -> JitterReport:
+        """
+        The interval distribution of the most recent move
+
+        Returns:
+            (JitterReport): percentiles and overruns of the move
+        """
+        histogram = self._histogram
+        return JitterReport(
+            count=histogram.count,
+            p50=histogram.percentile(50) / _NS_PER_S,
+            p99=histogram.percentile(99) / _NS_PER_S,
+            max=histogram.max / _NS_PER_S,
+            overruns=self._overruns)
@@ -1,20 +1,120 @@
-import logging
+import math
+from itertools import islice
 
-_LOGGER = logging.getLogger("MOCK")
+from stage.motor.profile import ConstantProfile, MoveControl
+from stage.motor.timing import DeadlineScheduler
+from stage.trace import MOVE_BACKWARD, MOVE_DONE, MOVE_FORWARD
 
 class MockMotor:
+    jitter = None
+    phase = 0
+    trace = None
+    metrics = None
 
-    def __init__(self, fake_track):
+    def __init__(
+            self,
+            fake_track,
+            clock=None,
+            profile=None,
+            phases_per_cycle: int=1):
         self.deactivated = False
+        self.profile = profile or ConstantProfile.from_delay(0)
+        self.phases_per_cycle = phases_per_cycle
+        self.last_profile = None
+        self.last_levels = None
         self._fake_track = fake_track
+        self._scheduler = DeadlineScheduler(clock)
+        self._energised_ns = None
 
-    def forward(self, steps: int):
-        _LOGGER.info("Mock motor forward %d steps", steps)
-        self._fake_track.position += steps
+    @property
+    def timing(self):
+        return self._scheduler.report()
 
-    def backward(self, steps: int):
-        _LOGGER.info("Mock motor backward %d steps", steps)
-        self._fake_track.position -= steps
+    def forward(self, steps: int, profile=None, stop=None, on_cycle=None,
+                entry_level=0, exit_level=0, halt=None, control=None):
+        self.last_profile = profile
+        self.last_levels = (entry_level, exit_level)
+        return self._traced_move(
+            True, steps, 1, profile, stop, on_cycle, halt, control)
+
+    def backward(self, steps: int, profile=None, stop=None, on_cycle=None,
+                 entry_level=0, exit_level=0, halt=None, control=None):
+        self.last_profile = profile
+        self.last_levels = (entry_level, exit_level)
+        return self._traced_move(
+            False, steps, -1, profile, stop, on_cycle, halt, control)
+
+    def phase_stepper(self, forward: bool=True):
+        direction = 1 if forward else -1
+        phase = 0
+
+        def advance():
+            nonlocal phase
+            phase = (phase + 1) % self.phases_per_cycle
+            if phase:
+                return False
+            self._fake_track.position += direction
+            return True
+
+        return advance
 
     def deactivate(self):
         self.deactivated = True
+        if self.metrics is not None and self._energised_ns is not None:
+            self.metrics.coils_released(
+                self._scheduler.timer.now_ns() - self._energised_ns)
+        self._energised_ns = None
+
+    def begin_move(self, forward: bool, steps: int):
+        if self.trace is not None:
+            self.trace.record(
+                MOVE_FORWARD if forward else MOVE_BACKWARD, steps)
+        if self.metrics is None:
+            return None
+        start_ns = self._scheduler.timer.now_ns()
+        if self._energised_ns is None:
+            self._energised_ns = start_ns
+        return start_ns
+
+    def end_move(self, forward: bool, steps: int, start_ns):
+        if self.trace is not None:
+            self.trace.record(MOVE_DONE, steps)
+        if start_ns is not None:
+            self.metrics.motor_moved(
+                forward,
+                steps * self.phases_per_cycle,
+                self._scheduler.timer.now_ns() - start_ns)
+
+    # pylint: disable=too-many-arguments
+    def _traced_move(self, forward, steps, *args):
+        if self.trace is None and self.metrics is None:
+            return self._move(steps, *args)
+        start_ns = self.begin_move(forward, steps)
+        done = self._move(steps, *args)
+        self.end_move(forward, done, start_ns)
+        return done
+
+    def _move(self, steps, direction, profile, stop, on_cycle, halt, control):
+        profile = profile or self.profile
+        if control is None and stop is not None:
+            control = MoveControl(self.last_levels[1])
+        delays = profile.delays(
+            math.ceil(steps) * self.phases_per_cycle,
+            *self.last_levels,
+            control=control)
+        wait = self._scheduler.wait
+        done = 0
+        self._scheduler.start()
+        while done < steps:
+            if stop is not None and stop.is_set():
+                control.brake()
+                if control.stopped:
+                    break
+            if halt is not None and halt.is_set():
+                break
+            wait(sum(islice(delays, self.phases_per_cycle)))
+            self._fake_track.position += direction
+            done += 1
+            if on_cycle is not None:
+                on_cycle()
+        return done
@@ -0,0 +1,227 @@
+"""
+Physical model of a 28BYJ-48 geared unipolar stepper motor driving a load.
+The model is driven by the coil bitmasks written to the motor and integrates
+the rotor dynamics between writes, so that step rates and profiles can be
+checked for lost steps before they are used on hardware.
+
+Angles are electrical - one electrical revolution of the rotor is one cycle of
+the drive sequence, ie. one stage position.
+"""
+import math
+from collections import namedtuple
+
+MotorParameters = namedtuple('MotorParameters', [
+    'holding_torque',
+    'rotor_inertia',
+    'load_inertia',
+    'gear_ratio',
+    'pole_pairs',
+    'max_rate',
+    'damping',
+    'friction_torque',
+])
+MotorParameters.__doc__ = """
+Physical parameters of the motor and its load. All torques and inertias are
+referred to the motor shaft except the load inertia which is at the output.
+
+Attributes:
+    holding_torque (float): N.m with a single coil energised
+    rotor_inertia (float): kg.m^2
+    load_inertia (float): kg.m^2 at the gearbox output
+    gear_ratio (float): motor shaft revolutions per output revolution
+    pole_pairs (int): electrical revolutions per mechanical revolution of the
+        motor shaft
+    max_rate (float): electrical revolutions per second at which the
+        available torque falls to zero due to winding inductance and back EMF
+    damping (float): viscous damping in N.m.s/rad
+    friction_torque (float): Coulomb friction in N.m, including the gearbox
+"""
+
+# Approximate values for a 5V 28BYJ-48 with a light stage carriage
+BYJ48 = MotorParameters(
+    holding_torque=6e-4,
+    rotor_inertia=1e-7,
+    load_inertia=2e-4,
+    gear_ratio=63.68,
+    pole_pairs=8,
+    max_rate=180.0,
+    damping=5e-6,
+    friction_torque=5e-5,
+)
+
+_TWO_PI = 2 * math.pi
+# electrical angle of the field produced by each coil in the order a1, b1,
+# a2, b2
+_COIL_ANGLES = (0.0, math.pi / 2, math.pi, 3 * math.pi / 2)
+
+
+def _field(mask):
+    x = sum(math.cos(angle) for bit, angle in enumerate(_COIL_ANGLES)
+            if mask >> bit & 1)
+    y = sum(math.sin(angle) for bit, angle in enumerate(_COIL_ANGLES)
+            if mask >> bit & 1)
+    strength = math.hypot(x, y)
+    if strength < 1e-9:
+        return 0.0, 0.0
+    return math.atan2(y, x), strength
+
+
+def _wrap(angle):
+    """Wrap an angle into [-pi, pi)"""
+    return (angle + math.pi) % _TWO_PI - math.pi
+
+
+class RotorModel:
+    """
+    Integrates the rotor's equation of motion between coil writes. The rotor
+    is pulled towards the field angle with a torque proportional to the sine
+    of the lag between them, reduced linearly with speed. If the rotor falls
+    more than half an electrical revolution behind the field it slips to the
+    next equilibrium and a position is lost.
+
+    Args:
+        params (MotorParameters): the motor and load parameters
+        position (float): the initial rotor position in stage positions
+        limits (tuple): (lower, upper) positions of the mechanical end stops
+            of the track or None for unlimited travel
+        time_step (float): integration step in seconds
+    """
+    _SETTLED_ANGLE = 1e-3
+    _SETTLED_RATE = 5e-2
+
+    def __init__(
+            self,
+            params: MotorParameters=BYJ48,
+            position: float=0.0,
+            limits=None,
+            time_step: float=50e-6):
+        self._params = params
+        inertia = params.rotor_inertia \
+            + params.load_inertia / params.gear_ratio ** 2
+        # convert shaft torques to electrical angular accelerations
+        self._gain = params.pole_pairs / inertia
+        self._max_speed = params.max_rate * _TWO_PI
+        self._angle = position * _TWO_PI
+        self._speed = 0.0
+        self._limits = None if limits is None \
+            else tuple(limit * _TWO_PI for limit in limits)
+        self._time_step = time_step
+        self._field_angle = 0.0
+        self._strength = 0.0
+        self._commanded = None
+        self._last_field = None
+        self._time = None
+
+    @property
+    def position(self) -> float:
+        """
+        The true position of the rotor in stage positions
+        """
+        return self._angle / _TWO_PI
+
+    @property
+    def speed(self) -> float:
+        """
+        The rotor speed in stage positions per second
+        """
+        return self._speed / _TWO_PI
+
+    @property
+    def commanded_position(self) -> float:
+        """
+        The position the coil sequence has commanded in stage positions - where
+        the rotor would be had no steps been lost
+        """
+        if self._commanded is None:
+            return self.position
+        return self._commanded / _TWO_PI
+
+    @property
+    def lost_positions(self) -> float:
+        """
+        How far the rotor is behind the commanded position in stage positions
+        """
+        return self.commanded_position - self.position
+
+    def write(self, mask: int, time: float):
+        """
+        Change the coil excitation at the given time. The rotor is integrated
+        up to that time under the previous excitation first.
+
+        Args:
+            mask (int): the coil bitmask with bit i set for coil i energised
+            time (float): the time of the write in seconds
+        """
+        self.advance(time)
+        field_angle, strength = _field(mask)
+        if strength:
+            if self._commanded is None:
+                self._commanded = self._angle + _wrap(field_angle - self._angle)
+            elif self._last_field is not None:
+                self._commanded += _wrap(field_angle - self._last_field)
+            self._last_field = field_angle
+        self._field_angle = field_angle
+        self._strength = strength
+
+    def advance(self, time: float):
+        """
+        Integrate the motion of the rotor up to the given time
+
+        Args:
+            time (float): the time in seconds
+        """
+        if self._time is None or time <= self._time:
+            self._time = time if self._time is None else self._time
+            return
+        remaining = time - self._time
+        self._time = time
+        params = self._params
+        step = self._time_step
+        gain = self._gain
+        # damping is specified against mechanical shaft speed
+        damping = params.damping / params.pole_pairs
+        while remaining > 0:
+            lag = _wrap(self._angle - self._field_angle)
+            if self._settled(lag):
+                self._speed = 0.0
+                break
+            dt = step if remaining > step else remaining
+            remaining -= dt
+            speed = self._speed
+            available = max(0.0, 1 - abs(speed) / self._max_speed)
+            torque = -params.holding_torque * self._strength * available \
+                * math.sin(lag) - damping * speed
+            if speed:
+                torque -= math.copysign(params.friction_torque, speed)
+            elif abs(torque) <= params.friction_torque:
+                continue
+            else:
+                torque -= math.copysign(params.friction_torque, torque)
+            self._speed += gain * torque * dt
+            self._angle += self._speed * dt
+            self._limit_travel()
+
+    def _settled(self, lag):
+        if abs(self._speed) > self._SETTLED_RATE:
+            return False
+        if not self._strength:
+            return True
+        return abs(lag) < self._SETTLED_ANGLE or self._pinned(lag)
+
+    def _pinned(self, lag):
+        # held against a limit by the field rather than pulled away from it
+        if self._limits is None:
+            return False
+        lower, upper = self._limits
+        pull = -math.sin(lag)
+        return (self._angle <= lower and pull <= 0) \
+            or (self._angle >= upper and pull >= 0)
+
+    def _limit_travel(self):
+        if self._limits is None:
+            return
+        lower, upper = self._limits
+        if self._angle < lower:
+            self._angle, self._speed = lower, 0.0
+        elif self._angle > upper:
+            self._angle, self._speed = upper, 0.0
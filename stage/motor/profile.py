@@ -0,0 +1,328 @@
+"""
+Motion profiles that plan the delay for each phase of a move. The motor can
+only be started reliably at a low step rate but, once moving, can be driven
+considerably faster. A profile ramps the rate up from its start rate to its
+cruise rate and back down again at the end of the move.
+
+Rates are given in phases per second and accelerations in phases per second
+squared.
+"""
+import abc
+import json
+import math
+
+
+class MotionProfile(abc.ABC):
+    """
+    Plans the per-phase delays for a move. Concrete profiles provide the
+    acceleration ramp from the start rate to the cruise rate - the ramp is
+    mirrored for deceleration and truncated symmetrically for moves that are
+    too short to reach the cruise rate.
+
+    Args:
+        cruise_rate (float): the rate in phases per second once up to speed
+    """
+    name = None
+
+    def __init__(self, cruise_rate: float):
+        if cruise_rate <= 0:
+            raise ValueError("Rates must be positive, got %r" % cruise_rate)
+        self._cruise_rate = cruise_rate
+        self._ramp = None
+
+    @property
+    def cruise_rate(self):
+        """
+        The rate in phases per second once the motor is up to speed
+        """
+        return self._cruise_rate
+
+    @property
+    def ramp(self):
+        """
+        The delays in seconds of the phases needed to accelerate from the start
+        rate to the cruise rate
+
+        Returns:
+            (tuple): phase delays in seconds in order of increasing rate
+        """
+        if self._ramp is None:
+            self._ramp = tuple(self._build_ramp())
+        return self._ramp
+
+    def delays(
+            self,
+            phases: int,
+            entry_level: int=0,
+            exit_level: int=0,
+            control=None):
+        """
+        Plan a move. Speeds are expressed as levels - the index into the ramp
+        of the phase delay, with level 0 being the start rate and any level
+        beyond the end of the ramp being the cruise rate. Each phase may be at
+        most one level faster than the one before, and at most one level
+        slower than the one after, so that moves can be chained without
+        stopping.
+
+        Args:
+            phases (int): the number of phases in the move
+            entry_level (int): the level of the first phase
+            exit_level (int): the highest level allowed for the last phase
+            control (MoveControl): steers the move while it runs. Its exit
+                level is used in place of exit_level.
+
+        Returns:
+            (generator): the delay in seconds after each phase
+        """
+        if control is not None:
+            control.level = entry_level - 1
+            return self._controlled_delays(phases, entry_level, control)
+        return self._planned_delays(phases, entry_level, exit_level)
+
+    def duration(self, phases: int) -> float:
+        """
+        The planned duration of a move
+
+        Args:
+            phases (int): the number of phases in the move
+
+        Returns:
+            (float): the planned duration in seconds
+        """
+        return sum(self.delays(phases))
+
+    def _planned_delays(self, phases, entry_level, exit_level):
+        ramp = self.ramp
+        top = len(ramp)
+        cruise = 1 / self._cruise_rate
+        if not top:
+            for _ in range(phases):
+                yield cruise
+            return
+        last = phases - 1
+        for phase in range(phases):
+            level = min(entry_level + phase, exit_level + last - phase, top)
+            yield ramp[level] if level < top else cruise
+
+    def _controlled_delays(self, phases, entry_level, control):
+        # as _planned_delays, but the exit level may drop and braking may
+        # start at any phase. Either way the level falls by at most one a
+        # phase.
+        ramp = self.ramp
+        top = len(ramp)
+        cruise = 1 / self._cruise_rate
+        last = phases - 1
+        level = entry_level - 1
+        for phase in range(phases):
+            if control.braking:
+                planned = 0
+            else:
+                planned = min(
+                    entry_level + phase,
+                    control.exit_level + last - phase,
+                    top)
+            level = min(max(planned, level - 1), level + 1, top)
+            control.level = level
+            yield ramp[level] if level < top else cruise
+
+    @abc.abstractmethod
+    def _build_ramp(self):
+        """Yield the phase delays while accelerating up to cruise rate"""
+
+    def __repr__(self):
+        return "%s(cruise_rate=%r)" % (type(self).__name__, self._cruise_rate)
+
+
+class MoveControl:
+    """
+    Steers a move planned by MotionProfile.delays while it runs. The exit
+    level may be lowered, eg. when the move that was to follow is cancelled,
+    and the move may be braked to the start rate. The level still falls by
+    at most one a phase, so the rotor keeps up.
+
+    Args:
+        exit_level (int): the highest level allowed for the last phase
+    """
+    def __init__(self, exit_level: int=0):
+        self.exit_level = exit_level
+        self.braking = False
+        # the level of the last phase planned, below 0 when at rest
+        self.level = -1
+
+    @property
+    def stopped(self) -> bool:
+        """
+        Whether the last phase was at the start rate, or the move is at
+        rest, so that it can end without losing steps
+        """
+        return self.level <= 0
+
+    def lower_exit_level(self, exit_level: int):
+        """
+        Lower the highest level allowed for the last phase. Raising it is
+        ignored since the move may already be too close to its end.
+        """
+        self.exit_level = min(self.exit_level, exit_level)
+
+    def brake(self):
+        """
+        Slow the rest of the move by a level a phase down to the start rate
+        """
+        self.braking = True
+
+
+class ConstantProfile(MotionProfile):
+    """
+    Every phase of the move runs at the same rate
+
+    Args:
+        rate (float): the rate in phases per second. May be infinite for no
+            delay at all between phases.
+    """
+    name = "Constant"
+
+    @classmethod
+    def from_delay(cls, delay: float):
+        """
+        Create a constant profile with the given delay between phases
+
+        Args:
+            delay (float): the delay between phases in seconds
+        """
+        return cls(1 / delay if delay > 0 else math.inf)
+
+    def _build_ramp(self):
+        return ()
+
+
+class _RampedProfile(MotionProfile):
+    # pylint: disable=abstract-method
+    def __init__(
+            self,
+            start_rate: float,
+            cruise_rate: float,
+            acceleration: float):
+        super().__init__(cruise_rate)
+        if start_rate <= 0 or acceleration <= 0:
+            raise ValueError(
+                "Rates and acceleration must be positive, got %r, %r"
+                % (start_rate, acceleration))
+        self._start_rate = min(start_rate, cruise_rate)
+        self._acceleration = acceleration
+
+    @property
+    def start_rate(self):
+        """
+        The rate in phases per second that the motor starts and stops at
+        """
+        return self._start_rate
+
+    @property
+    def acceleration(self):
+        """
+        The (peak) acceleration in phases per second squared
+        """
+        return self._acceleration
+
+    def __repr__(self):
+        return "%s(start_rate=%r, cruise_rate=%r, acceleration=%r)" % (
+            type(self).__name__,
+            self._start_rate,
+            self._cruise_rate,
+            self._acceleration)
+
+
+class TrapezoidalProfile(_RampedProfile):
+    """
+    Constant acceleration from the start rate to the cruise rate
+
+    Args:
+        start_rate (float): the rate in phases per second to start and stop at
+        cruise_rate (float): the rate in phases per second once up to speed
+        acceleration (float): in phases per second squared
+    """
+    name = "Trapezoidal"
+
+    def _build_ramp(self):
+        # v^2 = u^2 + 2as with s counted in phases
+        phase = 0
+        rate = self._start_rate
+        while rate < self._cruise_rate:
+            yield 1 / rate
+            phase += 1
+            rate = math.sqrt(
+                self._start_rate ** 2 + 2 * self._acceleration * phase)
+
+
+class SCurveProfile(_RampedProfile):
+    """
+    Jerk limited acceleration from the start rate to the cruise rate. The
+    rate follows a raised cosine in time so that acceleration builds up and
+    falls away smoothly, peaking at the given acceleration halfway up the ramp.
+
+    Args:
+        start_rate (float): the rate in phases per second to start and stop at
+        cruise_rate (float): the rate in phases per second once up to speed
+        acceleration (float): the peak acceleration in phases per second
+            squared
+    """
+    name = "S-Curve"
+
+    def _build_ramp(self):
+        span = self._cruise_rate - self._start_rate
+        ramp_time = math.pi * span / (2 * self._acceleration)
+        elapsed = 0.0
+        rate = self._start_rate
+        while elapsed < ramp_time:
+            yield 1 / rate
+            elapsed += 1 / rate
+            rate = self._start_rate + span * (
+                1 - math.cos(math.pi * min(elapsed / ramp_time, 1))) / 2
+
+
+AVAILABLE_PROFILES = {
+    profile.name: profile for profile
+    in (ConstantProfile, TrapezoidalProfile, SCurveProfile)}
+
+
+def save_calibration(path: str, calibration: dict):
+    """
+    Save calibrated ramped profiles for each drive scheme as JSON
+
+    Args:
+        path (str): the file to write
+        calibration (dict): maps drive scheme name to a ramped profile eg.
+            TrapezoidalProfile
+    """
+    data = {
+        scheme: {
+            'type': profile.name,
+            'start_rate': profile.start_rate,
+            'cruise_rate': profile.cruise_rate,
+            'acceleration': profile.acceleration,
+        }
+        for scheme, profile in calibration.items()}
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+
+
+def load_calibration(path: str, drive_scheme: str) -> MotionProfile:
+    """
+    Load the calibrated profile for a drive scheme saved with save_calibration
+
+    Args:
+        path (str): the file to read
+        drive_scheme (str): the name of the drive scheme
+
+    Returns:
+        (MotionProfile): the calibrated profile
+
+    Raises:
+        KeyError: if the file has no calibration for the drive scheme
+    """
+    with open(path, encoding='utf-8') as calibration:
+        data = json.load(calibration)[drive_scheme]
+    return AVAILABLE_PROFILES[data['type']](
+        start_rate=data['start_rate'],
+        cruise_rate=data['cruise_rate'],
+        acceleration=data['acceleration'])
@@ -1,10 +1,19 @@
+import threading
+from itertools import islice
 from logging import getLogger
-from time import sleep
 
 from stage.motor import coil
 from stage.motor import drive
+from stage.metrics import StageMetrics
+from stage.motor.jitter import JitterReport, PhaseJitter
+from stage.motor.profile import ConstantProfile, MotionProfile, MoveControl
+from stage.motor.timing import DeadlineScheduler, HybridTimer, TimingReport
+from stage.trace import (
+    COILS_OFF, MOVE_BACKWARD, MOVE_DONE, MOVE_FORWARD, TraceBuffer)
 
 _LOGGER = getLogger("MOTOR")
+# stands in for a halt flag that is never raised
+_NEVER = threading.Event()
 
 
 class UnipolarStepperMotor:
@@ -21,24 +30,53 @@ class UnipolarStepperMotor:
         drive_scheme (linearstage.motor.DriveScheme): The drive scheme for the
             coils in the motor that provides the sequence of states to be
             passed to the coils when a step is requested.
-        ms_delay (int): The delay between setting states of the coils in the
-            motor to allow the rotor to move in response to changing excitation.
+        ms_delay (float): The delay between setting states of the coils in
+            the motor to allow the rotor to move in response to changing
+            excitation.
+        us_delay (float): The same delay in microseconds for sub-millisecond
+            timing. Takes precedence over ms_delay if given.
+        profile (linearstage.motor.profile.MotionProfile): The default motion
+            profile used to plan moves. Defaults to a constant profile running
+            at ms_delay.
+        timer (HybridTimer, SleepTimer or VirtualClock): waits for each phase
+            deadline. Defaults to a HybridTimer - its spin_us trades CPU time
+            for timing precision.
 
     Attributes:
-        ms_delay (int): ms delay between steps in the drive sequence
+        ms_delay (float): ms delay between steps in the drive sequence
         drive_scheme (str): name of the motor drive scheme
+        profile (MotionProfile): the default motion profile
+        trace (TraceBuffer): records moves and coil writes when set
+        metrics (StageMetrics): counts steps, moves, time in motion and coil
+            energised time when set
     """
     def __init__(
             self,
             coils: coil.Coils,
             drive_scheme: str=drive.HalfStepDriveScheme.name,
-            ms_delay: int=None):
+            ms_delay: float=None,
+            profile: MotionProfile=None,
+            us_delay: float=None,
+            timer=None):
         self._coils = coils
+        if us_delay is not None:
+            ms_delay = us_delay / 1000
         self._delay = ms_delay if ms_delay is not None else self._MS_DELAY
         self._drive_scheme = self._get_drive_scheme_obj(drive_scheme)
+        self._table = drive.compile_scheme(self._drive_scheme)
+        self._profile = profile or ConstantProfile.from_delay(
+            self._delay / 1000)
+        self._scheduler = DeadlineScheduler(timer or HybridTimer())
+        self._jitter = None
+        self._trace = None
+        self._metrics = None
+        # when the coils were last energised by a move, while metrics are set
+        self._energised_ns = None
+        self._last_mask = None
         _LOGGER.info(
-            "Instantiated with coils: %r, delay: %d, drive_scheme: %s",
-            coils, self._delay, self._drive_scheme.name)
+            "Instantiated with coils: %r, delay: %gms, drive_scheme: %s, "
+            "timer: %r",
+            coils, self._delay, self._drive_scheme.name, self._scheduler.timer)
 
     @property
     def drive_scheme(self) -> str:
@@ -50,60 +88,394 @@ class UnipolarStepperMotor:
         """
         return self._drive_scheme.name
 
+    @drive_scheme.setter
+    def drive_scheme(self, name: str):
+        """
+        Change the motor's drive scheme. Must not be called during a move.
+
+        Args:
+            name (str): the name of one of AVAILABLE_DRIVE_SCHEMES
+        """
+        self._drive_scheme = self._get_drive_scheme_obj(name)
+        self._table = drive.compile_scheme(self._drive_scheme)
+
     @property
     def ms_delay(self):
         """
         Delay between setting states on the motor's coils
 
         Returns:
-            (int): The delay in ms
+            (float): The delay in ms
         """
         return self._delay
 
+    @property
+    def us_delay(self):
+        """
+        Delay between setting states on the motor's coils
+
+        Returns:
+            (float): The delay in microseconds
+        """
+        return self._delay * 1000
+
+    @property
+    def profile(self) -> MotionProfile:
+        """
+        The motion profile used for moves that do not specify their own
+
+        Returns:
+            (MotionProfile): the default motion profile
+        """
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile: MotionProfile):
+        """
+        Change the motion profile used for moves that do not specify their own
+
+        Args:
+            profile (MotionProfile): the new default motion profile
+        """
+        self._profile = profile
+
+    @property
+    def phase(self) -> int:
+        """
+        The index in the drive sequence of the coil state the rotor was last
+        driven to
+
+        Returns:
+            (int): the phase or None before the first move or if the drive
+                scheme has changed since
+        """
+        masks = [coil.to_mask(state) for state in self._drive_scheme.sequence]
+        if self._last_mask not in masks:
+            return None
+        return masks.index(self._last_mask)
+
+    @phase.setter
+    def phase(self, phase: int):
+        """
+        Set the phase the rotor was left in eg. when restoring it from a
+        journal
+
+        Args:
+            phase (int): the index in the drive sequence or None if unknown.
+                Phases outside the drive sequence are treated as unknown.
+        """
+        sequence = self._drive_scheme.sequence
+        if phase is None or not 0 <= phase < len(sequence):
+            self._last_mask = None
+        else:
+            self._last_mask = coil.to_mask(sequence[phase])
+
+    @property
+    def phases_per_cycle(self) -> int:
+        """
+        The number of phases in one cycle of the drive scheme
+
+        Returns:
+            (int): phases per cycle
+        """
+        return self._table.phases
+
+    @property
+    def timing(self) -> TimingReport:
+        """
+        How closely the most recent move kept to its planned phase timing
+
+        Returns:
+            (TimingReport): planned versus actual timing of the last move
+        """
+        return self._scheduler.report()
+
+    @property
+    def jitter(self) -> JitterReport:
+        """
+        Distribution of the intervals between coil writes during the most
+        recent move
+
+        Returns:
+            (JitterReport): interval percentiles and overruns or None if
+                jitter tracking is not enabled
+        """
+        if self._jitter is None:
+            return None
+        return self._jitter.report()
+
+    def enable_jitter_tracking(
+            self, tolerance_us: float=PhaseJitter.DEFAULT_TOLERANCE_US):
+        """
+        Record the interval between successive coil writes on every move.
+
+        Args:
+            tolerance_us (float): allowed lateness of a phase in microseconds
+                before it counts as an overrun
+        """
+        self._jitter = PhaseJitter(
+            self._scheduler.timer.now_ns, tolerance_us)
+
+    def disable_jitter_tracking(self):
+        """
+        Stop recording coil write intervals. Moves then run without any
+        instrumentation overhead.
+        """
+        self._jitter = None
+
+    @property
+    def trace(self) -> TraceBuffer:
+        """
+        The trace that moves and coil writes are recorded in or None
+        """
+        return self._trace
+
+    @trace.setter
+    def trace(self, trace: TraceBuffer):
+        self._trace = trace
+        self._coils.trace = trace
+
+    @property
+    def metrics(self) -> StageMetrics:
+        """
+        The metrics that moves are counted in or None
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: StageMetrics):
+        self._metrics = metrics
+        self._energised_ns = None
+
     def deactivate(self):
         """
         Deactivate all coils in the stepper motor. This may be useful to save
         running current through the motor when not in use.
         """
-        _LOGGER.debug("Deactivating coils")
+        if self._trace is not None:
+            self._trace.record(COILS_OFF)
         self._coils.deactivate()
+        if self._energised_ns is not None:
+            self._metrics.coils_released(
+                self._scheduler.timer.now_ns() - self._energised_ns)
+            self._energised_ns = None
 
-    def forward(self, cycles: int):
+    def forward(
+            self,
+            cycles: int,
+            profile: MotionProfile=None,
+            stop: threading.Event=None,
+            on_cycle=None,
+            entry_level: int=0,
+            exit_level: int=0,
+            halt: threading.Event=None,
+            control: MoveControl=None) -> int:
         """
         Step the motor forward the given number of complete cycles
 
         Args:
             cycles (int): the number of complete cycles to move
+            profile (MotionProfile): plans the phase delays for this move.
+                Defaults to the motor's profile.
+            stop (threading.Event): checked between cycles. Once it is set
+                the move brakes to the profile's start rate and ends at the
+                next complete cycle.
+            on_cycle (callable): called with no arguments after each complete
+                cycle
+            entry_level (int): the profile level to start the move at. See
+                MotionProfile.delays.
+            exit_level (int): the highest profile level to finish the move at
+            halt (threading.Event): checked between phases. The move ends
+                within one phase once it is set, leaving the rotor part way
+                through a cycle. The next move realigns it.
+            control (MoveControl): steers the move while it runs, eg. to lower
+                its exit level. Its exit level is used in place of exit_level.
+
+        Returns:
+            (int): the number of complete cycles moved
         """
-        _LOGGER.debug("Moving forward %r steps", cycles)
-        for _ in range(cycles):
-            self._rotate_forward()
-        _LOGGER.debug("Done")
+        start_ns = self.begin_move(True, cycles)
+        done = self._run(
+            self._table.forward, cycles, profile, stop, on_cycle,
+            (entry_level, exit_level), halt, control)
+        self.end_move(True, done, start_ns)
+        return done
 
-    def backward(self, cycles: int):
+    def backward(
+            self,
+            cycles: int,
+            profile: MotionProfile=None,
+            stop: threading.Event=None,
+            on_cycle=None,
+            entry_level: int=0,
+            exit_level: int=0,
+            halt: threading.Event=None,
+            control: MoveControl=None) -> int:
         """
         Rotate the motor backward the given number of complete cycles
 
         Args:
             cycles (int): the number of complete cycles to move
+            profile (MotionProfile): plans the phase delays for this move.
+                Defaults to the motor's profile.
+            stop (threading.Event): checked between cycles. Once it is set
+                the move brakes to the profile's start rate and ends at the
+                next complete cycle.
+            on_cycle (callable): called with no arguments after each complete
+                cycle
+            entry_level (int): the profile level to start the move at. See
+                MotionProfile.delays.
+            exit_level (int): the highest profile level to finish the move at
+            halt (threading.Event): checked between phases. The move ends
+                within one phase once it is set, leaving the rotor part way
+                through a cycle. The next move realigns it.
+            control (MoveControl): steers the move while it runs, eg. to lower
+                its exit level. Its exit level is used in place of exit_level.
+
+        Returns:
+            (int): the number of complete cycles moved
+        """
+        start_ns = self.begin_move(False, cycles)
+        done = self._run(
+            self._table.backward, cycles, profile, stop, on_cycle,
+            (entry_level, exit_level), halt, control)
+        self.end_move(False, done, start_ns)
+        return done
+
+    def begin_move(self, forward: bool, cycles: int):
+        """
+        Record the start of a move in the trace and metrics. forward and
+        backward record their own moves; call this and end_move around moves
+        whose phases are written through phase_stepper.
+
+        Args:
+            forward (bool): the direction of the move
+            cycles (int): the number of complete cycles requested
+
+        Returns:
+            (int): the start of the move to pass to end_move, or None if the
+                move is not counted
+        """
+        if self._trace is not None:
+            self._trace.record(
+                MOVE_FORWARD if forward else MOVE_BACKWARD, cycles)
+        return self._start_metrics()
+
+    def end_move(self, forward: bool, cycles: int, start_ns):
+        """
+        Record the end of a move started with begin_move
+
+        Args:
+            forward (bool): the direction of the move
+            cycles (int): the number of complete cycles moved
+            start_ns (int): the value returned by begin_move
+        """
+        if self._trace is not None:
+            self._trace.record(MOVE_DONE, cycles)
+        if start_ns is not None:
+            self._count_move(forward, cycles, start_ns)
+
+    def phase_stepper(self, forward: bool=True):
+        """
+        Create a callable that advances the motor by a single phase each time
+        it is called, for use by schedulers that interleave the phases of
+        several motors. The caller is responsible for the timing between
+        phases.
+
+        Args:
+            forward (bool): the direction to step in
+
+        Returns:
+            (callable): writes the next phase and returns True if it
+                completed a cycle. Pair with begin_move and end_move to trace
+                and count the move.
         """
-        _LOGGER.debug("Moving backward %r steps", cycles)
-        for _ in range(cycles):
-            self._rotate_backward()
-        _LOGGER.debug("Done")
+        table = self._table.forward if forward else self._table.backward
+        masks = tuple(
+            mask for mask, dwell in table for _ in range(dwell))
+        phases = len(masks)
+        write = self._coils.write
+        index = 0
+
+        def advance():
+            nonlocal index
+            mask = masks[index]
+            write(mask)
+            # kept up to date so that the phase is known wherever the caller
+            # stops
+            self._last_mask = mask
+            index = (index + 1) % phases
+            return index == 0
+
+        return advance
+
+    # pylint: disable=too-many-arguments
+    def _run(
+            self, table, cycles, profile, stop, on_cycle, levels, halt,
+            control):
+        profile = profile or self._profile
+        phases = cycles * self._table.phases
+        if control is None and stop is None:
+            delays = profile.delays(phases, *levels)
+        else:
+            control = control or MoveControl(levels[1])
+            delays = profile.delays(phases, *levels, control=control)
+        write = self._coils.write
+        wait = self._scheduler.wait
+        jitter = self._jitter
+        halted = (halt or _NEVER).is_set
+        if jitter is not None:
+            jitter.start()
+        self._scheduler.start()
+        for cycle in range(cycles):
+            if stop is not None and stop.is_set():
+                # slow down first so that the rotor does not overrun
+                control.brake()
+                if control.stopped:
+                    return cycle
+            if jitter is None:
+                for entry, (mask, dwell) in enumerate(table):
+                    if halted():
+                        self._halted(table, cycle, entry)
+                        return cycle
+                    write(mask)
+                    wait(sum(islice(delays, dwell)))
+            else:
+                for entry, (mask, dwell) in enumerate(table):
+                    if halted():
+                        self._halted(table, cycle, entry)
+                        return cycle
+                    write(mask)
+                    delay = sum(islice(delays, dwell))
+                    jitter.mark(delay)
+                    wait(delay)
+            self._last_mask = table[-1].mask
+            if on_cycle is not None:
+                on_cycle()
+        return cycles
 
-    def _set_step(self, step):
-        self._coils.set_state(step)
+    def _start_metrics(self):
+        # the start of a move if it is to be counted
+        if self._metrics is None:
+            return None
+        now_ns = self._scheduler.timer.now_ns()
+        if self._energised_ns is None:
+            self._energised_ns = now_ns
+        return now_ns
 
-    def _rotate_forward(self):
-        for step in self._drive_scheme.sequence:
-            self._set_step(step)
-            sleep(self._delay / 1000)
+    def _count_move(self, forward, cycles, start_ns):
+        self._metrics.motor_moved(
+            forward,
+            cycles * self._table.phases,
+            self._scheduler.timer.now_ns() - start_ns)
 
-    def _rotate_backward(self):
-        for step in reversed(self._drive_scheme.sequence):
-            self._set_step(step)
-            sleep(self._delay / 1000)
+    def _halted(self, table, cycle, entry):
+        # remember the coil state the rotor was left in part way through a
+        # cycle
+        if entry:
+            self._last_mask = table[entry - 1].mask
+        elif cycle:
+            self._last_mask = table[-1].mask
 
     @classmethod
     def _get_drive_scheme_obj(cls, name):
@@ -0,0 +1,249 @@
+"""
+Timing utilities for the stepper motor. Phases are planned against absolute
+deadlines so that the time spent writing to the coils, logging etc. is
+absorbed into the following sleep rather than accumulating over the length of
+a move.
+
+Deadlines are kept as integer nanoseconds and waited for by a timer. The
+HybridTimer sleeps for most of the wait and then spins on perf_counter_ns for
+the last part of it, trading CPU time for sub-millisecond precision.
+
+Timers double as the clock for everything that times motion, so substituting
+a VirtualClock runs a simulation as fast as the CPU allows while keeping the
+simulated timing exact.
+"""
+import threading
+import time
+from collections import namedtuple
+
+TimingReport = namedtuple(
+    'TimingReport', ['phases', 'planned', 'actual', 'drift', 'max_lateness'])
+TimingReport.__doc__ = """
+Summary of how closely a move kept to its planned timing
+
+Attributes:
+    phases (int): the number of phases scheduled
+    planned (float): the planned duration of the move in seconds
+    actual (float): the measured duration of the move in seconds
+    drift (float): actual - planned in seconds
+    max_lateness (float): the largest time in seconds by which any single
+        phase overran its deadline
+"""
+
+_NS_PER_S = 1000000000
+_NS_PER_US = 1000
+
+
+class SleepTimer:
+    """
+    Waits using time.sleep alone. Uses no CPU while waiting but is subject to
+    the scheduler's sleep granularity, typically tens of microseconds to a few
+    milliseconds late.
+    """
+    @staticmethod
+    def now_ns() -> int:
+        """
+        The current time
+
+        Returns:
+            (int): monotonic time in nanoseconds
+        """
+        return time.monotonic_ns()
+
+    def sleep_until(self, deadline_ns: int):
+        """
+        Block until the deadline has been reached
+
+        Args:
+            deadline_ns (int): the deadline in nanoseconds
+        """
+        remaining = deadline_ns - self.now_ns()
+        if remaining > 0:
+            time.sleep(remaining / _NS_PER_S)
+
+    def __repr__(self):
+        return "%s()" % type(self).__name__
+
+
+class HybridTimer:
+    """
+    Waits with a coarse sleep followed by a bounded busy spin. The spin covers
+    the sleep's overshoot so that deadlines are met to within a few
+    microseconds at the cost of keeping a core busy for up to spin_us per
+    wait.
+
+    Args:
+        spin_us (float): the length of the busy spin at the end of each wait
+            in microseconds. 0 never spins and behaves like SleepTimer.
+    """
+    DEFAULT_SPIN_US = 200
+
+    def __init__(self, spin_us: float=DEFAULT_SPIN_US):
+        if spin_us < 0:
+            raise ValueError("spin_us must not be negative, got %r" % spin_us)
+        self._spin_ns = int(spin_us * _NS_PER_US)
+
+    @property
+    def spin_us(self) -> float:
+        """
+        The length of the busy spin at the end of each wait in microseconds
+        """
+        return self._spin_ns / _NS_PER_US
+
+    @staticmethod
+    def now_ns() -> int:
+        """
+        The current time
+
+        Returns:
+            (int): high resolution monotonic time in nanoseconds
+        """
+        return time.perf_counter_ns()
+
+    def sleep_until(self, deadline_ns: int):
+        """
+        Block until the deadline has been reached
+
+        Args:
+            deadline_ns (int): the deadline in nanoseconds
+        """
+        now = time.perf_counter_ns
+        coarse = deadline_ns - now() - self._spin_ns
+        if coarse > 0:
+            time.sleep(coarse / _NS_PER_S)
+        while now() < deadline_ns:
+            pass
+
+    def __repr__(self):
+        return "%s(spin_us=%r)" % (type(self).__name__, self.spin_us)
+
+
+class VirtualClock:
+    """
+    A simulated clock that only moves forward when something sleeps on it or
+    it is explicitly advanced. Sleeping returns immediately after moving the
+    clock to the deadline, so hours of motion can be simulated in
+    milliseconds.
+
+    Args:
+        start_ns (int): the initial time in nanoseconds
+    """
+    def __init__(self, start_ns: int=0):
+        self._now = start_ns
+        self._lock = threading.Lock()
+
+    def now_ns(self) -> int:
+        """
+        The current simulated time
+
+        Returns:
+            (int): simulated time in nanoseconds
+        """
+        return self._now
+
+    def sleep_until(self, deadline_ns: int):
+        """
+        Move the simulated time to the deadline if it is in the future
+
+        Args:
+            deadline_ns (int): the deadline in nanoseconds
+        """
+        with self._lock:
+            if deadline_ns > self._now:
+                self._now = deadline_ns
+
+    def advance(self, seconds: float):
+        """
+        Move the simulated time forward
+
+        Args:
+            seconds (float): the time to advance by
+        """
+        with self._lock:
+            self._now += round(seconds * _NS_PER_S)
+
+    @property
+    def seconds(self) -> float:
+        """
+        The current simulated time in seconds
+        """
+        return self._now / _NS_PER_S
+
+    def __repr__(self):
+        return "%s(start_ns=%r)" % (type(self).__name__, self._now)
+
+
+class DeadlineScheduler:
+    """
+    Schedules motor phases against absolute deadlines. Each call to wait
+    advances the deadline by the requested delay and sleeps until it is
+    reached. If the schedule falls behind by more than a whole phase (eg. the
+    process was descheduled) the deadline is rebased to the current time so
+    that the motor is not driven with a burst of back-to-back phases to catch
+    up.
+
+    Args:
+        timer (HybridTimer, SleepTimer or VirtualClock): waits for each
+            deadline. Defaults to a HybridTimer.
+    """
+    def __init__(self, timer=None):
+        self._timer = timer or HybridTimer()
+        self._start = None
+        self._deadline = None
+        self._phases = 0
+        self._planned = 0
+        self._max_lateness = 0
+        self._end = None
+
+    @property
+    def timer(self):
+        """
+        The timer used to wait for each deadline
+        """
+        return self._timer
+
+    def start(self):
+        """
+        Begin a new schedule with the first deadline at the current time
+        """
+        self._start = self._deadline = self._end = self._timer.now_ns()
+        self._phases = 0
+        self._planned = 0
+        self._max_lateness = 0
+
+    def wait(self, delay: float):
+        """
+        Sleep until the next deadline
+
+        Args:
+            delay (float): the planned duration of this phase in seconds
+        """
+        delay_ns = round(delay * _NS_PER_S)
+        self._deadline += delay_ns
+        self._planned += delay_ns
+        self._phases += 1
+        self._timer.sleep_until(self._deadline)
+        now = self._timer.now_ns()
+        lateness = now - self._deadline
+        if lateness > self._max_lateness:
+            self._max_lateness = lateness
+        if lateness > delay_ns:
+            self._deadline = now
+        self._end = now
+
+    def report(self) -> TimingReport:
+        """
+        Timing of the most recent schedule
+
+        Returns:
+            (TimingReport): the planned and actual timing of the schedule
+        """
+        if self._start is None:
+            return TimingReport(0, 0.0, 0.0, 0.0, 0.0)
+        actual = self._end - self._start
+        return TimingReport(
+            phases=self._phases,
+            planned=self._planned / _NS_PER_S,
+            actual=actual / _NS_PER_S,
+            drift=(actual - self._planned) / _NS_PER_S,
+            max_lateness=self._max_lateness / _NS_PER_S)
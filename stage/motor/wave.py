@@ -0,0 +1,146 @@
+"""
+A stepper motor whose moves are timed by hardware rather than by Python
+"""
+from itertools import islice
+from logging import getLogger
+
+from stage.motor.profile import MoveControl
+from stage.motor.stepper import UnipolarStepperMotor
+
+_LOGGER = getLogger("WAVE MOTOR")
+
+_NS_PER_US = 1000
+
+
+class WaveStepperMotor(UnipolarStepperMotor):
+    """
+    Drives a unipolar stepper motor by compiling each move into waveforms
+    that the coil output group transmits on its own, eg. a
+    stage.gpio.wave.OutputGroup. Python only follows the move to report each
+    cycle as its planned end passes and to stop the waveform early when asked
+    to. Takes the same arguments as UnipolarStepperMotor, except that the
+    coils' group must provide transmit, prepare, start, busy and halt.
+
+    A move is planned a chunk of cycles at a time. The next chunk is prepared
+    while the last cycle of the one before it is transmitted and started once
+    that one has finished, so the last phase of each chunk may be held for a
+    round trip to the daemon longer than planned. A stop is only planned for
+    from the next chunk on, so a move that is not yet at its start rate keeps
+    going for up to a chunk before it brakes.
+
+    Phase delays are rounded to whole microseconds. A halt is noticed as soon
+    as its event is set rather than before the next phase, so the rotor may
+    be a phase or so further on than with UnipolarStepperMotor. Jitter
+    tracking does not apply since Python does not time the phases.
+    """
+    _BUSY_POLL_S = 0.001
+    # a chunk ends once it is planned to last this long or has this many
+    # cycles
+    _CHUNK_S = 0.05
+    _CHUNK_CYCLES = 64
+
+    # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+    def _run(
+            self, table, cycles, profile, stop, on_cycle, levels, halt,
+            control):
+        profile = profile or self._profile
+        phases = cycles * self._table.phases
+        if control is None and stop is None:
+            delays = profile.delays(phases, *levels)
+        else:
+            control = control or MoveControl(levels[1])
+            delays = profile.delays(phases, *levels, control=control)
+            if stop is not None and stop.is_set():
+                control.brake()
+        chunks = self._chunks(table, cycles, delays, control)
+        plan = next(chunks, None)
+        if plan is None or (halt is not None and halt.is_set()):
+            return 0
+        group = self._coils.group
+        timer = self._scheduler.timer
+        group.transmit(phases for phases, _ in plan)
+        done = 0
+        while plan:
+            start = end = timer.now_ns()
+            following = prepared = None
+            for index, (phases, level) in enumerate(plan):
+                if index + 1 == len(plan):
+                    following = next(chunks, None)
+                    if following is not None:
+                        prepared = group.prepare(
+                            phases for phases, _ in following)
+                end += sum(delay for _, delay in phases) * _NS_PER_US
+                if self._wait_until(timer, end, halt):
+                    group.halt()
+                    self._last_mask = self._mask_at(
+                        plan, timer.now_ns() - start)
+                    _LOGGER.debug("Halted in cycle %d", done)
+                    return done
+                done += 1
+                if on_cycle is not None:
+                    on_cycle()
+                if stop is not None and stop.is_set():
+                    # slow down first so that the rotor does not overrun
+                    control.brake()
+                    if level <= 0 and done < cycles:
+                        # the chain has already moved on, so pull the rotor
+                        # back to the end of the cycle to keep positions exact
+                        group.halt()
+                        self._coils.write(table[-1].mask)
+                        self._last_mask = table[-1].mask
+                        control.level = level
+                        return done
+            self._wait_until_idle(group, timer)
+            if following is not None:
+                group.start(prepared)
+            plan = following
+        self._last_mask = table[-1].mask
+        return done
+
+    def _chunks(self, table, cycles, delays, control):
+        # yield the plan of the move a chunk at a time, each a list of the
+        # (mask, delay_us) phases and the level reached for each cycle. A
+        # braked move ends once it has slowed to its start rate.
+        chunk = []
+        planned_ns = 0
+        for _ in range(cycles):
+            if control is not None and control.braking and control.stopped:
+                break
+            phases = tuple(
+                (mask, round(sum(islice(delays, dwell)) * 1e6))
+                for mask, dwell in table)
+            chunk.append(
+                (phases, None if control is None else control.level))
+            planned_ns += sum(delay for _, delay in phases) * _NS_PER_US
+            if len(chunk) == self._CHUNK_CYCLES \
+                    or planned_ns >= self._CHUNK_S * 1e9:
+                yield chunk
+                chunk = []
+                planned_ns = 0
+        if chunk:
+            yield chunk
+
+    def _wait_until_idle(self, group, timer):
+        while group.busy():
+            timer.sleep_until(timer.now_ns() + round(self._BUSY_POLL_S * 1e9))
+
+    @staticmethod
+    def _wait_until(timer, deadline, halt):
+        # wait for the deadline, returning True if halted first
+        if halt is None:
+            timer.sleep_until(deadline)
+            return False
+        remaining = deadline - timer.now_ns()
+        return halt.wait(remaining / 1e9) if remaining > 0 else halt.is_set()
+
+    @staticmethod
+    def _mask_at(plan, elapsed_ns):
+        # the mask being transmitted the given time into the plan
+        mask = None
+        offset = 0
+        for phases, _ in plan:
+            for mask, delay in phases:
+                offset += delay * _NS_PER_US
+                if offset > elapsed_ns:
+                    return mask
+        return mask
@@ -0,0 +1,105 @@
+"""
+Handles on moves that run asynchronously on the stage's motion thread
+"""
+import threading
+from concurrent.futures import Future
+
+
+class Move:
+    """
+    A future-like handle on a move requested from the stage. The move runs on
+    the stage's motion thread and may be cancelled at any time. A cancelled
+    move slows to the start rate of its profile and stops at a whole position
+    so the stage position remains exact.
+
+    Args:
+        target (int): the requested position index
+        future (concurrent.futures.Future): resolves to the position reached
+        stop (threading.Event): set to request that the move stops early
+    """
+    def __init__(self, target, future: Future, stop: threading.Event):
+        self._target = target
+        self._future = future
+        self._stop = stop
+
+    @property
+    def target(self):
+        """
+        The requested position index
+        """
+        return self._target
+
+    def done(self) -> bool:
+        """
+        Whether or not the move has finished, either by reaching its target,
+        being cancelled or failing.
+
+        Returns:
+            (bool): True if the move has finished
+        """
+        return self._future.done()
+
+    def cancel(self) -> bool:
+        """
+        Request that the move stops as soon as possible
+
+        Returns:
+            (bool): True if the move had not already finished
+        """
+        if self._future.done():
+            return False
+        self._stop.set()
+        return True
+
+    def cancelled(self) -> bool:
+        """
+        Whether or not cancellation of the move was requested
+
+        Returns:
+            (bool): True if cancel was called before the move finished
+        """
+        return self._stop.is_set()
+
+    def add_done_callback(self, callback):
+        """
+        Register a callback to be called with this move once it has finished.
+        The callback is invoked on the motion thread, or immediately if the
+        move has already finished.
+
+        Args:
+            callback (callable): called with the move as its only argument
+        """
+        self._future.add_done_callback(lambda _: callback(self))
+
+    def exception(self, timeout: float=None):
+        """
+        Wait for the move to finish and return the error it raised, if any
+
+        Args:
+            timeout (float): the maximum time in seconds to wait
+
+        Returns:
+            (Exception): the error raised by the move or None
+        """
+        return self._future.exception(timeout)
+
+    def result(self, timeout: float=None):
+        """
+        Wait for the move to finish
+
+        Args:
+            timeout (float): the maximum time in seconds to wait. Waits
+                indefinitely if None.
+
+        Returns:
+            (int): the position reached. This is the target unless the move
+                was cancelled.
+
+        Raises:
+            TimeoutError: if the move did not finish within the timeout
+        """
+        return self._future.result(timeout)
+
+    def __repr__(self):
+        return "%s(target=%r, done=%r)" % (
+            type(self).__name__, self._target, self.done())
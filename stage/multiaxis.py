@@ -0,0 +1,202 @@
+"""
+Coordinated motion of several stages, eg. an XY(Z) table. The phases of all
+motors are interleaved in a single timing loop so that the axes start and
+finish a move together.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from stage.factory.base import StageFactoryBase
+from stage.metrics import StageMetrics
+from stage.motor.profile import MotionProfile
+from stage.motor.timing import DeadlineScheduler
+from stage.move import Move
+from stage.stage import Stage
+from stage.trace import TraceBuffer
+
+_LOGGER = logging.getLogger("MULTI AXIS")
+
+
+class MultiAxisStage:
+    """
+    Drives several stages as the axes of a single machine. The axis that has
+    to travel furthest sets the pace and the phases of the other axes are
+    distributed evenly across the move using Bresenham's algorithm.
+
+    The individual axes should not be moved directly while a coordinated move
+    is in progress.
+
+    Args:
+        factories (StageFactoryBase): one factory per axis
+        profile (MotionProfile): plans the phase delays of the leading axis.
+            Defaults to the first axis motor's profile.
+        journals (list): a PositionJournal or None per axis. See Stage.
+        trace (TraceBuffer): records the moves of every axis. See Stage.
+        metrics (StageMetrics): counts the moves of every axis together. See
+            Stage.
+    """
+    def __init__(
+            self,
+            *factories: StageFactoryBase,
+            profile: MotionProfile=None,
+            journals=None,
+            trace: TraceBuffer=None,
+            metrics: StageMetrics=None):
+        if not factories:
+            raise ValueError("At least one axis is required")
+        journals = journals or [None] * len(factories)
+        if len(journals) != len(factories):
+            raise ValueError(
+                "Expected %d journals, got %d"
+                % (len(factories), len(journals)))
+        # home the axes concurrently
+        self._axes = tuple(
+            Stage(
+                factory, journal=journal, defer_homing=True, trace=trace,
+                metrics=metrics)
+            for factory, journal in zip(factories, journals))
+        for axis in self._axes:
+            axis.wait_ready()
+        self._profile = profile or self._axes[0].motor.profile
+        self._scheduler = DeadlineScheduler(self._axes[0].clock)
+        self._motion = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="multiaxis")
+        _LOGGER.info("Instantiated with %d axes", len(self._axes))
+
+    @property
+    def axes(self):
+        """
+        The stages that make up each axis
+
+        Returns:
+            tuple: the stages in the order their factories were given
+        """
+        return self._axes
+
+    @property
+    def position(self):
+        """
+        The position index of each axis
+
+        Returns:
+            tuple: one position index per axis
+        """
+        return tuple(axis.position for axis in self._axes)
+
+    @property
+    def timing(self):
+        """
+        How closely the most recent coordinated move kept to its planned timing
+
+        Returns:
+            (TimingReport): planned versus actual timing of the last move
+        """
+        return self._scheduler.report()
+
+    def home(self):
+        """
+        Home all axes at the same time
+        """
+        for move in [axis.move_home() for axis in self._axes]:
+            move.result()
+
+    def move_to(self, *requests: int, profile: MotionProfile=None) -> Move:
+        """
+        Start a coordinated move to the requested position of each axis
+
+        Args:
+            requests (int): one position index per axis
+            profile (MotionProfile): plans the phase delays of the leading
+                axis for this move
+
+        Returns:
+            (Move): a handle that resolves to the tuple of positions reached.
+                It fails with NotHomedError if the position of any axis is
+                unknown when the move starts. A backward axis stops where its
+                end stop triggers.
+
+        Raises:
+            ValueError: if the number of requests does not match the axes
+            OutOfRangeError: if any request is outside of its axis limits
+        """
+        if len(requests) != len(self._axes):
+            raise ValueError(
+                "Expected %d positions, got %d"
+                % (len(self._axes), len(requests)))
+        for axis, request in zip(self._axes, requests):
+            # pylint: disable=protected-access
+            axis._check_in_range(request)
+        stop = threading.Event()
+        future = self._motion.submit(
+            self._goto_request, requests, profile or self._profile, stop)
+        return Move(requests, future, stop)
+
+    def close(self):
+        """
+        Stop the motion threads once any outstanding moves have finished
+        """
+        self._motion.shutdown(wait=True)
+        for axis in self._axes:
+            axis.close()
+
+    def _goto_request(self, requests, profile, stop):
+        # pylint: disable=protected-access,too-many-locals
+        for axis in self._axes:
+            axis._check_homed()
+        deltas = [
+            request - axis.position
+            for axis, request in zip(self._axes, requests)]
+        phases = [
+            abs(delta) * axis.motor.phases_per_cycle
+            for axis, delta in zip(self._axes, deltas)]
+        lead = max(phases)
+        if not lead:
+            return self.position
+        steppers = [
+            axis.motor.phase_stepper(delta > 0)
+            for axis, delta in zip(self._axes, deltas)]
+        # backward axes halt within a phase if their end stop triggers
+        halts = [
+            axis._at_home_position if delta < 0 else None
+            for axis, delta in zip(self._axes, deltas)]
+        increments = [1 if delta > 0 else -1 for delta in deltas]
+        remaining = list(phases)
+        in_cycle = [0] * len(self._axes)
+        moved = [0] * len(self._axes)
+        errors = [lead // 2] * len(self._axes)
+        tokens = [
+            axis._begin_steps(delta) if delta else None
+            for axis, delta in zip(self._axes, deltas)]
+        delays = profile.delays(lead)
+        wait = self._scheduler.wait
+        self._scheduler.start()
+        for _ in range(lead):
+            stopping = stop.is_set()
+            if stopping and not any(in_cycle):
+                break
+            for idx, axis in enumerate(self._axes):
+                errors[idx] += phases[idx]
+                if errors[idx] < lead:
+                    continue
+                errors[idx] -= lead
+                if not remaining[idx] or (stopping and not in_cycle[idx]):
+                    continue
+                if halts[idx] is not None and halts[idx].is_set():
+                    remaining[idx] = 0
+                    in_cycle[idx] = 0
+                    continue
+                remaining[idx] -= 1
+                in_cycle[idx] = 1
+                if steppers[idx]():
+                    in_cycle[idx] = 0
+                    moved[idx] += 1
+                    axis._advance_position(increments[idx])
+            wait(next(delays))
+        for axis, delta, request, done, token in zip(
+                self._axes, deltas, requests, moved, tokens):
+            if delta:
+                axis._end_steps(delta, request, done, token)
+            else:
+                axis._park()
+        return self.position
@@ -2,14 +2,86 @@
 The linear stage module that defines a software driver of a hardware assembly
 comprising stepper motor, track and end stop limit switch.
 """
+import itertools
 import logging
 import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 
 from stage import exceptions
 from stage.factory.base import StageFactoryBase
+from stage.journal import PositionJournal
+from stage.metrics import StageMetrics
+from stage.motor.profile import ConstantProfile, MoveControl
+from stage.move import Move
+from stage.trace import (
+    END_STOP_TRIGGERED, HOMED, MOVE_REQUEST, POSITION, TraceBuffer)
 
 _LOGGER = logging.getLogger("STAGE")
 
+_Segment = namedtuple(
+    '_Segment', ['target', 'profile', 'stop', 'future', 'ticket'])
+TrackingReport = namedtuple(
+    'TrackingReport',
+    ['samples', 'position', 'max_lag', 'final_lag', 'max_lead'])
+TrackingReport.__doc__ = """
+How closely the stage followed a trajectory
+
+Attributes:
+    samples (int): the number of trajectory samples consumed
+    position (int): the position index reached
+    max_lag (float): the largest time in seconds by which the stage reached a
+        sample after its scheduled time
+    final_lag (float): the lag in seconds at the last sample
+    max_lead (float): the largest time in seconds by which the stage reached a
+        sample before its scheduled time. The stage holds there until the
+        sample is due.
+"""
+HomingParameters = namedtuple(
+    'HomingParameters',
+    ['fast_profile', 'slow_profile', 'backoff', 'timeout'],
+    defaults=(None, None, 2, None))
+HomingParameters.__doc__ = """
+How the stage finds its end stop. The stage approaches the end stop fast,
+backs off until the end stop releases and then re-approaches slowly so that
+the home position does not depend on the approach speed.
+
+Attributes:
+    fast_profile (MotionProfile): the profile of the first approach. Defaults
+        to the motor's default profile.
+    slow_profile (MotionProfile): the profile of the back-off and the second
+        approach. Defaults to half the start rate of the fast profile.
+    backoff (int): the number of positions to back off by
+    timeout (float): seconds allowed to find home before raising a
+        HomingTimeoutError. Defaults to twice the time taken to travel the
+        whole track and back off.
+"""
+HomingReport = namedtuple(
+    'HomingReport', ['duration', 'fast_cycles', 'slow_cycles'])
+HomingReport.__doc__ = """
+How long the last homing took
+
+Attributes:
+    duration (float): the time in seconds taken to home
+    fast_cycles (int): the number of positions moved on the fast approach
+    slow_cycles (int): the number of positions moved backing off and on the
+        slow approach
+"""
+
+
+class _AnyEvent:
+    # pylint: disable=too-few-public-methods
+    """
+    Reads as set once any of the given events is set so that one stop flag
+    can be passed to the motor
+    """
+    def __init__(self, *events):
+        self._events = events
+
+    def is_set(self):
+        return any(event.is_set() for event in self._events)
+
 
 class Stage:
     """
@@ -18,34 +90,130 @@ class Stage:
     position index. The stage must be homed in order to have a meaningful
     position.
 
+    All motion runs on a dedicated motion thread. Moves requested with move_to
+    return immediately while setting position blocks until the move is done.
+    Moves requested with enqueue are blended together by a lookahead planner.
+
     Keyword arguments:
         factory (StageFactoryBase): a factory that creates stage components
+        homing (HomingParameters): how to find the end stop. Defaults to
+            HomingParameters().
+        journal (PositionJournal): records the position so that homing can
+            be skipped when the stage is constructed again after a clean
+            shutdown
+        defer_homing (bool): return without waiting for the stage to home.
+            Homing runs on the motion thread and moves requested meanwhile
+            start once it is done. See ready and wait_ready.
+        trace (TraceBuffer): records moves, positions, coil writes and end
+            stop events in place of logging them. The motor and end stop
+            record into it too.
+        metrics (StageMetrics): counts completed moves and their latency and
+            homings and their duration. The motor and end stop count steps,
+            time in motion, coil energised time and end stop triggers in it.
     """
-    def __init__(self, factory: StageFactoryBase):
+    _SLOW_HOMING_FRACTION = 0.5
+    _HOMING_TIMEOUT_MARGIN = 2
+    _MIN_HOMING_TIMEOUT = 1.0
+    _HOLD_SLICE_NS = 50000000
+
+    def __init__(
+            self,
+            factory: StageFactoryBase,
+            homing: HomingParameters=None,
+            journal: PositionJournal=None,
+            defer_homing: bool=False,
+            trace: TraceBuffer=None,
+            metrics: StageMetrics=None):
         _LOGGER.info("Instantiating stage using factory %r", factory)
         self.motor = factory.motor
         self.end_stop = factory.end_stop
+        self.clock = factory.clock
+        self._trace = trace
+        if trace is not None:
+            self.motor.trace = trace
+            self.end_stop.trace = trace
+        self._metrics = metrics
+        if metrics is not None:
+            self.motor.metrics = metrics
+            self.end_stop.metrics = metrics
         self.end_stop.register_callback(self._handle_end_stop_triggered)
         self._min = factory.minimum_position
         self._max = factory.maximum_position
         self._at_home_position = threading.Event()
+        self._homing = homing or HomingParameters()
+        self._homing_report = None
+        self._journal = journal
+        self._profile = None
+        self._position_listeners = []
+        self._queue = deque()
+        self._queue_lock = threading.Lock()
+        # numbers the motion tasks in the order the motion thread runs them,
+        # so the planner can tell whether a queued move runs next
+        self._tickets = itertools.count()
+        # (forward, profile, level) at the end of the last queued move if the
+        # motor is still moving
+        self._carry = None
+        self._motion = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="motion")
         # position is undefined at startup. Stage needs to home first.
         self._position = None
-        self.home()
+        self._lag = None
+        if self._restore():
+            future = Future()
+            future.set_result(self._position)
+            self._ready = Move(self._position, future, threading.Event())
+        else:
+            self._ready = self.move_home()
+        if not defer_homing:
+            self._ready.result()
+
+    @property
+    def ready(self) -> Move:
+        """
+        The homing started when the stage was constructed
+
+        Returns:
+        Move -- a handle that resolves to the home position once the stage
+        has homed or to the journaled position if homing was skipped
+        """
+        return self._ready
+
+    def wait_ready(self, timeout: float=None):
+        """
+        Wait until the stage homed at construction has its position
+
+        Keyword arguments:
+        timeout -- seconds to wait. Defaults to waiting indefinitely.
+
+        Returns:
+        int -- the position
+
+        Raises:
+        HomingTimeoutError -- if homing failed
+        NotHomedError -- if homing was cancelled
+        concurrent.futures.TimeoutError -- if homing is not done in time
+        """
+        return self._ready.result(timeout)
 
     def home(self):
         """
         Send the stage to its home position
         """
-        _LOGGER.info("Homing stage...")
-        # FIX: timeout needed here. what if the stage is stuck or endstop
-        # broken
-        if not self.end_stop.triggered:
-            while not self._at_home_position.is_set():
-                self.motor.backward(1)
-        _LOGGER.info("Done")
-        self._position = 0
-        self.motor.deactivate()
+        self.move_home().result()
+
+    def move_home(self) -> Move:
+        """
+        Start sending the stage to its home position without waiting for it to
+        get there.
+
+        Returns:
+        Move -- a handle that resolves to the home position. Cancelling it
+        leaves the position unknown, so the move fails with NotHomedError
+        and the stage must be homed again before it can move.
+        """
+        stop = threading.Event()
+        future = self._submit(self._home, stop)
+        return Move(self._min, future, stop)
 
     def end(self):
         """
@@ -54,6 +222,164 @@ class Stage:
         _LOGGER.info("Stage moving to end stop...")
         self.position = self._max
 
+    def move_to(self, request: int, profile=None) -> Move:
+        """
+        Start moving the stage to the requested position index without waiting
+        for the move to finish. Moves are carried out in the order requested.
+
+        Keyword arguments:
+        request -- requested position index
+        profile -- motion profile for this move. Defaults to the stage profile.
+
+        Returns:
+        Move -- a handle that resolves to the position reached. It fails with
+        NotHomedError if the stage position is unknown when the move starts.
+
+        Raises:
+        OutOfRangeError -- if the request is outside of the stage limits
+        """
+        self._check_in_range(request)
+        _LOGGER.info("Moving to position %r...", request)
+        if self._trace is not None:
+            self._trace.record(MOVE_REQUEST, request)
+        stop = threading.Event()
+        future = self._submit(
+            self._goto_request, request, profile or self._profile, stop)
+        if self._metrics is not None:
+            self._count_completion(future)
+        return Move(request, future, stop)
+
+    def enqueue(self, request: int, profile=None) -> Move:
+        """
+        Queue a move to the requested position index. Queued moves are planned
+        with lookahead: consecutive moves in the same direction with the same
+        profile are blended so the motor keeps its speed through intermediate
+        positions, and the coils stay energised until the queue drains.
+
+        Keyword arguments:
+        request -- requested position index
+        profile -- motion profile for this move. Defaults to the stage profile.
+
+        Returns:
+        Move -- a handle that resolves to the position reached. It fails with
+        NotHomedError if the stage position is unknown when the move starts.
+
+        Raises:
+        OutOfRangeError -- if the request is outside of the stage limits
+        """
+        self._check_in_range(request)
+        _LOGGER.info("Queueing move to position %r...", request)
+        stop = threading.Event()
+        future = Future()
+        if self._metrics is not None:
+            self._count_completion(future)
+        with self._queue_lock:
+            self._queue.append(_Segment(
+                request,
+                profile or self._profile or self.motor.profile,
+                stop,
+                future,
+                next(self._tickets)))
+            self._motion.submit(self._run_queued)
+        return Move(request, future, stop)
+
+    def follow(self, trajectory, profile=None) -> Move:
+        """
+        Start following a position versus time trajectory. The trajectory is
+        consumed lazily, one sample at a time, so it may be an arbitrarily long
+        generator. Between samples the stage moves at the constant rate needed
+        to arrive on time, limited by the start rate of the profile since
+        each segment starts from rest without a ramp.
+
+        Keyword arguments:
+        trajectory -- iterable of (t, position) pairs where t is the time in
+            seconds since the start of the trajectory
+        profile -- the stage will not step faster than this profile's start
+            rate, or the cruise rate of a constant profile. Defaults to the
+            stage profile.
+
+        Returns:
+        Move -- a handle that resolves to a TrackingReport. Cancelling stops
+            following at the next whole position. It fails with NotHomedError
+            if the stage position is unknown when following starts.
+        """
+        stop = threading.Event()
+        future = self._submit(
+            self._follow,
+            trajectory,
+            profile or self._profile or self.motor.profile,
+            stop)
+        if self._metrics is not None:
+            self._count_completion(future)
+        return Move(None, future, stop)
+
+    @property
+    def jitter(self):
+        """
+        Distribution of the intervals between coil writes during the most
+        recent move. None unless jitter tracking has been enabled on the
+        motor with motor.enable_jitter_tracking().
+        """
+        return self.motor.jitter
+
+    @property
+    def homing(self):
+        """
+        The HomingReport of the last time the stage was homed
+        """
+        return self._homing_report
+
+    @property
+    def lag(self):
+        """
+        The time in seconds by which the stage reached the most recent sample
+        of the trajectory being followed after its scheduled time. None if no
+        trajectory has been followed.
+        """
+        return self._lag
+
+    def add_position_listener(self, callback):
+        """
+        Register a callback to be called with the new position index each time
+        the position changes. Callbacks are invoked on the motion thread so
+        must return quickly.
+
+        Keyword arguments:
+        callback -- called with the position index
+        """
+        self._position_listeners.append(callback)
+
+    def remove_position_listener(self, callback):
+        """
+        Deregister a callback registered with add_position_listener
+
+        Keyword arguments:
+        callback -- the callback to be removed
+        """
+        self._position_listeners.remove(callback)
+
+    @property
+    def trace(self) -> TraceBuffer:
+        """
+        The trace the stage records into or None
+        """
+        return self._trace
+
+    @property
+    def metrics(self) -> StageMetrics:
+        """
+        The metrics the stage counts its operations in or None
+        """
+        return self._metrics
+
+    def close(self):
+        """
+        Stop the motion thread once any outstanding moves have finished
+        """
+        self._motion.shutdown(wait=True)
+        if self._journal is not None:
+            self._journal.close()
+
     @property
     def min(self):
         """
@@ -68,12 +394,29 @@ class Stage:
         """
         return self._max
 
+    @property
+    def profile(self):
+        """
+        The motion profile used when moving to a new position. None means the
+        motor's own default profile is used.
+        """
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile):
+        """
+        Set the motion profile used for subsequent moves
+
+        Keyword arguments:
+        profile -- a stage.motor.profile.MotionProfile or None
+        """
+        self._profile = profile
+
     @property
     def position(self):
         """
         Get the stage position index
         """
-        _LOGGER.debug("Reading position...")
         return self._position
 
     @position.setter
@@ -84,22 +427,421 @@ class Stage:
         Keyword arguments:
         request -- requested position index
         """
-        _LOGGER.info("Moving to position %r...", request)
-        self._goto_request(request)
-        self._position = request
-        self._at_home_position.clear()
+        self.move_to(request).result()
         _LOGGER.info("Done")
 
-    def _handle_end_stop_triggered(self, *args, **kwargs):
-        _LOGGER.info("End stop triggered: args=%r; kwargs=%r", args, kwargs)
+    def _handle_end_stop_triggered(self, *_args, **_kwargs):
         self._at_home_position.set()
+        if self._trace is not None:
+            self._trace.record(END_STOP_TRIGGERED)
+
+    def _count_completion(self, future):
+        # count the move once it reaches its position, timed from its request
+        start_ns = self.clock.now_ns()
+
+        def completed(done):
+            if not done.cancelled() and done.exception() is None:
+                self._metrics.move_completed(self.clock.now_ns() - start_ns)
+
+        future.add_done_callback(completed)
 
-    def _goto_request(self, request):
+    def _submit(self, task, *args):
+        # every motion task takes a ticket, so a queued move knows whether
+        # another task will run between it and the next queued move
+        with self._queue_lock:
+            next(self._tickets)
+            return self._motion.submit(task, *args)
+
+    def _check_homed(self):
+        # moves are relative to the position, which is lost when homing fails
+        # or is cancelled
+        if self._position is None:
+            raise exceptions.NotHomedError(
+                "Stage position unknown. Home the stage first.")
+
+    def _check_in_range(self, request):
         if request > self._max or request < self._min:
             raise exceptions.OutOfRangeError("Cannot go to position %d" % request)
+
+    def _set_position(self, position):
+        self._position = position
+        if self._trace is not None:
+            self._trace.record(POSITION, position)
+        if self._journal is not None:
+            self._journal.record(position)
+        for callback in self._position_listeners:
+            callback(position)
+
+    def _advance_position(self, step):
+        self._set_position(self._position + step)
+
+    def _park(self):
+        self.motor.deactivate()
+        self._commit()
+
+    def _commit(self):
+        # the motor is deactivated at a known position
+        if self._journal is not None and self._position is not None:
+            self._journal.commit(self._position, self.motor.phase)
+
+    def _restore(self):
+        # take the position from a clean journal that agrees with the end stop
+        if self._journal is None:
+            return False
+        entry = self._journal.read()
+        if entry is None or not entry.clean or entry.phase is None:
+            _LOGGER.info("No clean position in %r", self._journal)
+            return False
+        if not self._min <= entry.position <= self._max:
+            _LOGGER.warning("Journal position %r out of range", entry.position)
+            return False
+        at_home = entry.position == self._min
+        if self.end_stop.triggered != at_home:
+            _LOGGER.warning(
+                "End stop disagrees with journal position %r", entry.position)
+            return False
+        if at_home:
+            self._at_home_position.set()
+        self._position = entry.position
+        self.motor.phase = entry.phase
+        _LOGGER.info(
+            "Restored position %r from %r", entry.position, self._journal)
+        return True
+
+    def _home(self, stop):
+        _LOGGER.info("Homing stage...")
+        self._carry = None
+        self._at_home_position.clear()
+        if self._journal is not None:
+            self._journal.record()
+        fast = self._homing.fast_profile or self.motor.profile
+        slow = self._homing.slow_profile or self._slow_homing_profile(fast)
+        timeout = self._homing_timeout(fast, slow)
+        start = self.clock.now_ns()
+        deadline = start + int(timeout * 1e9)
+        timed_out = threading.Event()
+
+        def check_timeout():
+            if self.clock.now_ns() > deadline:
+                timed_out.set()
+
+        halt = _AnyEvent(stop, timed_out)
+        fast_cycles = slow_cycles = 0
+        try:
+            if not self.end_stop.triggered:
+                fast_cycles = self._approach(fast, halt, check_timeout)
+            slow_cycles = self._back_off(slow, halt, check_timeout)
+            self._at_home_position.clear()
+            if not halt.is_set():
+                slow_cycles += self._approach(slow, halt, check_timeout)
+        finally:
+            self.motor.deactivate()
+        if stop.is_set():
+            # the carriage moved an unknown distance before homing stopped
+            self._position = None
+            raise exceptions.NotHomedError("Homing cancelled")
+        if timed_out.is_set():
+            self._position = None
+            raise exceptions.HomingTimeoutError(
+                "Failed to find home within %gs" % timeout)
+        self._homing_report = HomingReport(
+            (self.clock.now_ns() - start) / 1e9, fast_cycles, slow_cycles)
+        _LOGGER.info("Done: %r", self._homing_report)
+        if self._trace is not None:
+            self._trace.record(HOMED, self._min)
+        if self._metrics is not None:
+            self._metrics.homed(self._homing_report.duration)
+        self._set_position(self._min)
+        self._commit()
+        return self._position
+
+    def _approach(self, profile, halt, on_cycle):
+        # Step backward until the end stop triggers. Its level is read after
+        # every cycle too, since its edge may be lost eg. to debouncing.
+        travel = self._max - self._min + self._homing.backoff
+        home = self._at_home_position
+
+        def check_end_stop():
+            on_cycle()
+            if self.end_stop.triggered:
+                home.set()
+
+        cycles = 0
+        while not (home.is_set() or halt.is_set()):
+            if self.end_stop.triggered:
+                home.set()
+                break
+            cycles += self.motor.backward(
+                travel, profile=profile, stop=halt, on_cycle=check_end_stop,
+                halt=home)
+        return cycles
+
+    def _back_off(self, profile, halt, on_cycle):
+        # step forward by the back-off distance and on until the end stop
+        # releases
+        cycles = 0
+        if not halt.is_set():
+            cycles += self.motor.forward(
+                self._homing.backoff, profile=profile, stop=halt,
+                on_cycle=on_cycle)
+        while self.end_stop.triggered and not halt.is_set():
+            cycles += self.motor.forward(
+                1, profile=profile, stop=halt, on_cycle=on_cycle)
+        return cycles
+
+    def _slow_homing_profile(self, fast):
+        ramp = fast.ramp
+        start_rate = 1 / ramp[0] if ramp else fast.cruise_rate
+        return ConstantProfile(start_rate * self._SLOW_HOMING_FRACTION)
+
+    def _homing_timeout(self, fast, slow):
+        if self._homing.timeout is not None:
+            return self._homing.timeout
+        phases = self.motor.phases_per_cycle
+        travel = (self._max - self._min) * phases
+        backoff = self._homing.backoff * phases
+        return max(
+            self._MIN_HOMING_TIMEOUT,
+            self._HOMING_TIMEOUT_MARGIN * (
+                fast.duration(travel) + 2 * slow.duration(backoff)))
+
+    def _goto_request(self, request, profile, stop):
+        self._carry = None
+        self._check_homed()
         delta = request - self._position
+        if delta:
+            self._step(delta, profile, stop)
+        self._park()
+        return self._position
+
+    def _step(self, delta, profile, stop, on_cycle=None, **levels):
+        # Move by delta positions and return the number moved. Backward moves
+        # halt within a phase if the end stop triggers, which re-references
+        # the position to home. on_cycle is called after each position.
+        if self._journal is not None:
+            self._journal.record()
+        advance = partial(self._advance_position, 1 if delta > 0 else -1)
+        if on_cycle is not None:
+            advance = partial(self._advance_and_call, advance, on_cycle)
         if delta > 0:
-            self.motor.forward(delta)
+            moved = self.motor.forward(
+                delta, profile=profile, stop=stop, on_cycle=advance,
+                **levels)
+            self._at_home_position.clear()
+            return moved
+        target = self._position + delta
+        moved = self.motor.backward(
+            -delta, profile=profile, stop=stop, on_cycle=advance,
+            halt=self._at_home_position, **levels)
+        if self._at_home_position.is_set():
+            self._re_reference(target)
+        return moved
+
+    @staticmethod
+    def _advance_and_call(advance, on_cycle):
+        advance()
+        on_cycle()
+
+    def _re_reference(self, target):
+        # a backward move halted by the end stop is at home, whatever the
+        # position was counted as
+        if target != self._min:
+            _LOGGER.warning(
+                "End stop triggered at position %r on the way to %r",
+                self._position, target)
+        self._set_position(self._min)
+
+    def _begin_steps(self, delta):
+        # start a move of delta positions whose phases are written through
+        # motor.phase_stepper by a scheduler that interleaves several stages,
+        # eg. MultiAxisStage. Returns the token for _end_steps.
+        self._carry = None
+        if self._journal is not None:
+            self._journal.record()
+        return self.motor.begin_move(delta > 0, abs(delta))
+
+    def _end_steps(self, delta, target, moved, token):
+        # finish a move started with _begin_steps as _step and _park would,
+        # once moved of the delta positions are done
+        self.motor.end_move(delta > 0, moved, token)
+        if delta > 0:
+            if not self.end_stop.triggered:
+                self._at_home_position.clear()
+        elif self._at_home_position.is_set():
+            self._re_reference(target)
+        self._park()
+
+    def _follow(self, trajectory, profile, stop):
+        # pylint: disable=too-many-locals
+        self._carry = None
+        self._check_homed()
+        phases_per_cycle = self.motor.phases_per_cycle
+        # each segment starts from rest and may reverse, so it runs no faster
+        # than the rate the motor can start and stop at without a ramp
+        ramp = profile.ramp
+        min_delay = ramp[0] if ramp else 1 / profile.cruise_rate
+        samples = 0
+        max_lag = max_lead = 0.0
+
+        def now():
+            return self.clock.now_ns() / 1e9
+
+        start = now()
+        try:
+            for sample_time, request in trajectory:
+                if stop.is_set():
+                    break
+                target = round(request)
+                self._check_in_range(target)
+                if self._trace is not None:
+                    self._trace.record(MOVE_REQUEST, target)
+                samples += 1
+                delta = target - self._position
+                if delta:
+                    remaining = start + sample_time - now()
+                    delay = max(
+                        remaining / (abs(delta) * phases_per_cycle),
+                        min_delay)
+                    self._step(
+                        delta, ConstantProfile.from_delay(delay), stop)
+                lag = now() - start - sample_time
+                if lag < 0:
+                    # hold the position until the sample is due
+                    max_lead = max(max_lead, -lag)
+                    self._hold_until(start + sample_time, stop)
+                    lag = max(now() - start - sample_time, 0.0)
+                self._lag = lag
+                max_lag = max(max_lag, lag)
+        finally:
+            self._park()
+        return TrackingReport(
+            samples, self._position, max_lag, self._lag, max_lead)
+
+    def _hold_until(self, deadline, stop):
+        # wait in slices so that cancelling a long hold takes effect promptly
+        deadline_ns = int(deadline * 1e9)
+        while not stop.is_set():
+            now_ns = self.clock.now_ns()
+            if now_ns >= deadline_ns:
+                return
+            self.clock.sleep_until(
+                min(deadline_ns, now_ns + self._HOLD_SLICE_NS))
+
+    def _run_queued(self):
+        with self._queue_lock:
+            segment = self._queue.popleft()
+            upcoming = tuple(self._queue)
+        if not segment.future.set_running_or_notify_cancel():
+            return
+        try:
+            if segment.stop.is_set():
+                position = self._skip(segment, upcoming)
+            else:
+                position = self._run_segment(segment, upcoming)
+        except Exception as error: # pylint: disable=broad-except
+            self._carry = None
+            self._park()
+            segment.future.set_exception(error)
+            return
+        with self._queue_lock:
+            drained = not self._queue \
+                or self._queue[0].ticket != segment.ticket + 1
+        if drained:
+            self._carry = None
+            self._park()
+        segment.future.set_result(position)
+
+    def _run_segment(self, segment, upcoming):
+        self._check_homed()
+        delta = segment.target - self._position
+        if not delta:
+            # the planner looked past this move, so any speed carries on
+            return self._position
+        forward = delta > 0
+        entry_level = 0
+        if self._carry is not None:
+            carry_forward, carry_profile, carry_level = self._carry
+            if carry_forward == forward and carry_profile is segment.profile:
+                entry_level = carry_level + 1
+        exit_level = self._plan_exit_level(segment, forward, upcoming)
+        control = MoveControl(exit_level)
+        cycles = abs(delta)
+        moved = self._step(
+            delta,
+            segment.profile,
+            segment.stop,
+            on_cycle=partial(
+                self._replan_exit, segment, forward, upcoming, control),
+            entry_level=entry_level,
+            exit_level=exit_level,
+            control=control)
+        self._carry = None
+        if moved == cycles:
+            self._carry = (forward, segment.profile, control.level)
+        return self._position
+
+    def _replan_exit(self, segment, forward, upcoming, control):
+        # a move that the exit level was planned for may have been cancelled
+        # since, in which case slow down in time to stop at the target
+        if control.exit_level and any(
+                queued.stop.is_set() for queued in upcoming):
+            with self._queue_lock:
+                upcoming = tuple(self._queue)
+            control.lower_exit_level(
+                self._plan_exit_level(segment, forward, upcoming))
+
+    def _skip(self, segment, upcoming):
+        # Pass over a cancelled move. Any speed carried into it must still be
+        # slow enough to stop in the moves queued after it, or else it was
+        # cancelled too late for the move before to stop at its target. Then
+        # slow down along the way the motor was heading, which the planner
+        # left room for.
+        if self._carry is None:
+            return self._position
+        forward, profile, level = self._carry
+        allowed = self._plan_exit_level(
+            segment._replace(target=self._position, profile=profile),
+            forward,
+            upcoming)
+        if level <= allowed:
+            return self._position
+        self._carry = None
+        phases_per_cycle = self.motor.phases_per_cycle
+        cycles = (level + phases_per_cycle - 1) // phases_per_cycle
+        if forward:
+            cycles = min(cycles, self._max - self._position)
         else:
-            self.motor.backward(delta)
-        self.motor.deactivate()
+            cycles = -min(cycles, self._position - self._min)
+        control = MoveControl()
+        control.brake()
+        self._step(
+            cycles, profile, None, entry_level=level + 1, control=control)
+        return self._position
+
+    def _plan_exit_level(self, segment, forward, upcoming):
+        # Look ahead along the queued moves that continue in the same
+        # direction with the same profile. The last of these must come to a
+        # stop, and working backwards each move may enter at most one level
+        # faster than the move before it exits. Moves only blend if nothing
+        # else runs on the motion thread between them.
+        phases_per_cycle = self.motor.phases_per_cycle
+        position = segment.target
+        ticket = segment.ticket
+        chain = []
+        for queued in upcoming:
+            if queued.ticket != ticket + 1:
+                break
+            ticket = queued.ticket
+            if queued.stop.is_set():
+                continue
+            delta = queued.target - position
+            if not delta:
+                continue
+            if (delta > 0) != forward or queued.profile is not segment.profile:
+                break
+            chain.append(abs(delta) * phases_per_cycle)
+            position = queued.target
+        exit_level = 0
+        for phases in reversed(chain):
+            exit_level = max(exit_level + phases - 2, 0)
+        return exit_level
@@ -0,0 +1,162 @@
+"""
+A fixed-size ring buffer of compact binary trace records that the motor, its
+coils, the end stop and the stage write into from their hot paths in place
+of logging. Recording packs a handful of numbers into a preallocated buffer and
+nothing else - no formatting, no log records and no handler calls - and a
+component with no trace pays only for checking that it has none. Copying
+the records out and decoding them is left to whoever reads the trace, off
+the hot path.
+
+Usage:
+    trace = TraceBuffer()
+    stage = Stage(factory, trace=trace)
+    ...
+    for event in decode(trace.snapshot()):
+        print(format_event(event))
+"""
+import itertools
+import struct
+import time
+from collections import namedtuple
+
+DEFAULT_CAPACITY = 4096
+
+# event codes and the value recorded with each
+MOVE_FORWARD = 1        # cycles requested
+MOVE_BACKWARD = 2       # cycles requested
+MOVE_DONE = 3           # cycles moved
+COIL_WRITE = 4          # coil bitmask
+COILS_OFF = 5           # 0
+END_STOP_READ = 6       # 1 if triggered
+END_STOP_TRIGGERED = 7  # 0
+POSITION = 8            # position index
+MOVE_REQUEST = 9        # requested position index
+HOMED = 10              # home position index
+
+EVENT_NAMES = {
+    MOVE_FORWARD: 'move_forward',
+    MOVE_BACKWARD: 'move_backward',
+    MOVE_DONE: 'move_done',
+    COIL_WRITE: 'coil_write',
+    COILS_OFF: 'coils_off',
+    END_STOP_READ: 'end_stop_read',
+    END_STOP_TRIGGERED: 'end_stop_triggered',
+    POSITION: 'position',
+    MOVE_REQUEST: 'move_request',
+    HOMED: 'homed',
+}
+
+# sequence, timestamp_ns, code, value. Slots not yet written have sequence 0.
+RECORD = struct.Struct('<QqIq')
+
+TraceEvent = namedtuple(
+    'TraceEvent', ['sequence', 'timestamp_ns', 'code', 'value'])
+TraceEvent.__doc__ = """
+A decoded trace record
+
+Attributes:
+    sequence (int): the number of the record in the order recorded, from 1.
+        Gaps mean records were overwritten.
+    timestamp_ns (int): the time the event was recorded
+    code (int): the event code eg. COIL_WRITE
+    value (int): the value recorded with the event
+"""
+
+
+class TraceBuffer:
+    """
+    A preallocated ring of binary trace records. Once full, each new record
+    overwrites the oldest. Records may be written from several threads
+    without locking: each takes its own sequence number and slot.
+
+    Args:
+        capacity (int): the number of records kept
+        clock (callable): returns the time in nanoseconds for each record.
+            Defaults to time.monotonic_ns. Pass a VirtualClock's now_ns to
+            trace simulated time.
+
+    Attributes:
+        record (callable): record(code, value=0) records an event
+    """
+    def __init__(self, capacity: int=DEFAULT_CAPACITY, clock=None):
+        if capacity < 1:
+            raise ValueError("A trace needs room for at least one record")
+        self._capacity = capacity
+        self._clock = clock or time.monotonic_ns
+        self._buffer = bytearray(capacity * RECORD.size)
+        self.record = self._recorder()
+
+    @property
+    def capacity(self) -> int:
+        """
+        The number of records kept
+        """
+        return self._capacity
+
+    def snapshot(self) -> bytes:
+        """
+        Copy out the record slots. Tracing may continue while the snapshot is
+        taken.
+
+        Returns:
+            (bytes): the packed records, to be decoded with decode
+        """
+        return bytes(self._buffer)
+
+    def clear(self):
+        """
+        Discard the records kept and restart the sequence
+        """
+        self._buffer[:] = bytes(len(self._buffer))
+        self.record = self._recorder()
+
+    def _recorder(self):
+        # the record function closes over everything it needs so recording
+        # does no attribute lookups. next() on a count is atomic, so
+        # concurrent writers get their own sequence numbers and slots.
+        buffer = self._buffer
+        capacity = self._capacity
+        clock = self._clock
+        pack = RECORD.pack_into
+        size = RECORD.size
+        sequences = itertools.count(1)
+
+        def record(code: int, value: int=0):
+            sequence = next(sequences)
+            pack(
+                buffer, sequence % capacity * size,
+                sequence, clock(), code, value)
+
+        return record
+
+
+def decode(data: bytes):
+    """
+    Decode the packed records of a snapshot
+
+    Args:
+        data (bytes): a TraceBuffer snapshot
+
+    Returns:
+        (list): the TraceEvents in the order recorded
+    """
+    return sorted(
+        TraceEvent(*fields) for fields in RECORD.iter_unpack(data)
+        if fields[0])
+
+
+def format_event(event: TraceEvent, start_ns: int=0) -> str:
+    """
+    Describe an event for humans
+
+    Args:
+        event (TraceEvent): the event
+        start_ns (int): subtracted from the event's timestamp
+
+    Returns:
+        (str): the time in milliseconds, the event name and its value
+    """
+    return "%12.3fms %-20s %d" % (
+        (event.timestamp_ns - start_ns) / 1e6,
+        EVENT_NAMES.get(event.code, 'event_%d' % event.code),
+        event.value)
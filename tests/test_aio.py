@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from stage.aio import AsyncStage
+from stage.factory.mock import MockStageFactory
+from stage.factory.config import Configurator
+from stage.move import Move
+
+
+class AsyncStageTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = MockStageFactory(config)
+        self.stage = await AsyncStage.create(self.factory)
+
+    async def asyncTearDown(self):
+        await self.stage.close()
+
+    async def test_move_to_returns_position_reached(self):
+        self.assertEqual(await self.stage.move_to(40), 40)
+        self.assertEqual(self.stage.position, 40)
+
+    async def test_home_returns_to_end_stop(self):
+        await self.stage.move_to(40)
+        self.assertFalse(self.stage.end_stop_triggered.is_set())
+        self.assertEqual(await self.stage.home(), 0)
+        await asyncio.wait_for(self.stage.end_stop_triggered.wait(), 5)
+
+    async def test_home_clears_end_stop_flag_as_it_starts(self):
+        self.assertTrue(self.stage.end_stop_triggered.is_set())
+        homed = Future()
+        homed.set_result(0)
+        # homing that never reaches the end stop
+        with mock.patch.object(
+                self.stage.stage, 'move_home',
+                return_value=Move(0, homed, threading.Event())):
+            await self.stage.home()
+        self.assertFalse(self.stage.end_stop_triggered.is_set())
+
+    async def test_end_stop_callbacks_run_in_event_loop(self):
+        loop = asyncio.get_running_loop()
+        called = loop.create_future()
+        self.stage.add_end_stop_callback(
+            lambda: called.set_result(asyncio.get_running_loop()))
+        await self.stage.move_to(10)
+        await self.stage.home()
+        self.assertIs(await asyncio.wait_for(called, 5), loop)
+
+    async def test_positions_iterates_over_updates(self):
+        seen = []
+
+        async def watch():
+            async for position in self.stage.positions():
+                seen.append(position)
+                if position == 5:
+                    break
+
+        watcher = asyncio.ensure_future(watch())
+        await asyncio.sleep(0)
+        await self.stage.move_to(5)
+        await asyncio.wait_for(watcher, 5)
+        self.assertEqual(seen, [0, 1, 2, 3, 4, 5])
+
+
+class DeferredHomingAsyncTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_wait_ready_resolves_once_homed(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        stage = await AsyncStage.create(
+            MockStageFactory(config), defer_homing=True)
+        self.addCleanup(stage.stage.close)
+        self.assertEqual(await asyncio.wait_for(stage.wait_ready(), 5), 0)
+        self.assertEqual(await stage.move_to(10), 10)
+
+    async def test_closing_stops_end_stop_notifications(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        factory = MockStageFactory(config)
+        calls = []
+        async with await AsyncStage.create(factory) as stage:
+            stage.add_end_stop_callback(lambda: calls.append(None))
+            await stage.move_to(10)
+        factory.end_stop.input.activate()
+        await asyncio.sleep(0.01)
+        self.assertEqual(calls, [])
+        with self.assertRaises(RuntimeError):
+            stage.stage.move_to(20)
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from stage import bench
+from stage.gpio import mock as mockgpio
+
+
+class BenchmarkTestGroup(unittest.TestCase):
+
+    def make_group(self):
+        return mockgpio.OutputGroup(
+            *(mockgpio.OutputChannel(pin) for pin in range(4)))
+
+    def test_coil_write_benchmark_reports_latency_and_rate(self):
+        result = bench.bench_coil_writes(self.make_group(), writes=100)
+        self.assertGreater(result['write_latency_ns'], 0)
+        self.assertGreater(result['writes_per_s'], 0)
+
+    def test_phase_loop_benchmark_reports_rate(self):
+        result = bench.bench_phase_loop(self.make_group(), cycles=10)
+        self.assertGreater(result['phases_per_s'], 0)
+
+    def test_trace_benchmark_reports_latency(self):
+        result = bench.bench_trace_record(records=100)
+        self.assertGreater(result['record_latency_ns'], 0)
+
+    def test_metrics_benchmark_reports_latency(self):
+        result = bench.bench_metrics_update(updates=100)
+        self.assertGreater(result['update_latency_ns'], 0)
+
+    def test_homing_benchmark_reports_duration(self):
+        self.assertGreater(bench.bench_homing(repeats=1)['homing_s'], 0)
+
+    def test_baseline_round_trip(self):
+        results = {'phase_loop': {'phases_per_s': 1000.0}}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            bench.save(results, path)
+            self.assertEqual(bench.load(path), results)
+
+
+class RegressionTestGroup(unittest.TestCase):
+    BASELINE = {
+        'phase_loop': {'phases_per_s': 1000.0},
+        'coil_writes': {'write_latency_ns': 100.0},
+    }
+
+    def test_within_tolerance_is_not_regression(self):
+        results = {
+            'phase_loop': {'phases_per_s': 900.0},
+            'coil_writes': {'write_latency_ns': 110.0},
+        }
+        self.assertEqual(bench.compare(results, self.BASELINE), [])
+
+    def test_slower_rate_and_longer_latency_are_regressions(self):
+        results = {
+            'phase_loop': {'phases_per_s': 500.0},
+            'coil_writes': {'write_latency_ns': 200.0},
+        }
+        self.assertEqual(bench.compare(results, self.BASELINE), [
+            ('coil_writes', 'write_latency_ns', 100.0, 200.0),
+            ('phase_loop', 'phases_per_s', 1000.0, 500.0),
+        ])
+
+    def test_metrics_missing_from_baseline_ignored(self):
+        results = {'homing': {'homing_s': 10.0}}
+        self.assertEqual(bench.compare(results, self.BASELINE), [])
@@ -0,0 +1,75 @@
+import unittest
+
+from stage import calibration
+from stage.factory.config import Configurator
+from stage.factory.simulator import SimulatedStageFactory
+from stage.motor import drive
+from stage.motor.profile import ConstantProfile
+from stage.stage import Stage
+
+
+class SearchRateTestGroup(unittest.TestCase):
+
+    def test_finds_threshold_within_tolerance(self):
+        rate = calibration.search_rate(lambda rate: rate <= 300, 50, 2000)
+        self.assertLessEqual(rate, 300)
+        self.assertGreater(rate, 300 / 1.05)
+
+    def test_returns_high_if_it_passes(self):
+        self.assertEqual(
+            calibration.search_rate(lambda rate: True, 50, 2000), 2000)
+
+    def test_returns_low_if_nothing_faster_passes(self):
+        self.assertEqual(
+            calibration.search_rate(lambda rate: False, 50, 2000), 50)
+
+
+class SimulatedCalibrationTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=100,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = SimulatedStageFactory(
+            config, start_position=10, ms_delay=3)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_safe_rate_passes(self):
+        self.assertTrue(
+            calibration.check_rate(self.stage, ConstantProfile(50), 40))
+        self.assertEqual(self.stage.position, 0)
+        self.assertAlmostEqual(self.factory.true_position, 0, delta=0.3)
+
+    def test_lost_steps_fail_and_rehome(self):
+        self.assertFalse(
+            calibration.check_rate(self.stage, ConstantProfile(2000), 40))
+        self.assertEqual(self.stage.position, 0)
+        self.assertTrue(self.factory.end_stop.triggered)
+
+    def test_calibrated_profile_is_reliable(self):
+        results = calibration.calibrate(
+            self.stage,
+            [drive.HalfStepDriveScheme.name],
+            distance=40,
+            acceleration=20000,
+            tolerance=0.1)
+        result = results[drive.HalfStepDriveScheme.name]
+        self.assertGreater(result.start_rate, calibration.MIN_RATE)
+        self.assertGreaterEqual(result.cruise_rate, result.start_rate)
+        profile = calibration.to_profiles(results)[result.drive_scheme]
+        self.stage.move_to(80, profile=profile).result()
+        self.assertAlmostEqual(self.factory.true_position, 80, delta=0.3)
+
+    def test_drive_scheme_restored(self):
+        self.stage.motor.drive_scheme = drive.FullStepDriveScheme.name
+        calibration.calibrate(
+            self.stage, [drive.HalfStepDriveScheme.name], distance=10,
+            tolerance=0.5)
+        self.assertEqual(
+            self.stage.motor.drive_scheme, drive.FullStepDriveScheme.name)
@@ -0,0 +1,206 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from stage.factory.chardev import ChardevStageFactory
+from stage.factory.config import Configurator
+from stage.gpio import chardev
+from stage.gpio import error
+from stage.gpio.fakechip import FakeChip
+from stage.motor import drive
+from stage.motor import profile
+from stage.stage import Stage
+
+PINS = (26, 19, 13, 6)
+END_STOP_PIN = 22
+
+
+class LineRequestLayoutTestGroup(unittest.TestCase):
+
+    def test_request_matches_kernel_struct_size(self):
+        self.assertEqual(len(chardev.pack_line_request(PINS, 0)), 592)
+
+    def test_request_packs_offsets_and_output_values(self):
+        request = chardev.pack_line_request(
+            PINS, chardev.FLAG_OUTPUT, values=0b0101)
+        fields = chardev._LINE_REQUEST.unpack(request)
+        self.assertEqual(fields[:4], PINS)
+        self.assertEqual(fields[64].rstrip(b'\0'), b'stage')
+        self.assertEqual(fields[65:67], (chardev.FLAG_OUTPUT, 1))
+        self.assertEqual(fields[67:70], (2, 0b0101, 0b1111))
+        self.assertEqual(fields[-3:], (4, 16, -1))
+
+    def test_too_many_lines_rejected(self):
+        with self.assertRaises(error.GpioError):
+            chardev.pack_line_request(tuple(range(65)), 0)
+
+    def test_events_unpacked_in_order(self):
+        events = [
+            chardev.LineEvent(100, chardev.EVENT_RISING_EDGE, 22, 1, 1),
+            chardev.LineEvent(250, chardev.EVENT_FALLING_EDGE, 22, 2, 2)]
+        data = b''.join(chardev._LINE_EVENT.pack(*event) for event in events)
+        self.assertEqual(chardev.unpack_events(data), events)
+
+
+class ChardevOutputTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.chip = FakeChip()
+
+    def test_output_requested_low(self):
+        output = chardev.OutputChannel(PINS[0], self.chip)
+        self.assertTrue(self.chip.requested(PINS[0]))
+        self.assertFalse(self.chip.level(PINS[0]))
+        output.activate()
+        self.assertTrue(self.chip.level(PINS[0]))
+        self.assertTrue(output.state)
+
+    def test_line_cannot_be_requested_twice(self):
+        chardev.OutputChannel(PINS[0], self.chip)
+        with self.assertRaises(error.GpioError):
+            chardev.OutputChannel(PINS[0], self.chip)
+
+    def test_group_writes_all_lines_in_one_ioctl(self):
+        group = chardev.OutputGroup(
+            *(chardev.OutputChannel(pin, self.chip) for pin in PINS))
+        calls = self.chip.set_values_calls
+        group.write(0b1001)
+        self.assertEqual(self.chip.set_values_calls, calls + 1)
+        self.assertEqual(
+            [self.chip.level(pin) for pin in PINS], [True, False, False, True])
+        self.assertEqual(
+            [output.state for output in group.outputs],
+            [True, False, False, True])
+
+    def test_unchanged_group_write_skipped(self):
+        group = chardev.OutputGroup(
+            *(chardev.OutputChannel(pin, self.chip) for pin in PINS))
+        group.write(0b0011)
+        calls = self.chip.set_values_calls
+        group.write(0b0011)
+        self.assertEqual(self.chip.set_values_calls, calls)
+
+    def test_group_output_writes_through_shared_request(self):
+        group = chardev.OutputGroup(
+            *(chardev.OutputChannel(pin, self.chip) for pin in PINS))
+        group.outputs[2].activate()
+        self.assertTrue(self.chip.level(PINS[2]))
+        self.assertFalse(self.chip.level(PINS[0]))
+
+
+class ChardevInputTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.chip = FakeChip()
+        self.input = chardev.InputChannel(END_STOP_PIN, True, self.chip)
+        self.addCleanup(self.input.close)
+
+    def test_pulled_up_and_inactive(self):
+        self.assertTrue(self.chip.level(END_STOP_PIN))
+        self.assertFalse(self.input.state)
+
+    def test_callback_given_kernel_timestamp_of_activation(self):
+        called = threading.Event()
+        edges = []
+
+        def callback(pin, timestamp_ns):
+            edges.append((pin, timestamp_ns))
+            called.set()
+
+        self.input.register_callback(callback)
+        self.chip.set_input(END_STOP_PIN, False, timestamp_ns=1234)
+        self.assertTrue(called.wait(1))
+        self.assertTrue(self.input.state)
+        self.assertEqual(edges, [(END_STOP_PIN, 1234)])
+
+    def test_only_activation_reported(self):
+        activated = threading.Event()
+        edges = []
+
+        def callback(_pin, timestamp_ns):
+            edges.append(timestamp_ns)
+            activated.set()
+
+        self.input.register_callback(callback)
+        self.chip.set_input(END_STOP_PIN, False, timestamp_ns=1)
+        self.chip.set_input(END_STOP_PIN, True, timestamp_ns=2)
+        self.assertTrue(activated.wait(1))
+        activated.clear()
+        self.chip.set_input(END_STOP_PIN, False, timestamp_ns=3)
+        self.assertTrue(activated.wait(1))
+        self.assertEqual(edges, [1, 3])
+        self.assertTrue(self.input.state)
+
+    def test_close_releases_line(self):
+        chip = FakeChip()
+        channel = chardev.InputChannel(END_STOP_PIN, False, chip)
+        channel.close()
+        self.assertFalse(chip.requested(END_STOP_PIN))
+
+
+class CarriageChip(FakeChip):
+    """
+    Moves a simulated carriage a phase for each step of the coil sequence and
+    drives the end stop at home
+    """
+    def __init__(self, phases):
+        super().__init__()
+        self.masks = [
+            phase.mask for phase in
+            drive.compile_scheme(drive.HalfStepDriveScheme).forward]
+        self.phases = phases
+        self.index = None
+
+    def _set_values(self, request, bits, mask):
+        super()._set_values(request, bits, mask)
+        if request.offsets != PINS or bits not in self.masks:
+            return
+        index = self.masks.index(bits)
+        if self.index is not None:
+            step = (index - self.index) % len(self.masks)
+            self.phases += {1: 1, len(self.masks) - 1: -1}.get(step, 0)
+        self.index = index
+        self.set_input(END_STOP_PIN, self.phases > 0)
+
+
+class ChardevStageTestGroup(unittest.TestCase):
+
+    def test_stage_homes_and_moves(self):
+        chip = CarriageChip(phases=80)
+        config = Configurator(
+            motor_pins=PINS,
+            end_stop_pin=END_STOP_PIN,
+            end_stop_active_low=True,
+            maximum_position=20,
+            minimum_position=0)
+        factory = ChardevStageFactory(config, chip=chip)
+        factory.motor.profile = profile.ConstantProfile(20000)
+        stage = Stage(factory)
+        self.addCleanup(factory.end_stop.input.close)
+        self.assertEqual(stage.position, 0)
+        self.assertLessEqual(chip.phases, 0)
+        stage.position = 3
+        self.assertEqual(stage.position, 3)
+        self.assertFalse(factory.end_stop.triggered)
+
+    def test_motor_takes_drive_scheme_and_calibration_from_config(self):
+        saved = profile.TrapezoidalProfile(
+            start_rate=100, cruise_rate=300, acceleration=2000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calibration.json")
+            profile.save_calibration(
+                path, {drive.FullStepDriveScheme.name: saved})
+            config = Configurator(
+                motor_pins=PINS,
+                end_stop_pin=END_STOP_PIN,
+                end_stop_active_low=True,
+                maximum_position=20,
+                minimum_position=0,
+                drive_scheme=drive.FullStepDriveScheme.name,
+                calibration_file=path)
+            factory = ChardevStageFactory(config, chip=FakeChip())
+        self.addCleanup(factory.end_stop.input.close)
+        self.assertEqual(
+            factory.motor.drive_scheme, drive.FullStepDriveScheme.name)
+        self.assertEqual(repr(factory.motor.profile), repr(saved))
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from stage.factory.config import Configurator
+from stage.factory.gpiomem import GpiomemStageFactory
+from stage.gpio import error
+from stage.gpio import gpiomem
+from stage.gpio.fakechip import FakeChip
+from stage.motor import drive
+
+PINS = (26, 19, 13, 6)
+END_STOP_PIN = 22
+COIL_BITS = sum(1 << pin for pin in PINS)
+
+
+class RegisterFileTestCase(unittest.TestCase):
+    """
+    Maps a regular file in place of /dev/gpiomem
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.ftruncate(fd, gpiomem.BLOCK_SIZE)
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.registers = gpiomem.GpioRegisters(self.path)
+        self.addCleanup(self.registers.close)
+
+    def register(self, offset):
+        with open(self.path, 'rb') as registers:
+            registers.seek(offset)
+            return int.from_bytes(registers.read(4), 'little')
+
+
+class GpioRegistersTestGroup(RegisterFileTestCase):
+
+    def test_select_function_keeps_other_pins(self):
+        self.registers.write(gpiomem.GPFSEL0 + 8, 0o7777777777)
+        self.registers.select_function(26, gpiomem.FUNCTION_OUTPUT)
+        self.assertEqual(self.registers.function(26), gpiomem.FUNCTION_OUTPUT)
+        self.assertEqual(self.registers.function(25), 0b111)
+        self.assertEqual(self.registers.function(27), 0b111)
+
+    def test_writes_reach_the_mapped_file(self):
+        self.registers.write(gpiomem.GPSET0, 0x12345678)
+        self.assertEqual(self.register(gpiomem.GPSET0), 0x12345678)
+
+
+class GpiomemOutputTestGroup(RegisterFileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outputs = [
+            gpiomem.OutputChannel(pin, self.registers) for pin in PINS]
+
+    def test_outputs_selected_and_cleared(self):
+        for pin in PINS:
+            self.assertEqual(
+                self.registers.function(pin), gpiomem.FUNCTION_OUTPUT)
+        self.assertEqual(self.register(gpiomem.GPCLR0), 1 << PINS[-1])
+
+    def test_output_activation_sets_its_bit(self):
+        self.outputs[1].activate()
+        self.assertEqual(self.register(gpiomem.GPSET0), 1 << PINS[1])
+        self.assertTrue(self.outputs[1].state)
+
+    def test_bank_1_gpio_rejected(self):
+        with self.assertRaises(error.GpioError):
+            gpiomem.OutputChannel(40, self.registers)
+
+    def test_group_writes_each_drive_state_as_one_set_and_clear(self):
+        group = gpiomem.OutputGroup(*self.outputs)
+        for scheme in drive.DriveScheme.__subclasses__():
+            for mask, _ in drive.compile_scheme(scheme).forward:
+                group.write(mask)
+                high = sum(
+                    1 << pin for bit, pin in enumerate(PINS)
+                    if mask >> bit & 1)
+                self.assertEqual(self.register(gpiomem.GPSET0), high)
+                self.assertEqual(
+                    self.register(gpiomem.GPCLR0), COIL_BITS & ~high)
+                self.assertEqual(
+                    [output.state for output in self.outputs],
+                    [bool(mask >> bit & 1) for bit in range(len(PINS))])
+
+    def test_unchanged_group_write_skipped(self):
+        group = gpiomem.OutputGroup(*self.outputs)
+        group.write(0b0011)
+        self.registers.write(gpiomem.GPSET0, 0)
+        group.write(0b0011)
+        self.assertEqual(self.register(gpiomem.GPSET0), 0)
+
+
+class GpiomemStageFactoryTestGroup(RegisterFileTestCase):
+
+    def test_factory_drives_coils_through_registers(self):
+        config = Configurator(
+            motor_pins=PINS,
+            end_stop_pin=END_STOP_PIN,
+            end_stop_active_low=True,
+            maximum_position=20,
+            minimum_position=0)
+        chip = FakeChip()
+        factory = GpiomemStageFactory(
+            config, registers=self.registers, chip=chip)
+        self.addCleanup(factory.end_stop.input.close)
+        factory.motor.forward(1)
+        table = drive.compile_scheme(drive.HalfStepDriveScheme).forward
+        last = sum(
+            1 << pin for bit, pin in enumerate(PINS)
+            if table[-1].mask >> bit & 1)
+        self.assertEqual(self.register(gpiomem.GPSET0), last)
+        self.assertFalse(factory.end_stop.triggered)
+        chip.set_input(END_STOP_PIN, False)
+        self.assertTrue(factory.end_stop.triggered)
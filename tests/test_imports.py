@@ -0,0 +1,105 @@
+import subprocess
+import sys
+import unittest
+
+from stage.exceptions import BadConfigurationData
+from stage.factory import BACKENDS, create_factory, get_factory
+from stage.factory.config import Configurator
+from stage.factory.mock import MockStageFactory
+
+# the slowest acceptable cumulative imports in microseconds, as reported by
+# python -X importtime, of the modules users and the command line import.
+# Each is the best of IMPORT_RUNS fresh interpreters.
+IMPORT_BUDGETS_US = {
+    'stage.stage': 75000,
+    'stage.__main__': 50000,
+}
+IMPORT_RUNS = 3
+
+BACKEND_MODULES = {path.split(':')[0] for path in BACKENDS.values()} | {
+    'stage.gpio.chardev', 'stage.gpio.gpiomem', 'stage.gpio.rpi',
+    'stage.gpio.wave', 'RPi', 'RPi.GPIO'}
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        capture_output=True, text=True, check=True)
+
+
+def imported_modules(statement):
+    result = run_python(
+        '-c', statement + '; import sys; print("\\n".join(sys.modules))')
+    return set(result.stdout.split())
+
+
+def import_time_us(module):
+    best = None
+    for _ in range(IMPORT_RUNS):
+        result = run_python('-X', 'importtime', '-c', 'import ' + module)
+        for line in result.stderr.splitlines():
+            fields = line[len('import time:'):].split('|')
+            if line.startswith('import time:') \
+                    and fields[2].strip() == module:
+                cumulative = int(fields[1])
+                best = cumulative if best is None else min(best, cumulative)
+    return best
+
+
+class ImportSideEffectTestGroup(unittest.TestCase):
+
+    def test_imports_within_budget(self):
+        for module, budget in IMPORT_BUDGETS_US.items():
+            with self.subTest(module=module):
+                self.assertLess(import_time_us(module), budget)
+
+    def test_imports_load_no_backend(self):
+        for module in IMPORT_BUDGETS_US:
+            with self.subTest(module=module):
+                self.assertFalse(
+                    imported_modules('import ' + module) & BACKEND_MODULES)
+
+    def test_config_and_rpi_backend_import_without_rpi_gpio(self):
+        modules = imported_modules(
+            'import stage.config, stage.gpio.rpi, stage.factory.rpi')
+        self.assertNotIn('RPi.GPIO', modules)
+
+    def test_entry_point_does_not_configure_logging(self):
+        result = run_python(
+            '-c', 'import logging, stage.__main__; '
+            'print(len(logging.getLogger().handlers))')
+        self.assertEqual(result.stdout.strip(), '0')
+
+
+class BackendLookupTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Configurator(
+            maximum_position=10,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+
+    def test_factory_resolved_by_name(self):
+        self.assertIs(get_factory('mock'), MockStageFactory)
+
+    def test_every_backend_names_a_factory(self):
+        for backend, path in BACKENDS.items():
+            module, name = path.split(':')
+            self.assertTrue(module.startswith('stage.factory.'), backend)
+            self.assertTrue(name.endswith('Factory'), backend)
+
+    def test_unknown_backend_rejected(self):
+        with self.assertRaises(BadConfigurationData):
+            get_factory('gpio')
+
+    def test_backend_defaults_to_config(self):
+        config = Configurator(
+            maximum_position=10,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True,
+            backend='mock')
+        self.assertIsInstance(create_factory(None, config), MockStageFactory)
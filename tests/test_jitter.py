@@ -0,0 +1,74 @@
+import unittest
+
+from stage.motor import jitter
+
+
+class LatencyHistogramTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.histogram = jitter.LatencyHistogram()
+
+    def test_empty_histogram_percentiles_are_zero(self):
+        self.assertEqual(self.histogram.percentile(50), 0)
+        self.assertEqual(self.histogram.count, 0)
+
+    def test_small_values_counted_exactly(self):
+        for value in (1, 2, 3):
+            self.histogram.record(value)
+        self.assertEqual(self.histogram.percentile(50), 2)
+        self.assertEqual(self.histogram.max, 3)
+
+    def test_large_values_within_relative_precision(self):
+        for value in range(1000, 1000001, 1000):
+            self.histogram.record(value)
+        self.assertAlmostEqual(
+            self.histogram.percentile(50), 500000, delta=500000 * 0.04)
+        self.assertAlmostEqual(
+            self.histogram.percentile(99), 990000, delta=990000 * 0.04)
+        self.assertEqual(self.histogram.max, 1000000)
+
+    def test_values_beyond_range_counted_in_last_bucket(self):
+        self.histogram.record(1 << 50)
+        self.assertEqual(self.histogram.count, 1)
+        self.assertEqual(self.histogram.percentile(100), 1 << 50)
+
+    def test_reset_forgets_values(self):
+        self.histogram.record(100)
+        self.histogram.reset()
+        self.assertEqual(self.histogram.count, 0)
+        self.assertEqual(self.histogram.max, 0)
+
+
+class PhaseJitterTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.jitter = jitter.PhaseJitter(lambda: self.now, tolerance_us=100)
+        self.jitter.start()
+
+    def test_intervals_between_marks_recorded(self):
+        for _ in range(10):
+            self.jitter.mark(0.001)
+            self.now += 1000000
+        report = self.jitter.report()
+        self.assertEqual(report.count, 9)
+        self.assertAlmostEqual(report.p50, 0.001, delta=0.00004)
+        self.assertEqual(report.overruns, 0)
+
+    def test_interval_beyond_tolerance_is_overrun(self):
+        self.jitter.mark(0.001)
+        self.now += 1050000
+        self.jitter.mark(0.001)
+        self.now += 1200000
+        self.jitter.mark(0.001)
+        report = self.jitter.report()
+        self.assertEqual(report.overruns, 1)
+        self.assertAlmostEqual(report.max, 0.0012)
+
+    def test_start_resets_move(self):
+        self.jitter.mark(0.001)
+        self.now += 5000000
+        self.jitter.mark(0.001)
+        self.jitter.start()
+        self.assertEqual(self.jitter.report().count, 0)
+        self.assertEqual(self.jitter.report().overruns, 0)
@@ -0,0 +1,76 @@
+import mmap
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from stage.journal import PositionJournal
+
+
+class CountingMap(mmap.mmap):
+    """A mapping that counts its flushes to disk"""
+    flushes = 0
+
+    def flush(self, *args):
+        type(self).flushes += 1
+        return super().flush(*args)
+
+
+class PositionJournalTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "position.journal")
+        self.journal = PositionJournal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def reopen(self):
+        self.journal.close()
+        self.journal = PositionJournal(self.path)
+
+    def test_new_journal_is_not_clean(self):
+        entry = self.journal.read()
+        self.assertFalse(entry.clean)
+        self.assertIsNone(entry.phase)
+
+    def test_committed_position_survives_reopening(self):
+        self.journal.commit(42, 7)
+        self.reopen()
+        entry = self.journal.read()
+        self.assertEqual(entry, (42, 7, True))
+
+    def test_recorded_position_is_dirty(self):
+        self.journal.commit(42, 7)
+        self.journal.record(43)
+        self.reopen()
+        self.assertEqual(self.journal.read(), (43, 7, False))
+
+    def test_dirty_flag_flushed_once_per_move(self):
+        self.journal.close()
+        CountingMap.flushes = 0
+        with mock.patch.object(mmap, 'mmap', CountingMap):
+            self.journal = PositionJournal(self.path)
+        self.journal.commit(42, 7)
+        for position in (43, 44, 45):
+            self.journal.record(position)
+        self.assertEqual(CountingMap.flushes, 2)
+        self.journal.commit(45, 7)
+        self.journal.record(46)
+        self.assertEqual(CountingMap.flushes, 4)
+
+    def test_commit_forgets_stale_phase_if_unknown(self):
+        self.journal.commit(42, 3)
+        self.journal.commit(40)
+        self.assertEqual(self.journal.read(), (40, None, False))
+
+    def test_commit_without_any_phase_is_not_clean(self):
+        self.journal.commit(42)
+        self.assertFalse(self.journal.read().clean)
+
+    def test_unrecognised_file_is_reset(self):
+        self.journal.close()
+        with open(self.path, 'wb') as journal:
+            journal.write(b'\xff' * 16)
+        self.journal = PositionJournal(self.path)
+        self.assertFalse(self.journal.read().clean)
@@ -0,0 +1,184 @@
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from stage import metrics
+from stage.factory.config import Configurator
+from stage.factory.mock import MockStageFactory
+from stage.factory.simulator import SimulatedStageFactory
+from stage.stage import Stage
+
+
+def sample(text, line_start):
+    for line in text.splitlines():
+        if line.startswith(line_start + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError("No sample %s in\n%s" % (line_start, text))
+
+
+class CounterTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counter_renders_help_type_and_value(self):
+        counter = self.registry.counter('moves_total', "Moves made")
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP moves_total Moves made\n"
+            "# TYPE moves_total counter\n"
+            "moves_total 3\n")
+
+    def test_labelled_series_rendered_separately(self):
+        counter = self.registry.counter(
+            'steps_total', "Steps", ('direction',))
+        counter.labels('forward').inc(8)
+        counter.labels('backward').inc(4)
+        self.assertIs(counter.labels('forward'), counter.labels('forward'))
+        text = self.registry.render()
+        self.assertEqual(sample(text, 'steps_total{direction="forward"}'), 8)
+        self.assertEqual(sample(text, 'steps_total{direction="backward"}'), 4)
+
+    def test_label_values_escaped(self):
+        counter = self.registry.counter('odd_total', "Odd", ('name',))
+        counter.labels('a"b\\c').inc()
+        self.assertIn('odd_total{name="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_wrong_labels_rejected(self):
+        counter = self.registry.counter('x_total', "X", ('direction',))
+        with self.assertRaises(ValueError):
+            counter.labels()
+
+    def test_duplicate_names_rejected(self):
+        self.registry.counter('x_total', "X")
+        with self.assertRaises(ValueError):
+            self.registry.counter('x_total', "X")
+
+    def test_concurrent_updates_not_lost(self):
+        counter = self.registry.counter('x_total', "X")
+
+        def update():
+            for _ in range(10000):
+                counter.inc()
+
+        threads = [threading.Thread(target=update) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value, 40000)
+
+
+class HistogramTestGroup(unittest.TestCase):
+
+    def test_buckets_are_cumulative(self):
+        registry = metrics.MetricsRegistry()
+        histogram = registry.histogram(
+            'latency_seconds', "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        text = registry.render()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="0.1"}'), 2)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="1.0"}'), 3)
+        self.assertEqual(sample(text, 'latency_seconds_bucket{le="+Inf"}'), 4)
+        self.assertEqual(sample(text, 'latency_seconds_count'), 4)
+        self.assertAlmostEqual(sample(text, 'latency_seconds_sum'), 2.65)
+        self.assertEqual(histogram.count, 4)
+
+
+class StageMetricsTestGroup(unittest.TestCase):
+
+    def config(self, maximum):
+        return Configurator(
+            maximum_position=maximum,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+
+    def test_simulated_stage_counts_steps_homing_and_moves(self):
+        factory = SimulatedStageFactory(self.config(100), start_position=10)
+        stage_metrics = metrics.StageMetrics()
+        stage = Stage(factory, metrics=stage_metrics)
+        self.addCleanup(stage.close)
+        stage.position = 5
+        phases = factory.motor.phases_per_cycle
+        self.assertEqual(stage_metrics.homings.value, 1)
+        self.assertEqual(stage_metrics.homing_duration.count, 1)
+        self.assertGreaterEqual(stage_metrics.end_stop_triggers.value, 1)
+        self.assertEqual(stage_metrics.moves.value, 1)
+        self.assertEqual(stage_metrics.move_latency.count, 1)
+        self.assertGreater(stage_metrics.move_latency.sum, 0)
+        self.assertGreaterEqual(
+            stage_metrics.forward_steps.value, 5 * phases)
+        self.assertGreaterEqual(
+            stage_metrics.backward_steps.value, 10 * phases)
+        self.assertGreater(stage_metrics.motion_seconds.value, 0)
+        self.assertGreaterEqual(
+            stage_metrics.energised_seconds.value,
+            stage_metrics.motion_seconds.value)
+
+    def test_mock_stage_counts_queued_moves(self):
+        factory = MockStageFactory(self.config(
+            MockStageFactory.MAX_STAGE_LIMIT))
+        stage_metrics = metrics.StageMetrics()
+        stage = Stage(factory, metrics=stage_metrics)
+        self.addCleanup(stage.close)
+        forward = stage_metrics.forward_steps.value
+        backward = stage_metrics.backward_steps.value
+        moves = [stage.enqueue(position) for position in (10, 20, 15)]
+        for move in moves:
+            move.result()
+        self.assertEqual(stage_metrics.moves.value, 3)
+        self.assertEqual(stage_metrics.forward_steps.value - forward, 20)
+        self.assertEqual(stage_metrics.backward_steps.value - backward, 5)
+
+    def test_mock_stage_counts_follow_as_a_move(self):
+        factory = MockStageFactory(self.config(
+            MockStageFactory.MAX_STAGE_LIMIT))
+        stage_metrics = metrics.StageMetrics()
+        stage = Stage(factory, metrics=stage_metrics)
+        self.addCleanup(stage.close)
+        stage.follow([(0, 10), (0, 20)]).result(timeout=5)
+        self.assertEqual(stage_metrics.moves.value, 1)
+        self.assertEqual(stage_metrics.move_latency.count, 1)
+
+    def test_end_stop_stops_counting_when_metrics_removed(self):
+        factory = MockStageFactory(self.config(
+            MockStageFactory.MAX_STAGE_LIMIT))
+        stage_metrics = metrics.StageMetrics()
+        end_stop = factory.end_stop
+        end_stop.metrics = stage_metrics
+        end_stop.input.activate()
+        end_stop.metrics = None
+        end_stop.input.deactivate()
+        end_stop.input.activate()
+        self.assertEqual(stage_metrics.end_stop_triggers.value, 1)
+
+
+class MetricsServerTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+        self.registry.counter('moves_total', "Moves made").inc(7)
+        self.server = metrics.MetricsServer(self.registry, port=0)
+        self.server.start()
+        self.addCleanup(self.server.close)
+        self.url = 'http://%s:%d' % self.server.address
+
+    def test_metrics_served(self):
+        with urllib.request.urlopen(self.url + '/metrics', timeout=5) as reply:
+            self.assertEqual(
+                reply.headers['Content-Type'], metrics.CONTENT_TYPE)
+            text = reply.read().decode()
+        self.assertEqual(sample(text, 'moves_total'), 7)
+
+    def test_other_paths_not_found(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(self.url + '/other', timeout=5)
+        raised.exception.close()
+        self.assertEqual(raised.exception.code, 404)
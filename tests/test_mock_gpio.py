@@ -43,4 +43,31 @@ class MockGpioInputTestGroup(unittest.TestCase):
     def test_cannot_deregister_unregistered_callback(self):
         with self.assertRaises(error.GpioError):
             def foo(): pass
-            self.input.deregister_callback(foo)
\ No newline at end of file
+            self.input.deregister_callback(foo)
+
+class MockGpioOutputGroupTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.outputs = [mockgpio.OutputChannel(pin) for pin in (1, 2, 3, 4)]
+        for output in self.outputs:
+            output.deactivate()
+        self.group = mockgpio.OutputGroup(*self.outputs)
+
+    def test_pins_in_bit_order(self):
+        self.assertEqual(self.group.pins, (1, 2, 3, 4))
+        self.assertEqual(self.group.state, 0)
+
+    def test_write_sets_output_levels_from_mask(self):
+        self.group.write(0b0101)
+        self.assertEqual(
+            [output.state for output in self.outputs],
+            [True, False, True, False])
+        self.assertEqual(self.group.state, 0b0101)
+
+    def test_write_only_touches_changed_outputs(self):
+        self.group.write(0b0011)
+        with mock.patch.object(self.outputs[0], 'activate') as first, \
+                mock.patch.object(self.outputs[2], 'activate') as third:
+            self.group.write(0b0111)
+        first.assert_not_called()
+        third.assert_called_once()
@@ -1,9 +1,11 @@
+import threading
 import unittest
 from unittest import mock
 
 from stage.motor import stepper
 from stage.motor import drive
 from stage.motor import coil
+from stage.motor import profile
 from stage.gpio import mock as mockgpio
 
 
@@ -42,6 +44,29 @@ class CoilActivationTestGroup(unittest.TestCase):
         for coil, pin in zip(self.fake_coils.coils, self.FAKE_PINS):
             self.assertEqual(coil.pin, pin)
 
+    def test_set_state_activates_matching_coils(self):
+        self.fake_coils.set_state(coil.State(1, 1, 0, 0))
+        self.assertEqual(
+            [output.state for output in self.fake_coils.coils],
+            [True, True, False, False])
+        self.fake_coils.deactivate()
+        self.assertFalse(any(output.state for output in self.fake_coils.coils))
+
+    def test_output_group_used_as_given(self):
+        group = mockgpio.OutputGroup(
+            *(mockgpio.OutputChannel(pin) for pin in self.FAKE_PINS))
+        coils = coil.Coils(group)
+        self.assertIs(coils.group, group)
+        coils.write(0b0110)
+        self.assertEqual(group.state, 0b0110)
+
+
+class CoilMaskTestGroup(unittest.TestCase):
+
+    def test_coil_a1_is_least_significant_bit(self):
+        self.assertEqual(coil.to_mask(coil.State(1, 0, 0, 0)), 0b0001)
+        self.assertEqual(coil.to_mask(coil.State(1, 0, 0, 1)), 0b1001)
+
 
 class DriveSchemeTestMixin:
     drive_scheme = None
@@ -53,16 +78,31 @@ class DriveSchemeTestMixin:
             drive_scheme=self.drive_scheme.name,
             ms_delay=0)
 
+    @staticmethod
+    def distinct_masks(sequence):
+        masks = [coil.to_mask(state) for state in sequence]
+        return [mask for idx, mask in enumerate(masks)
+                if idx == 0 or masks[idx - 1] != mask]
+
     def test_forward_step_gpio_sequence(self):
         self.motor.forward(cycles=1)
-        self.fake_coils.set_state.assert_has_calls(
-            [mock.call(state) for state in self.drive_scheme.sequence])
+        self.fake_coils.write.assert_has_calls(
+            [mock.call(mask) for mask
+             in self.distinct_masks(self.drive_scheme.sequence)])
 
     def test_backward_gpio_sequence(self):
         self.motor.backward(cycles=3)
-        expect = [mock.call(state) for state
-            in reversed(self.drive_scheme.sequence)] * 3
-        self.fake_coils.set_state.assert_has_calls(expect)
+        expect = [mock.call(mask) for mask in self.distinct_masks(
+            reversed(self.drive_scheme.sequence))] * 3
+        self.fake_coils.write.assert_has_calls(expect)
+
+    def test_compiled_table_covers_whole_cycle(self):
+        table = drive.compile_scheme(self.drive_scheme)
+        self.assertEqual(table.phases, len(self.drive_scheme.sequence))
+        self.assertEqual(sum(phase.dwell for phase in table.forward),
+                         table.phases)
+        self.assertEqual(sum(phase.dwell for phase in table.backward),
+                         table.phases)
 
     def test_deactivate_turns_off_coils(self):
         self.motor.deactivate()
@@ -79,3 +119,152 @@ class WaveDriveSchemeTestGroup(DriveSchemeTestMixin, unittest.TestCase):
 
 class HalfStepDriveSchemeTestGroup(DriveSchemeTestMixin, unittest.TestCase):
     drive_scheme = drive.HalfStepDriveScheme
+
+
+class CompiledDriveTableTestGroup(unittest.TestCase):
+
+    def test_repeated_full_step_states_merged_into_longer_dwell(self):
+        table = drive.compile_scheme(drive.FullStepDriveScheme)
+        self.assertEqual(table.forward, (
+            drive.Phase(0b1001, 2),
+            drive.Phase(0b0011, 2),
+            drive.Phase(0b0110, 2),
+            drive.Phase(0b1100, 2)))
+        self.assertEqual(table.backward, tuple(reversed(table.forward)))
+
+    def test_merged_phase_dwells_for_sum_of_planned_delays(self):
+        fake_coils = mock.Mock(spec=coil.Coils)
+        motor = stepper.UnipolarStepperMotor(
+            coils=fake_coils,
+            drive_scheme=drive.WaveDriveScheme.name,
+            ms_delay=5)
+        with mock.patch.object(motor._scheduler, 'wait') as fake_wait:
+            motor.forward(cycles=1)
+        self.assertEqual(fake_wait.call_args_list, [mock.call(0.01)] * 4)
+
+
+class StepTimingTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_coils = mock.Mock(spec=coil.Coils)
+        self.motor = stepper.UnipolarStepperMotor(
+            coils=self.fake_coils,
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            ms_delay=0)
+
+    def test_timing_reports_phases_of_last_move(self):
+        self.motor.forward(cycles=2)
+        self.assertEqual(self.motor.timing.phases, 16)
+        self.motor.backward(cycles=1)
+        self.assertEqual(self.motor.timing.phases, 8)
+
+
+class MotionProfileTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_coils = mock.Mock(spec=coil.Coils)
+        self.motor = stepper.UnipolarStepperMotor(
+            coils=self.fake_coils,
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            ms_delay=0)
+
+    def test_default_profile_runs_at_ms_delay(self):
+        self.assertEqual(list(self.motor.profile.delays(2)), [0.0, 0.0])
+
+    def test_move_is_planned_by_given_profile(self):
+        fake_profile = mock.Mock(spec=profile.MotionProfile)
+        fake_profile.delays.return_value = iter([0] * 16)
+        self.motor.backward(cycles=2, profile=fake_profile)
+        fake_profile.delays.assert_called_with(16, 0, 0)
+        self.assertEqual(self.fake_coils.write.call_count, 16)
+
+
+class StopRequestTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.fake_coils = mock.Mock(spec=coil.Coils)
+        self.motor = stepper.UnipolarStepperMotor(
+            coils=self.fake_coils,
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            ms_delay=0)
+
+    def test_move_without_stop_completes_all_cycles(self):
+        self.assertEqual(self.motor.forward(cycles=3), 3)
+
+    def test_stop_ends_move_at_cycle_boundary(self):
+        stop = threading.Event()
+        self.fake_coils.write.side_effect = \
+            lambda mask: stop.set() if self.fake_coils.write.call_count == 10 \
+            else None
+        self.assertEqual(self.motor.backward(cycles=5, stop=stop), 2)
+        self.assertEqual(self.fake_coils.write.call_count, 16)
+
+    def test_halt_ends_move_within_one_phase(self):
+        halt = threading.Event()
+        self.fake_coils.write.side_effect = \
+            lambda mask: halt.set() if self.fake_coils.write.call_count == 10 \
+            else None
+        self.assertEqual(self.motor.backward(cycles=5, halt=halt), 1)
+        self.assertEqual(self.fake_coils.write.call_count, 10)
+
+    def test_phase_follows_last_coil_state_written(self):
+        self.assertIsNone(self.motor.phase)
+        self.motor.forward(cycles=1)
+        self.assertEqual(self.motor.phase, 7)
+        halt = threading.Event()
+        self.fake_coils.write.side_effect = \
+            lambda mask: halt.set() if self.fake_coils.write.call_count == 11 \
+            else None
+        self.motor.backward(cycles=1, halt=halt)
+        self.assertEqual(self.motor.phase, 5)
+
+    def test_phase_restored(self):
+        self.motor.phase = 3
+        self.assertEqual(self.motor.phase, 3)
+        self.motor.phase = 8
+        self.assertIsNone(self.motor.phase)
+
+
+class MicrosecondDelayTestGroup(unittest.TestCase):
+
+    def test_us_delay_sets_sub_millisecond_phase_delay(self):
+        motor = stepper.UnipolarStepperMotor(
+            coils=mock.Mock(spec=coil.Coils), us_delay=250)
+        self.assertEqual(motor.ms_delay, 0.25)
+        self.assertEqual(motor.us_delay, 250)
+        self.assertEqual(list(motor.profile.delays(1)), [0.00025])
+
+    def test_phases_waited_for_by_given_timer(self):
+        fake_timer = mock.Mock()
+        fake_timer.now_ns.return_value = 0
+        motor = stepper.UnipolarStepperMotor(
+            coils=mock.Mock(spec=coil.Coils),
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            us_delay=500,
+            timer=fake_timer)
+        motor.forward(cycles=1)
+        self.assertEqual(
+            [call.args[0] for call in fake_timer.sleep_until.call_args_list],
+            [500000 * phase for phase in range(1, 9)])
+
+
+class JitterTrackingTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.motor = stepper.UnipolarStepperMotor(
+            coils=mock.Mock(spec=coil.Coils),
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            ms_delay=0)
+
+    def test_jitter_disabled_by_default(self):
+        self.motor.forward(cycles=1)
+        self.assertIsNone(self.motor.jitter)
+
+    def test_jitter_recorded_per_move_when_enabled(self):
+        self.motor.enable_jitter_tracking()
+        self.motor.forward(cycles=2)
+        self.assertEqual(self.motor.jitter.count, 15)
+        self.motor.backward(cycles=1)
+        self.assertEqual(self.motor.jitter.count, 7)
+        self.motor.disable_jitter_tracking()
+        self.assertIsNone(self.motor.jitter)
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from stage import exceptions
+from stage import trace
+from stage.factory.mock import MockStageFactory
+from stage.factory.config import Configurator
+from stage.journal import PositionJournal
+from stage.motor import coil
+from stage.motor import drive
+from stage.motor import stepper
+from stage.multiaxis import MultiAxisStage
+
+
+def make_factory():
+    config = Configurator(
+        maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+        minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+        motor_pins=None,
+        end_stop_pin=None,
+        end_stop_active_low=True)
+    return MockStageFactory(config)
+
+
+class MultiAxisStageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.factories = [make_factory(), make_factory()]
+        self.stage = MultiAxisStage(*self.factories)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_axes_homed_on_init(self):
+        self.assertEqual(self.stage.position, (0, 0))
+
+    def test_move_reaches_every_target(self):
+        self.assertEqual(self.stage.move_to(40, 10).result(timeout=5), (40, 10))
+        self.assertEqual(self.stage.move_to(5, 30).result(timeout=5), (5, 30))
+        for factory, target in zip(self.factories, (5, 30)):
+            self.assertEqual(factory._fake_track.position, target)
+
+    def test_minor_axis_steps_spread_across_move(self):
+        trace = []
+        self.stage.axes[1].add_position_listener(
+            lambda position: trace.append(self.stage.axes[0].position))
+        self.stage.move_to(40, 4).result(timeout=5)
+        self.assertEqual(trace, [5, 15, 25, 35])
+
+    def test_wrong_number_of_positions_rejected(self):
+        with self.assertRaises(ValueError):
+            self.stage.move_to(1)
+
+    def test_out_of_range_axis_rejected(self):
+        with self.assertRaises(exceptions.OutOfRangeError):
+            self.stage.move_to(1, MockStageFactory.MAX_STAGE_LIMIT + 1)
+
+    def test_home_returns_all_axes(self):
+        self.stage.move_to(20, 30).result(timeout=5)
+        self.stage.home()
+        self.assertEqual(self.stage.position, (0, 0))
+
+    def test_end_stop_halts_backward_axis(self):
+        self.stage.move_to(40, 30).result(timeout=5)
+        # the second axis has lost steps and is really at 10
+        self.factories[1]._fake_track._position = 10
+        positions = []
+        self.stage.axes[1].add_position_listener(positions.append)
+        self.assertEqual(self.stage.move_to(0, 5).result(timeout=5), (0, 0))
+        self.assertEqual(positions, list(range(29, 19, -1)) + [0])
+        self.assertTrue(self.stage.axes[1].end_stop.triggered)
+
+    def test_forward_move_from_home_clears_end_stop(self):
+        self.stage.move_to(10, 0).result(timeout=5)
+        # pylint: disable=protected-access
+        self.assertFalse(self.stage.axes[0]._at_home_position.is_set())
+        self.assertTrue(self.stage.axes[1]._at_home_position.is_set())
+
+    def test_moves_traced(self):
+        buffer = trace.TraceBuffer()
+        stage = MultiAxisStage(make_factory(), make_factory(), trace=buffer)
+        self.addCleanup(stage.close)
+        buffer.clear()
+        stage.move_to(20, 5).result(timeout=5)
+        events = trace.decode(buffer.snapshot())
+        self.assertEqual(
+            sorted(event.value for event in events
+                   if event.code == trace.MOVE_FORWARD), [5, 20])
+        self.assertEqual(
+            sorted(event.value for event in events
+                   if event.code == trace.MOVE_DONE), [5, 20])
+
+
+class MultiAxisJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journals = [
+            PositionJournal(os.path.join(directory.name, name))
+            for name in ("x.journal", "y.journal")]
+        self.stage = MultiAxisStage(
+            make_factory(), make_factory(), journals=self.journals)
+        self.addCleanup(self.stage.close)
+
+    def test_journal_dirty_during_move_and_committed_after(self):
+        clean = []
+        self.stage.axes[0].add_position_listener(
+            lambda position: clean.append(self.journals[1].read().clean))
+        self.stage.move_to(20, 5).result(timeout=5)
+        self.assertEqual(clean, [False] * 20)
+        for journal, position in zip(self.journals, (20, 5)):
+            entry = journal.read()
+            self.assertTrue(entry.clean)
+            self.assertEqual(entry.position, position)
+
+    def test_wrong_number_of_journals_rejected(self):
+        with self.assertRaises(ValueError):
+            MultiAxisStage(make_factory(), journals=self.journals)
+
+
+class PhaseStepperTestGroup(unittest.TestCase):
+
+    def test_phase_stepper_writes_every_phase_and_flags_cycle_end(self):
+        fake_coils = mock.Mock(spec=coil.Coils)
+        motor = stepper.UnipolarStepperMotor(
+            coils=fake_coils,
+            drive_scheme=drive.FullStepDriveScheme.name,
+            ms_delay=0)
+        advance = motor.phase_stepper(forward=True)
+        completed = [advance() for _ in range(16)]
+        self.assertEqual(completed, ([False] * 7 + [True]) * 2)
+        expect = [coil.to_mask(state)
+                  for state in drive.FullStepDriveScheme.sequence] * 2
+        self.assertEqual(
+            [call.args[0] for call in fake_coils.write.call_args_list], expect)
+
+    def test_phase_stepper_keeps_phase(self):
+        fake_coils = mock.Mock(spec=coil.Coils)
+        motor = stepper.UnipolarStepperMotor(
+            coils=fake_coils,
+            drive_scheme=drive.HalfStepDriveScheme.name,
+            ms_delay=0)
+        advance = motor.phase_stepper(forward=False)
+        for _ in range(3):
+            advance()
+        masks = [coil.to_mask(state)
+                 for state in drive.HalfStepDriveScheme.sequence]
+        self.assertEqual(
+            motor.phase, masks.index(fake_coils.write.call_args.args[0]))
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+
+from stage.motor import profile
+
+
+class ConstantProfileTestGroup(unittest.TestCase):
+
+    def test_every_phase_has_same_delay(self):
+        constant = profile.ConstantProfile(100)
+        self.assertEqual(list(constant.delays(5)), [0.01] * 5)
+
+    def test_zero_delay_runs_without_pause(self):
+        constant = profile.ConstantProfile.from_delay(0)
+        self.assertEqual(list(constant.delays(3)), [0.0] * 3)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            profile.ConstantProfile(0)
+
+
+class RampedProfileTestMixin:
+    profile_type = None
+
+    def setUp(self):
+        self.profile = self.profile_type(
+            start_rate=50, cruise_rate=500, acceleration=5000)
+
+    def test_long_move_ramps_up_cruises_and_ramps_down(self):
+        delays = list(self.profile.delays(1000))
+        self.assertEqual(len(delays), 1000)
+        self.assertAlmostEqual(delays[0], 1 / 50)
+        self.assertAlmostEqual(delays[-1], 1 / 50)
+        self.assertAlmostEqual(min(delays), 1 / 500)
+        self.assertEqual(delays, list(reversed(delays)))
+
+    def test_rate_never_decreases_while_accelerating(self):
+        ramp = self.profile.ramp
+        self.assertTrue(all(a >= b for a, b in zip(ramp, ramp[1:])))
+
+    def test_short_move_does_not_reach_cruise(self):
+        phases = len(self.profile.ramp)
+        delays = list(self.profile.delays(phases))
+        self.assertEqual(len(delays), phases)
+        self.assertGreater(min(delays), 1 / 500)
+        self.assertEqual(delays, list(reversed(delays)))
+
+    def test_odd_move_length_planned_exactly(self):
+        self.assertEqual(len(list(self.profile.delays(7))), 7)
+
+    def test_faster_than_constant_start_rate(self):
+        start = profile.ConstantProfile(50)
+        self.assertLess(
+            self.profile.duration(4000), start.duration(4000) / 5)
+
+
+class TrapezoidalProfileTestGroup(RampedProfileTestMixin, unittest.TestCase):
+    profile_type = profile.TrapezoidalProfile
+
+
+class SCurveProfileTestGroup(RampedProfileTestMixin, unittest.TestCase):
+    profile_type = profile.SCurveProfile
+
+
+class ChainedProfileTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = profile.TrapezoidalProfile(
+            start_rate=50, cruise_rate=500, acceleration=5000)
+
+    def test_entry_level_starts_move_at_speed(self):
+        delays = list(self.profile.delays(40, entry_level=10))
+        self.assertAlmostEqual(delays[0], self.profile.ramp[10])
+        self.assertAlmostEqual(delays[-1], self.profile.ramp[0])
+
+    def test_exit_level_finishes_move_at_speed(self):
+        delays = list(self.profile.delays(40, exit_level=5))
+        self.assertAlmostEqual(delays[0], self.profile.ramp[0])
+        self.assertAlmostEqual(delays[-1], self.profile.ramp[5])
+
+
+class MoveControlTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = profile.TrapezoidalProfile(
+            start_rate=50, cruise_rate=500, acceleration=5000)
+        self.levels = {delay: level for level, delay in enumerate(
+            self.profile.ramp)}
+
+    def test_uncontrolled_plan_unchanged(self):
+        control = profile.MoveControl(exit_level=5)
+        self.assertEqual(
+            list(self.profile.delays(40, 10, 5, control=control)),
+            list(self.profile.delays(40, 10, 5)))
+        self.assertEqual(control.level, 5)
+
+    def test_brake_slows_a_level_a_phase(self):
+        control = profile.MoveControl()
+        delays = self.profile.delays(40, entry_level=10, control=control)
+        self.assertFalse(control.stopped)
+        next(delays)
+        control.brake()
+        levels = [self.levels[delay] for delay in delays]
+        self.assertEqual(levels[:10], list(range(9, -1, -1)))
+        self.assertEqual(set(levels[10:]), {0})
+        self.assertTrue(control.stopped)
+
+    def test_lowered_exit_level_never_drops_faster(self):
+        control = profile.MoveControl(exit_level=30)
+        delays = self.profile.delays(20, entry_level=20, control=control)
+        levels = [self.levels.get(next(delays)) for _ in range(10)]
+        control.lower_exit_level(0)
+        control.lower_exit_level(50)
+        self.assertEqual(control.exit_level, 0)
+        levels += [self.levels[delay] for delay in delays]
+        # cruising above the top of the ramp when the exit level drops
+        self.assertEqual(levels[4:10], [24] + [None] * 5)
+        self.assertEqual(levels[10:], list(range(24, 14, -1)))
+
+
+class CalibrationFileTestGroup(unittest.TestCase):
+
+    def test_saved_profiles_load_by_drive_scheme(self):
+        saved = profile.SCurveProfile(
+            start_rate=120, cruise_rate=400, acceleration=3000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calibration.json")
+            profile.save_calibration(path, {"Half Step": saved})
+            loaded = profile.load_calibration(path, "Half Step")
+            self.assertIsInstance(loaded, profile.SCurveProfile)
+            self.assertEqual(repr(loaded), repr(saved))
+            with self.assertRaises(KeyError):
+                profile.load_calibration(path, "Wave")
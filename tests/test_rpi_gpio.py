@@ -172,3 +172,31 @@ class GpioInputActiveHighTestGroup(unittest.TestCase, FakeEventCaptureMixin):
         self.input.register_callback(foo)
         self.fake_falling_event()
         foo.assert_not_called()
+
+
+class GpioOutputGroupTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        MOCK_GPIO.reset_mock()
+        self.pins = (1, 2, 3, 4)
+        self.group = rpi.OutputGroup(
+            *(rpi.OutputChannel(pin=pin) for pin in self.pins))
+        MOCK_GPIO.reset_mock()
+
+    def test_write_changes_pins_in_single_driver_call(self):
+        self.group.write(0b1001)
+        MOCK_GPIO.output.assert_called_once_with([1, 4], [1, 1])
+        self.assertEqual(self.group.state, 0b1001)
+        self.assertTrue(self.group.outputs[0].state)
+
+    def test_write_only_changed_pins(self):
+        self.group.write(0b1001)
+        MOCK_GPIO.reset_mock()
+        self.group.write(0b0011)
+        MOCK_GPIO.output.assert_called_once_with([2, 4], [1, 0])
+
+    def test_unchanged_write_does_not_call_driver(self):
+        self.group.write(0b0110)
+        MOCK_GPIO.reset_mock()
+        self.group.write(0b0110)
+        MOCK_GPIO.output.assert_not_called()
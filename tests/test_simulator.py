@@ -0,0 +1,181 @@
+import math
+import unittest
+
+from stage import trace
+from stage.factory.config import Configurator
+from stage.factory.simulator import SimulatedStageFactory
+from stage.motor import drive
+from stage.motor import profile
+from stage.motor.physics import RotorModel
+from stage.stage import Stage
+
+
+def run_cycles(model, scheme, cycles, delay):
+    table = drive.compile_scheme(scheme).forward
+    now = 0.0
+    for _ in range(cycles):
+        for mask, dwell in table:
+            model.write(mask, now)
+            now += delay * dwell
+    model.advance(now + 0.2)
+
+
+class RotorModelTestGroup(unittest.TestCase):
+
+    def test_slow_stepping_follows_commanded_position(self):
+        model = RotorModel()
+        run_cycles(model, drive.HalfStepDriveScheme, 10, 0.01)
+        self.assertAlmostEqual(model.lost_positions, 0, delta=0.05)
+        self.assertAlmostEqual(model.position, 10, delta=0.3)
+
+    def test_stepping_too_fast_loses_positions(self):
+        model = RotorModel()
+        run_cycles(model, drive.HalfStepDriveScheme, 10, 0.0005)
+        self.assertGreater(model.lost_positions, 5)
+
+    def test_wave_drive_has_less_torque_than_half_step(self):
+        half_step = RotorModel()
+        wave = RotorModel()
+        run_cycles(half_step, drive.HalfStepDriveScheme, 20, 0.003)
+        run_cycles(wave, drive.WaveDriveScheme, 20, 0.003)
+        self.assertAlmostEqual(half_step.lost_positions, 0, delta=0.05)
+        self.assertGreater(wave.lost_positions, 1)
+
+    def test_travel_limited_by_track(self):
+        model = RotorModel(position=0.5, limits=(0, 1))
+        run_cycles(model, drive.HalfStepDriveScheme, 5, 0.01)
+        self.assertLessEqual(model.position, 1)
+        self.assertGreater(model.lost_positions, 3)
+
+
+class SimulatedStageTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=100,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = SimulatedStageFactory(config, start_position=10)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_homing_finds_end_stop(self):
+        self.assertEqual(self.stage.position, 0)
+        self.assertTrue(self.factory.end_stop.triggered)
+        self.assertAlmostEqual(self.factory.true_position, 0, delta=0.3)
+
+    def test_safe_profile_reaches_target(self):
+        self.stage.profile = profile.TrapezoidalProfile(200, 400, 2000)
+        self.stage.position = 60
+        self.assertAlmostEqual(self.factory.true_position, 60, delta=0.3)
+        self.assertFalse(self.factory.end_stop.triggered)
+
+    def test_overambitious_profile_loses_steps(self):
+        self.stage.profile = profile.TrapezoidalProfile(200, 2000, 20000)
+        self.stage.position = 60
+        self.assertEqual(self.stage.position, 60)
+        self.assertLess(self.factory.true_position, 50)
+        self.assertAlmostEqual(
+            self.factory.commanded_position, 60, delta=0.3)
+
+    def test_follow_keeps_count_of_true_position(self):
+        self.stage.profile = profile.TrapezoidalProfile(200, 400, 2000)
+        self.stage.position = 50
+        trajectory = (
+            (idx * 0.05, 50 + 40 * math.sin(idx / 10)) for idx in range(300))
+        report = self.stage.follow(trajectory).result()
+        self.assertEqual(report.position, self.stage.position)
+        self.assertAlmostEqual(
+            self.factory.true_position, self.stage.position, delta=0.3)
+        self.assertFalse(self.factory.end_stop.triggered)
+
+    def test_end_stop_recovers_lost_steps(self):
+        self.stage.move_to(
+            60, profile=profile.TrapezoidalProfile(200, 2000, 20000)).result()
+        start = self.factory.clock.seconds
+        self.stage.position = 0
+        self.assertLess(self.factory.clock.seconds - start, 1)
+        self.assertAlmostEqual(self.factory.true_position, 0, delta=0.3)
+        self.stage.position = 20
+        self.assertAlmostEqual(self.factory.true_position, 20, delta=0.3)
+
+    def test_simulated_time_advances_with_moves(self):
+        start = self.factory.clock.seconds
+        self.stage.position = 10
+        self.assertAlmostEqual(
+            self.factory.clock.seconds - start, 10 * 8 * 0.02, places=6)
+
+
+class QueuedMoveCancellationTests(unittest.TestCase):
+
+    START_DELAY = 1 / 200
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=100,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = SimulatedStageFactory(config, start_position=10)
+        self.buffer = trace.TraceBuffer(
+            capacity=100000, clock=self.factory.clock.now_ns)
+        self.stage = Stage(self.factory, trace=self.buffer)
+        self.addCleanup(self.stage.close)
+        self.stage.profile = profile.TrapezoidalProfile(200, 400, 2000)
+        self.buffer.clear()
+
+    def cancel_at(self, position, move):
+        def cancel(reached):
+            if reached == position:
+                move.cancel()
+
+        self.stage.add_position_listener(cancel)
+
+    def phase_delays(self):
+        times = [
+            event.timestamp_ns for event in trace.decode(self.buffer.snapshot())
+            if event.code == trace.COIL_WRITE]
+        return [(end - start) / 1e9 for start, end in zip(times, times[1:])]
+
+    def assert_decelerates_to_rest(self, phases):
+        delays = self.phase_delays()[-phases:]
+        self.assertEqual(delays, sorted(delays))
+        # the last phase is only followed by deactivating the coils
+        self.assertAlmostEqual(delays[-1], self.START_DELAY, delta=0.0005)
+        self.assertLess(delays[0], self.START_DELAY)
+
+    def test_successor_cancelled_early_stops_at_target(self):
+        first = self.stage.enqueue(30)
+        second = self.stage.enqueue(60)
+        self.cancel_at(10, second)
+        self.assertEqual(first.result(timeout=5), 30)
+        self.assertEqual(second.result(timeout=5), 30)
+        self.assert_decelerates_to_rest(20)
+        self.assertAlmostEqual(self.factory.true_position, 30, delta=0.3)
+
+    def test_successor_cancelled_late_brakes_beyond_target(self):
+        first = self.stage.enqueue(30)
+        second = self.stage.enqueue(60)
+        self.cancel_at(29, second)
+        self.assertEqual(first.result(timeout=5), 30)
+        position = second.result(timeout=5)
+        self.assertGreater(position, 30)
+        self.assertLess(position, 60)
+        self.assert_decelerates_to_rest(20)
+        self.assertAlmostEqual(
+            self.factory.true_position, position, delta=0.3)
+
+    def test_cancelled_move_brakes_to_rest(self):
+        move = self.stage.enqueue(60)
+        self.cancel_at(20, move)
+        position = move.result(timeout=5)
+        self.assertGreater(position, 20)
+        self.assertLess(position, 60)
+        self.assert_decelerates_to_rest(20)
+        self.assertAlmostEqual(
+            self.factory.true_position, position, delta=0.3)
@@ -1,12 +1,19 @@
 import logging
+import os
+import tempfile
+import threading
 import unittest
 from unittest import mock
 
 from stage import exceptions
-from stage.stage import Stage
+from stage.stage import HomingParameters, Stage
 from stage import endstop
+from stage.journal import PositionJournal
+from stage.motor import profile
+from stage.motor.timing import HybridTimer, VirtualClock
 from stage.gpio import mock as mockgpio
 from stage.factory.mock import FakeTrackHardware, MockStageFactory
+from stage.factory.base import StageFactoryBase
 from stage.factory.config import Configurator
 
 
@@ -60,3 +67,534 @@ class TrackTests(unittest.TestCase):
         target_position = self.stage.min - 1
         with self.assertRaises(exceptions.OutOfRangeError):
             self.stage.position = target_position
+
+    def test_move_backward_returns_to_lower_position(self):
+        self.stage.position = self.position_from_percent(50)
+        target_position = self.position_from_percent(20)
+        self.stage.position = target_position
+        self.assertEqual(target_position, self.stage.position)
+        self.assertEqual(self.factory._fake_track.position, target_position)
+
+    def test_end_stop_halts_backward_move_and_resets_position(self):
+        self.stage.position = self.position_from_percent(50)
+        self.mock_end_stop.input.activate()
+        self.stage.position = self.position_from_percent(20)
+        self.assertEqual(self.stage.position, self.stage.min)
+
+    def test_stage_profile_passed_to_motor(self):
+        self.stage.profile = profile.TrapezoidalProfile(50, 500, 5000)
+        self.stage.position = self.position_from_percent(10)
+        self.assertIs(self.factory.motor.last_profile, self.stage.profile)
+
+
+class HomingTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.fast = profile.TrapezoidalProfile(100, 1000, 10000)
+        self.factory = MockStageFactory(
+            config, clock=VirtualClock(), profile=self.fast)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_fast_approach_then_slow_approach(self):
+        self.stage.position = 50
+        motor = self.factory.motor
+        with mock.patch.object(motor, 'backward', wraps=motor.backward) \
+                as backward, \
+                mock.patch.object(motor, 'forward', wraps=motor.forward) \
+                as forward:
+            self.stage.home()
+        self.assertIs(backward.call_args_list[0][1]['profile'], self.fast)
+        slow = backward.call_args_list[-1][1]['profile']
+        self.assertEqual(slow.cruise_rate, 50)
+        self.assertEqual(forward.call_args[0][0], 2)
+        self.assertIs(forward.call_args[1]['profile'], slow)
+        self.assertEqual(self.stage.position, 0)
+        self.assertTrue(self.factory.end_stop.triggered)
+
+    def test_homing_reported(self):
+        self.stage.position = 50
+        self.stage.home()
+        report = self.stage.homing
+        self.assertEqual(report.fast_cycles, 50)
+        self.assertEqual(report.slow_cycles, 4)
+        self.assertGreater(report.duration, self.fast.duration(50))
+
+    def test_homing_reads_end_stop_when_edge_lost(self):
+        self.stage.position = 50
+        # eg. an edge dropped by the input's debouncing
+        with mock.patch.object(
+                self.factory.end_stop.input, '_invoke_callbacks'):
+            self.stage.home()
+        self.assertEqual(self.stage.position, 0)
+        self.assertEqual(self.stage.homing.fast_cycles, 50)
+        self.assertEqual(self.stage.homing.slow_cycles, 4)
+
+    def test_broken_end_stop_times_out(self):
+        stage = Stage(self.factory, HomingParameters(timeout=3))
+        self.addCleanup(stage.close)
+        stage.position = 50
+        with mock.patch.object(self.factory.end_stop.input, 'activate'):
+            start = self.factory.clock.seconds
+            with self.assertRaises(exceptions.HomingTimeoutError):
+                stage.home()
+        self.assertAlmostEqual(
+            self.factory.clock.seconds - start, 3, delta=0.1)
+        self.assertIsNone(stage.position)
+        self.assertTrue(self.factory.motor.deactivated)
+
+    def test_moves_fail_not_homed_after_homing_timeout(self):
+        stage = Stage(self.factory, HomingParameters(timeout=3))
+        self.addCleanup(stage.close)
+        stage.position = 50
+        with mock.patch.object(self.factory.end_stop.input, 'activate'):
+            homing = stage.move_home()
+            queued = stage.move_to(10)
+            enqueued = stage.enqueue(20)
+            with self.assertRaises(exceptions.HomingTimeoutError):
+                homing.result(5)
+        with self.assertRaises(exceptions.NotHomedError):
+            queued.result(5)
+        with self.assertRaises(exceptions.NotHomedError):
+            enqueued.result(5)
+        with self.assertRaises(exceptions.NotHomedError):
+            stage.position = 5
+        with self.assertRaises(exceptions.NotHomedError):
+            stage.follow([(0, 5)]).result(5)
+        stage.home()
+        stage.position = 5
+        self.assertEqual(stage.position, 5)
+
+
+class DeferredHomingTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = MockStageFactory(
+            config, clock=VirtualClock(),
+            profile=profile.ConstantProfile(1000))
+
+    def test_construction_returns_before_homing(self):
+        gate = threading.Event()
+        motor = self.factory.motor
+        backward = motor.backward
+
+        def gated(*args, **kwargs):
+            gate.wait(5)
+            return backward(*args, **kwargs)
+
+        with mock.patch.object(motor, 'backward', side_effect=gated):
+            stage = Stage(self.factory, defer_homing=True)
+            self.addCleanup(stage.close)
+            self.assertFalse(stage.ready.done())
+            move = stage.move_to(20)
+            gate.set()
+            self.assertEqual(stage.wait_ready(5), 0)
+            self.assertEqual(move.result(5), 20)
+
+    def test_homing_failure_raised_by_wait_ready(self):
+        with mock.patch.object(self.factory.end_stop.input, 'activate'):
+            stage = Stage(
+                self.factory, HomingParameters(timeout=1), defer_homing=True)
+            self.addCleanup(stage.close)
+            with self.assertRaises(exceptions.HomingTimeoutError):
+                stage.wait_ready(5)
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "position.journal")
+        self.factory = MockStageFactory(config)
+        self.stage = Stage(self.factory, journal=PositionJournal(self.path))
+        self.stage.position = 30
+        self.stage.close()
+
+    def restart(self):
+        motor = self.factory.motor
+        with mock.patch.object(motor, 'backward', wraps=motor.backward) \
+                as backward:
+            stage = Stage(self.factory, journal=PositionJournal(self.path))
+        self.addCleanup(stage.close)
+        return stage, backward.called
+
+    def test_clean_journal_skips_homing(self):
+        stage, homed = self.restart()
+        self.assertFalse(homed)
+        self.assertEqual(stage.position, 30)
+        self.assertIsNone(stage.homing)
+
+    def test_clean_journal_restores_phase(self):
+        journal = PositionJournal(self.path)
+        journal.commit(30, 5)
+        journal.close()
+        stage, _ = self.restart()
+        self.assertEqual(stage.motor.phase, 5)
+
+    def test_interrupted_move_forces_homing(self):
+        journal = PositionJournal(self.path)
+        journal.record(31)
+        journal.close()
+        stage, homed = self.restart()
+        self.assertTrue(homed)
+        self.assertEqual(stage.position, 0)
+
+    def test_end_stop_disagreeing_with_journal_forces_homing(self):
+        self.factory.end_stop.input.activate()
+        stage, homed = self.restart()
+        self.assertTrue(homed)
+        self.assertEqual(stage.position, 0)
+
+    def test_positions_journaled_during_moves(self):
+        stage, _ = self.restart()
+        stage.position = 10
+        journal = PositionJournal(self.path)
+        self.addCleanup(journal.close)
+        self.assertEqual(journal.read().position, 10)
+        self.assertTrue(journal.read().clean)
+
+    def test_cancelled_homing_leaves_journal_dirty(self):
+        stage, _ = self.restart()
+        track = CancellingTrack(cancel_at=20, position=30)
+        self.factory.motor._fake_track = track
+        move = stage.move_home()
+        track.move = move
+        track.ready.set()
+        with self.assertRaises(exceptions.NotHomedError):
+            move.result(timeout=5)
+        journal = PositionJournal(self.path)
+        self.addCleanup(journal.close)
+        self.assertFalse(journal.read().clean)
+
+
+class CancellingTrack:
+    """Fake track that cancels the move in progress at the given position"""
+
+    def __init__(self, cancel_at, position=0):
+        self._position = position
+        self._cancel_at = cancel_at
+        self.move = None
+        self.ready = threading.Event()
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, value):
+        self._position = value
+        if value == self._cancel_at:
+            self.ready.wait()
+            self.move.cancel()
+
+
+class NonBlockingMoveTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = MockStageFactory(config)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_move_to_resolves_to_target(self):
+        move = self.stage.move_to(30)
+        self.assertEqual(move.result(timeout=5), 30)
+        self.assertTrue(move.done())
+        self.assertFalse(move.cancelled())
+        self.assertEqual(self.stage.position, 30)
+
+    def test_move_to_out_of_range_raises_immediately(self):
+        with self.assertRaises(exceptions.OutOfRangeError):
+            self.stage.move_to(self.stage.max + 1)
+
+    def test_move_cancelled_before_starting_does_not_move(self):
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        move = self.stage.move_to(50)
+        self.assertFalse(move.done())
+        self.assertTrue(move.cancel())
+        gate.set()
+        self.assertEqual(move.result(timeout=5), 0)
+        self.assertEqual(self.stage.position, 0)
+
+    def test_move_cancelled_in_flight_reports_position_reached(self):
+        track = CancellingTrack(cancel_at=10)
+        self.factory.motor._fake_track = track
+        move = self.stage.move_to(50)
+        track.move = move
+        track.ready.set()
+        self.assertEqual(move.result(timeout=5), 10)
+        self.assertTrue(move.cancelled())
+        self.assertEqual(self.stage.position, 10)
+
+    def test_homing_cancelled_part_way_forgets_position(self):
+        self.stage.position = 50
+        track = CancellingTrack(cancel_at=30, position=50)
+        self.factory.motor._fake_track = track
+        move = self.stage.move_home()
+        track.move = move
+        track.ready.set()
+        with self.assertRaises(exceptions.NotHomedError):
+            move.result(timeout=5)
+        self.assertEqual(track.position, 30)
+        self.assertIsNone(self.stage.position)
+
+    def test_cancel_after_done_returns_false(self):
+        move = self.stage.move_to(5)
+        move.result(timeout=5)
+        self.assertFalse(move.cancel())
+
+
+class QueuedMoveTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = MockStageFactory(config, clock=VirtualClock())
+        self.stage = Stage(self.factory)
+        self.stage.profile = profile.TrapezoidalProfile(50, 500, 5000)
+        self.motor = self.factory.motor
+
+    def tearDown(self):
+        self.stage.close()
+
+    def enqueue_while_paused(self, *targets):
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        moves = [self.stage.enqueue(target) for target in targets]
+        gate.set()
+        return [move.result(timeout=5) for move in moves]
+
+    def test_queued_moves_reach_each_target_in_order(self):
+        self.assertEqual(self.enqueue_while_paused(10, 40, 20), [10, 40, 20])
+        self.assertEqual(self.stage.position, 20)
+
+    def test_coils_only_deactivated_once_queue_drains(self):
+        with mock.patch.object(
+                self.motor, 'deactivate', wraps=self.motor.deactivate) as off:
+            self.enqueue_while_paused(10, 20, 30)
+        off.assert_called_once()
+
+    def test_speed_carried_through_moves_in_same_direction(self):
+        with mock.patch.object(
+                self.motor, 'forward', wraps=self.motor.forward) as forward:
+            self.enqueue_while_paused(10, 20, 30)
+        levels = [(call.kwargs['entry_level'], call.kwargs['exit_level'])
+                  for call in forward.call_args_list]
+        self.assertEqual(levels, [(0, 16), (10, 8), (9, 0)])
+
+    def test_direction_reversal_comes_to_rest(self):
+        with mock.patch.object(
+                self.motor, 'forward', wraps=self.motor.forward) as forward, \
+                mock.patch.object(
+                    self.motor, 'backward', wraps=self.motor.backward) as back:
+            self.enqueue_while_paused(30, 10)
+        self.assertEqual(forward.call_args.kwargs['exit_level'], 0)
+        self.assertEqual(back.call_args.kwargs['entry_level'], 0)
+
+    def test_cancelled_queued_move_is_skipped(self):
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        first = self.stage.enqueue(10)
+        skipped = self.stage.enqueue(50)
+        last = self.stage.enqueue(20)
+        skipped.cancel()
+        gate.set()
+        self.assertEqual(first.result(timeout=5), 10)
+        self.assertEqual(skipped.result(timeout=5), 10)
+        self.assertEqual(last.result(timeout=5), 20)
+
+    def test_no_speed_carried_into_interleaved_move_to(self):
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        with mock.patch.object(
+                self.motor, 'forward', wraps=self.motor.forward) as forward, \
+                mock.patch.object(
+                    self.motor, 'backward', wraps=self.motor.backward) as back:
+            moves = [
+                self.stage.enqueue(50),
+                self.stage.move_to(10),
+                self.stage.enqueue(80)]
+            gate.set()
+            self.assertEqual(
+                [move.result(timeout=5) for move in moves], [50, 10, 80])
+        self.assertEqual(forward.call_args_list[0].kwargs['exit_level'], 0)
+        self.assertEqual(back.call_args.kwargs.get('entry_level', 0), 0)
+        self.assertEqual(forward.call_args_list[1].kwargs['entry_level'], 0)
+
+    def test_move_cancelled_after_planning_replans_exit(self):
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        forward = self.motor.forward
+
+        def cancelling(*args, **kwargs):
+            skipped.cancel()
+            return forward(*args, **kwargs)
+
+        with mock.patch.object(
+                self.motor, 'forward', side_effect=cancelling) as calls:
+            first = self.stage.enqueue(10)
+            skipped = self.stage.enqueue(50)
+            last = self.stage.enqueue(20)
+            gate.set()
+            self.assertEqual(last.result(timeout=5), 20)
+        self.assertEqual(first.result(timeout=5), 10)
+        self.assertEqual(skipped.result(timeout=5), 10)
+        # planned to carry on through the 40 positions to 50, but once that
+        # move is cancelled only the 10 positions to 20 are left to stop in
+        self.assertGreater(calls.call_args_list[0].kwargs['exit_level'], 8)
+        self.assertLessEqual(
+            calls.call_args_list[1].kwargs['entry_level'], 8 + 1)
+
+
+class TrajectoryFollowingTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.factory = MockStageFactory(config)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_follow_reaches_each_sample(self):
+        seen = []
+
+        def trajectory():
+            for idx in range(20):
+                # consumed lazily - the previous sample has been reached
+                seen.append(self.stage.position)
+                yield idx * 0.001, idx * 2.2
+
+        report = self.stage.follow(trajectory()).result(timeout=5)
+        self.assertEqual(report.samples, 20)
+        self.assertEqual(report.position, round(19 * 2.2))
+        self.assertEqual(self.stage.position, round(19 * 2.2))
+        self.assertEqual(seen[5], round(4 * 2.2))
+        self.assertIsNotNone(self.stage.lag)
+        self.assertGreaterEqual(report.max_lag, report.final_lag)
+
+    def test_follow_out_of_range_sample_raises(self):
+        trajectory = [(0, 10), (0.001, self.stage.max + 1)]
+        follow = self.stage.follow(iter(trajectory))
+        with self.assertRaises(exceptions.OutOfRangeError):
+            follow.result(timeout=5)
+        self.assertEqual(self.stage.position, 10)
+
+    def test_follow_cancelled_stops_consuming(self):
+        consumed = []
+
+        def trajectory():
+            for idx in range(1000):
+                consumed.append(idx)
+                if idx == 3:
+                    follow.cancel()
+                yield 0, idx
+
+        gate = threading.Event()
+        self.stage._motion.submit(gate.wait)
+        follow = self.stage.follow(trajectory())
+        gate.set()
+        report = follow.result(timeout=5)
+        self.assertEqual(len(consumed), 4)
+        self.assertEqual(report.samples, 3)
+
+
+class SimulationTests(unittest.TestCase):
+
+    def setUp(self):
+        config = Configurator(
+            maximum_position=MockStageFactory.MAX_STAGE_LIMIT,
+            minimum_position=MockStageFactory.MIN_STAGE_LIMIT,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+        self.clock = VirtualClock()
+        # a 28BYJ-48 at the default 20ms per phase
+        self.factory = MockStageFactory(
+            config,
+            clock=self.clock,
+            profile=profile.ConstantProfile.from_delay(0.02),
+            phases_per_cycle=8)
+        self.stage = Stage(self.factory)
+
+    def tearDown(self):
+        self.stage.close()
+
+    def test_stage_uses_factory_clock(self):
+        self.assertIs(self.factory.clock, self.clock)
+
+    def test_default_factory_clock_is_created_once(self):
+        class Factory(StageFactoryBase):
+            minimum_position = maximum_position = motor = end_stop = None
+
+        factory = Factory()
+        self.assertIsInstance(factory.clock, HybridTimer)
+        self.assertIs(factory.clock, factory.clock)
+
+    def test_moves_advance_virtual_clock_by_planned_time(self):
+        start = self.clock.seconds
+        for _ in range(50):
+            self.stage.position = self.stage.max
+            self.stage.position = self.stage.min
+        elapsed = self.clock.seconds - start
+        self.assertAlmostEqual(elapsed, 50 * 2 * 100 * 8 * 0.02)
+        self.assertEqual(self.factory.motor.timing.phases, 100)
+
+    def test_follow_tracks_virtual_time(self):
+        trajectory = ((idx * 1.0, idx) for idx in range(60))
+        report = self.stage.follow(trajectory).result(timeout=5)
+        self.assertEqual(report.position, 59)
+        self.assertAlmostEqual(report.max_lag, 0.0, places=6)
+
+    def test_follow_holds_until_samples_are_due(self):
+        times = {}
+        self.stage.add_position_listener(
+            lambda position: times.setdefault(position, self.clock.seconds))
+        start = self.clock.seconds
+        trajectory = [(0, 10), (100, 10), (101, 20)]
+        report = self.stage.follow(iter(trajectory)).result(timeout=5)
+        self.assertEqual(report.position, 20)
+        # 10 positions of 8 phases at 20ms a phase
+        self.assertAlmostEqual(times[10] - start, 1.6)
+        self.assertGreaterEqual(times[11] - start, 100)
+        self.assertAlmostEqual(report.max_lead, 100 - 1.6)
+        self.assertAlmostEqual(report.max_lag, 1.6)
+        self.assertAlmostEqual(report.final_lag, 0.6)
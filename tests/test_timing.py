@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+from stage.motor import timing
+
+
+class FakeTimer:
+    """Timer whose clock only moves when told to or when sleeping"""
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def now_ns(self):
+        return self.now
+
+    def sleep_until(self, deadline_ns):
+        if deadline_ns > self.now:
+            self.sleeps.append(deadline_ns - self.now)
+            self.now = deadline_ns
+
+
+class DeadlineSchedulerTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = FakeTimer()
+        self.scheduler = timing.DeadlineScheduler(self.timer)
+
+    def test_report_before_start_is_empty(self):
+        report = self.scheduler.report()
+        self.assertEqual(report.phases, 0)
+        self.assertEqual(report.actual, 0.0)
+
+    def test_sleeps_until_absolute_deadline(self):
+        self.scheduler.start()
+        # writing to the coils took 3ms of the 10ms phase
+        self.timer.now = 3000000
+        self.scheduler.wait(0.010)
+        self.assertEqual(self.timer.sleeps, [7000000])
+
+    def test_time_spent_between_phases_does_not_accumulate(self):
+        self.scheduler.start()
+        for _ in range(100):
+            self.timer.now += 2000000
+            self.scheduler.wait(0.010)
+        report = self.scheduler.report()
+        self.assertEqual(report.phases, 100)
+        self.assertAlmostEqual(report.planned, 1.0)
+        self.assertAlmostEqual(report.actual, 1.0)
+        self.assertAlmostEqual(report.drift, 0.0)
+
+    def test_sub_millisecond_delays_scheduled_exactly(self):
+        self.scheduler.start()
+        for _ in range(1000):
+            self.scheduler.wait(0.000125)
+        self.assertEqual(self.timer.now, 125000000)
+
+    def test_overrun_is_reported_and_schedule_rebased(self):
+        self.scheduler.start()
+        self.timer.now = 50000000
+        self.scheduler.wait(0.010)
+        self.assertEqual(self.timer.sleeps, [])
+        self.scheduler.wait(0.010)
+        self.assertEqual(self.timer.sleeps, [10000000])
+        report = self.scheduler.report()
+        self.assertAlmostEqual(report.max_lateness, 0.040)
+
+
+class HybridTimerTestGroup(unittest.TestCase):
+
+    def test_negative_spin_rejected(self):
+        with self.assertRaises(ValueError):
+            timing.HybridTimer(spin_us=-1)
+
+    def test_sleeps_coarsely_then_spins_to_deadline(self):
+        timer = timing.HybridTimer(spin_us=500)
+        with mock.patch.object(timing.time, 'sleep') as fake_sleep:
+            deadline = timer.now_ns() + 2000000
+            timer.sleep_until(deadline)
+        self.assertGreaterEqual(timer.now_ns(), deadline)
+        self.assertLessEqual(fake_sleep.call_args[0][0], 0.0015)
+
+    def test_deadline_in_past_returns_immediately(self):
+        timer = timing.HybridTimer()
+        with mock.patch.object(timing.time, 'sleep') as fake_sleep:
+            timer.sleep_until(timer.now_ns() - 1000)
+        fake_sleep.assert_not_called()
+
+    def test_meets_sub_millisecond_deadline(self):
+        timer = timing.HybridTimer(spin_us=1000)
+        deadline = timer.now_ns() + 300000
+        timer.sleep_until(deadline)
+        self.assertLess(timer.now_ns() - deadline, 200000)
@@ -0,0 +1,132 @@
+import threading
+import unittest
+
+from stage import trace
+from stage.factory.config import Configurator
+from stage.factory.mock import MockStageFactory
+from stage.factory.simulator import SimulatedStageFactory
+from stage.stage import Stage
+
+
+class Ticks:
+    """
+    A clock that advances a nanosecond each time it is read
+    """
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class TraceBufferTestGroup(unittest.TestCase):
+
+    def test_records_decoded_in_order(self):
+        buffer = trace.TraceBuffer(capacity=8, clock=Ticks())
+        buffer.record(trace.COIL_WRITE, 9)
+        buffer.record(trace.COILS_OFF)
+        self.assertEqual(
+            trace.decode(buffer.snapshot()),
+            [trace.TraceEvent(1, 1, trace.COIL_WRITE, 9),
+             trace.TraceEvent(2, 2, trace.COILS_OFF, 0)])
+
+    def test_newest_records_kept_when_full(self):
+        buffer = trace.TraceBuffer(capacity=4, clock=Ticks())
+        for value in range(10):
+            buffer.record(trace.POSITION, value)
+        events = trace.decode(buffer.snapshot())
+        self.assertEqual([event.value for event in events], [6, 7, 8, 9])
+        self.assertEqual([event.sequence for event in events], [7, 8, 9, 10])
+
+    def test_clear_discards_records(self):
+        buffer = trace.TraceBuffer(capacity=4)
+        buffer.record(trace.POSITION, 3)
+        buffer.clear()
+        self.assertEqual(trace.decode(buffer.snapshot()), [])
+        buffer.record(trace.POSITION, 4)
+        self.assertEqual(
+            [event.sequence for event in trace.decode(buffer.snapshot())], [1])
+
+    def test_concurrent_writers_lose_no_records(self):
+        buffer = trace.TraceBuffer(capacity=4000)
+
+        def write(code):
+            for value in range(1000):
+                buffer.record(code, value)
+
+        writers = [
+            threading.Thread(target=write, args=(code,))
+            for code in (trace.COIL_WRITE, trace.POSITION)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        events = trace.decode(buffer.snapshot())
+        self.assertEqual(len(events), 2000)
+        for code in (trace.COIL_WRITE, trace.POSITION):
+            self.assertEqual(
+                [event.value for event in events if event.code == code],
+                list(range(1000)))
+
+    def test_capacity_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            trace.TraceBuffer(capacity=0)
+
+    def test_format_event(self):
+        event = trace.TraceEvent(1, 2500000, trace.COIL_WRITE, 12)
+        self.assertEqual(
+            trace.format_event(event, start_ns=500000).split(),
+            ['2.000ms', 'coil_write', '12'])
+
+
+class StageTraceTestGroup(unittest.TestCase):
+
+    def config(self, maximum):
+        return Configurator(
+            maximum_position=maximum,
+            minimum_position=0,
+            motor_pins=None,
+            end_stop_pin=None,
+            end_stop_active_low=True)
+
+    def test_simulated_stage_traces_homing_and_moves(self):
+        factory = SimulatedStageFactory(self.config(100), start_position=10)
+        buffer = trace.TraceBuffer(clock=factory.clock.now_ns)
+        stage = Stage(factory, trace=buffer)
+        self.addCleanup(stage.close)
+        stage.position = 5
+        codes = [event.code for event in trace.decode(buffer.snapshot())]
+        for code in (
+                trace.MOVE_BACKWARD, trace.COIL_WRITE,
+                trace.END_STOP_TRIGGERED, trace.HOMED, trace.MOVE_REQUEST,
+                trace.MOVE_FORWARD, trace.MOVE_DONE, trace.POSITION,
+                trace.COILS_OFF):
+            self.assertIn(code, codes)
+        self.assertLess(codes.index(trace.HOMED), codes.index(
+            trace.MOVE_REQUEST))
+        positions = [
+            event.value for event in trace.decode(buffer.snapshot())
+            if event.code == trace.POSITION]
+        self.assertEqual(positions[-1], 5)
+
+    def test_untraced_stage_records_nothing(self):
+        factory = MockStageFactory(self.config(
+            MockStageFactory.MAX_STAGE_LIMIT))
+        stage = Stage(factory)
+        self.assertIsNone(stage.trace)
+        self.assertIsNone(stage.end_stop.trace)
+        stage.position = 10
+        self.assertEqual(stage.position, 10)
+
+    def test_follow_traces_each_sample_request(self):
+        factory = MockStageFactory(self.config(
+            MockStageFactory.MAX_STAGE_LIMIT))
+        buffer = trace.TraceBuffer()
+        stage = Stage(factory, trace=buffer)
+        self.addCleanup(stage.close)
+        buffer.clear()
+        stage.follow([(0, 3), (0, 7.4), (0, 2)]).result(timeout=5)
+        self.assertEqual(
+            [event.value for event in trace.decode(buffer.snapshot())
+             if event.code == trace.MOVE_REQUEST], [3, 7, 2])
@@ -0,0 +1,291 @@
+import threading
+import time
+import unittest
+
+from stage.factory.config import Configurator
+from stage.factory.wave import WaveStageFactory
+from stage.gpio import error
+from stage.gpio import fakepigpiod
+from stage.gpio import wave
+from stage.gpio.fakepigpiod import FakePigpioDaemon, Pulse
+from stage.motor import coil
+from stage.motor import drive
+from stage.motor import profile
+from stage.motor.timing import SleepTimer
+from stage.motor.wave import WaveStepperMotor
+from stage.stage import Stage
+
+PINS = (26, 19, 13, 6)
+END_STOP_PIN = 22
+
+
+def expected_pulses(table, cycles, delay_us):
+    bits = [1 << pin for pin in PINS]
+    pulses = []
+    for _ in range(cycles):
+        for mask, dwell in table:
+            on = sum(bit for index, bit in enumerate(bits) if mask >> index & 1)
+            pulses.append(Pulse(on, sum(bits) & ~on, delay_us * dwell))
+    return pulses
+
+
+class BuildChainTestGroup(unittest.TestCase):
+
+    def test_single_waves_sent_once(self):
+        self.assertEqual(wave.build_chain([(3, 1), (4, 1)]), bytes((3, 4)))
+
+    def test_repeated_wave_looped(self):
+        self.assertEqual(
+            wave.build_chain([(1, 1), (2, 300)]),
+            bytes((1, 255, 0, 2, 255, 1, 44, 1)))
+
+    def test_long_repeats_split_into_several_loops(self):
+        self.assertEqual(
+            wave.build_chain([(5, wave.MAX_LOOP_COUNT + 1)]),
+            bytes((255, 0, 5, 255, 1, 255, 255, 5)))
+
+
+class WaveGpioTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpioDaemon().start()
+        self.addCleanup(self.daemon.close)
+        self.pi = wave.PigpioConnection(*self.daemon.address)
+        self.addCleanup(self.pi.close)
+        self.group = wave.OutputGroup(
+            *(wave.OutputChannel(pin, pi=self.pi) for pin in PINS))
+
+    def test_outputs_configured_low(self):
+        for pin in PINS:
+            self.assertEqual(self.daemon.mode(pin), wave.OUTPUT)
+            self.assertFalse(self.daemon.level(pin))
+
+    def test_group_write_sets_levels(self):
+        self.group.write(0b0101)
+        self.assertEqual(
+            [self.daemon.level(pin) for pin in PINS],
+            [True, False, True, False])
+        self.group.write(0b0011)
+        self.assertEqual(
+            [self.daemon.level(pin) for pin in PINS],
+            [True, True, False, False])
+
+    def test_transmit_sends_each_cycle_in_order(self):
+        table = drive.compile_scheme(drive.HalfStepDriveScheme).forward
+        cycle = tuple((mask, 100 * dwell) for mask, dwell in table)
+        self.group.transmit([cycle] * 3)
+        while self.group.busy():
+            time.sleep(0.001)
+        self.assertEqual(
+            self.daemon.transmissions, [expected_pulses(table, 3, 100)])
+        self.assertEqual(
+            [self.daemon.level(pin) for pin in PINS],
+            [False, False, False, True])
+
+    def test_transmit_loops_repeated_cycles(self):
+        cycle = ((0b0001, 10), (0b0010, 10))
+        self.group.transmit([cycle] * 1000)
+        self.group.halt()
+        self.assertEqual(len(self.daemon.transmissions[0]), 2000)
+
+    def test_transmit_rejected_if_chain_too_big(self):
+        cycles = [((0b0001, 10 + cycle),) for cycle in range(600)]
+        cycles = [cycle for cycle in cycles for _ in range(2)]
+        with self.assertRaises(error.GpioError):
+            self.group.transmit(cycles)
+
+    def test_prepared_chain_starts_after_chain_before_it(self):
+        table = drive.compile_scheme(drive.HalfStepDriveScheme).forward
+        cycle = tuple((mask, 100 * dwell) for mask, dwell in table)
+        self.group.transmit([cycle] * 2)
+        prepared = self.group.prepare([cycle] * 3)
+        while self.group.busy():
+            time.sleep(0.001)
+        self.group.start(prepared)
+        while self.group.busy():
+            time.sleep(0.001)
+        self.assertEqual(
+            self.daemon.transmissions,
+            [expected_pulses(table, 2, 100), expected_pulses(table, 3, 100)])
+
+    def test_prepare_rejected_if_waves_held_need_too_many_control_blocks(
+            self):
+        # every pulse sets, clears and delays so needs three control blocks
+        cycles = [((0b0001, 10 + cycle),) for cycle in range(4000)]
+        held = self.group.prepare(cycles)
+        with self.assertRaises(error.GpioError):
+            self.group.prepare(cycles * 2)
+        # the waves already held are kept and can still be transmitted
+        self.group.start(held)
+        self.group.halt()
+        self.assertEqual(len(self.daemon.transmissions), 1)
+
+    def test_daemon_rejects_waves_over_control_block_budget(self):
+        pulse = wave._PULSE.pack(1 << PINS[0], 1 << PINS[1], 10)
+        per_wave = wave.control_blocks([(1, 1, 10)] * 4000)
+        for _ in range(wave.MAX_CONTROL_BLOCKS // per_wave):
+            self.pi.command(wave.WVAG, ext=pulse * 4000)
+            self.pi.command(wave.WVCRE)
+        self.pi.command(wave.WVAG, ext=pulse * 4000)
+        with self.assertRaisesRegex(
+                error.GpioError, str(fakepigpiod.PI_TOO_MANY_CBS)):
+            self.pi.command(wave.WVCRE)
+
+    def test_daemon_rejects_pulses_on_inputs(self):
+        wave.InputChannel(END_STOP_PIN, True, pi=self.pi).close()
+        with self.assertRaises(error.GpioError):
+            self.pi.command(
+                wave.WVAG, ext=wave._PULSE.pack(1 << END_STOP_PIN, 0, 10))
+
+    def test_input_notifies_active_edge(self):
+        channel = wave.InputChannel(END_STOP_PIN, True, pi=self.pi)
+        self.addCleanup(channel.close)
+        triggered = threading.Event()
+        ticks = []
+
+        def callback(pin, tick):
+            ticks.append((pin, tick))
+            triggered.set()
+
+        channel.register_callback(callback)
+        self.assertFalse(channel.state)
+        self.daemon.set_input(END_STOP_PIN, False)
+        self.assertTrue(triggered.wait(1))
+        self.assertTrue(channel.state)
+        self.assertEqual(ticks[0][0], END_STOP_PIN)
+        self.assertLessEqual(ticks[0][1], self.daemon.tick())
+
+
+class WaveStepperMotorTestGroup(unittest.TestCase):
+    RATE = 5000
+
+    def setUp(self):
+        self.daemon = FakePigpioDaemon().start()
+        self.addCleanup(self.daemon.close)
+        self.pi = wave.PigpioConnection(*self.daemon.address)
+        self.addCleanup(self.pi.close)
+        self.motor = WaveStepperMotor(
+            coil.Coils(wave.OutputGroup(
+                *(wave.OutputChannel(pin, pi=self.pi) for pin in PINS))),
+            profile=profile.ConstantProfile(self.RATE),
+            timer=SleepTimer())
+        self.table = drive.compile_scheme(drive.HalfStepDriveScheme)
+
+    def test_forward_transmits_whole_move(self):
+        self.assertEqual(self.motor.forward(5), 5)
+        self.assertEqual(
+            self.daemon.transmissions,
+            [expected_pulses(self.table.forward, 5, 1e6 / self.RATE)])
+        self.assertEqual(self.motor.phase, len(self.table.forward) - 1)
+
+    def test_backward_transmits_reversed_sequence(self):
+        self.assertEqual(self.motor.backward(2), 2)
+        self.assertEqual(
+            self.daemon.transmissions,
+            [expected_pulses(self.table.backward, 2, 1e6 / self.RATE)])
+
+    def test_long_move_transmitted_in_chunks(self):
+        self.assertEqual(self.motor.forward(200), 200)
+        transmissions = self.daemon.transmissions
+        self.assertGreater(len(transmissions), 1)
+        self.assertEqual(
+            [pulse for pulses in transmissions for pulse in pulses],
+            expected_pulses(self.table.forward, 200, 1e6 / self.RATE))
+
+    def test_stop_brakes_to_start_rate(self):
+        self.motor.profile = profile.TrapezoidalProfile(2000, 5000, 50000)
+        stop = threading.Event()
+        cycles = []
+
+        def stop_at_cruise():
+            cycles.append(None)
+            if len(cycles) == 40:
+                stop.set()
+
+        done = self.motor.forward(1000, stop=stop, on_cycle=stop_at_cruise)
+        self.assertGreater(done, 40)
+        self.assertLess(done, 1000)
+        self.assertEqual(self.motor.phase, len(self.table.forward) - 1)
+        delays = [
+            pulse.delay
+            for pulses in self.daemon.transmissions for pulse in pulses]
+        self.assertEqual(len(delays), done * len(self.table.forward))
+        braking = delays[delays.index(min(delays[40 * 8:]), 40 * 8):]
+        self.assertEqual(braking, sorted(braking))
+        self.assertAlmostEqual(braking[-1], 1e6 / 2000, delta=20)
+
+    def test_on_cycle_called_per_cycle(self):
+        cycles = []
+        self.motor.forward(4, on_cycle=lambda: cycles.append(None))
+        self.assertEqual(len(cycles), 4)
+
+    def test_stop_ends_on_cycle_boundary(self):
+        stop = threading.Event()
+        done = self.motor.forward(1000, stop=stop, on_cycle=stop.set)
+        self.assertEqual(done, 1)
+        self.assertFalse(self.motor._coils.group.busy())
+        self.assertEqual(self.motor.phase, len(self.table.forward) - 1)
+
+    def test_halt_ends_move_early(self):
+        halt = threading.Event()
+
+        def halt_once_transmitting():
+            deadline = time.monotonic() + 5
+            while not self.daemon.transmissions \
+                    and time.monotonic() < deadline:
+                time.sleep(0.001)
+            time.sleep(0.02)
+            halt.set()
+
+        threading.Thread(target=halt_once_transmitting).start()
+        done = self.motor.backward(1000, halt=halt)
+        self.assertLess(done, 1000)
+        self.assertFalse(self.motor._coils.group.busy())
+        self.assertIsNotNone(self.motor.phase)
+
+
+class WaveStageTestGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakePigpioDaemon().start()
+        self.addCleanup(self.daemon.close)
+        config = Configurator(
+            motor_pins=PINS,
+            end_stop_pin=END_STOP_PIN,
+            end_stop_active_low=True,
+            maximum_position=20,
+            minimum_position=0)
+        self.factory = WaveStageFactory(config, *self.daemon.address)
+        self.factory.motor.profile = profile.ConstantProfile(2000)
+        self.addCleanup(self.factory.gpio.close)
+
+    def _switch_end_stop(self):
+        # trigger the end stop part way through each backward transmission
+        # and release it once the stage backs off
+        seen = 0
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and seen < 3:
+            count = len(self.daemon.transmissions)
+            if count > seen:
+                seen = count
+                if seen == 2:
+                    self.daemon.set_input(END_STOP_PIN, True)
+                else:
+                    time.sleep(0.01)
+                    self.daemon.set_input(END_STOP_PIN, False)
+            time.sleep(0.001)
+
+    def test_stage_homes_and_moves(self):
+        switch = threading.Thread(target=self._switch_end_stop)
+        switch.start()
+        stage = Stage(self.factory)
+        switch.join()
+        self.assertEqual(stage.position, 0)
+        self.assertGreater(stage.homing.fast_cycles, 0)
+        stage.position = 3
+        self.assertEqual(stage.position, 3)
+        self.assertEqual(
+            self.daemon.transmissions[-1],
+            expected_pulses(
+                drive.compile_scheme(drive.HalfStepDriveScheme).forward,
+                3, 500))